@@ -0,0 +1,203 @@
+"""
+Operator endpoints, guarded by `ADMIN_API_KEY` in the `X-Admin-Key` header.
+"""
+import hmac
+import logging
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from app import tracing
+from app.key_store import KeyStore, app_key_store
+from app.api_keys import key_prefix
+from app.response_codes import ErrorCodeEnum
+from app.schema import NewKey
+from app.usage_rollup import usage_report
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+async def verify_admin_key(request: Request, x_admin_key: str = Header(None)) -> bool:
+    """
+    Check the admin key against the `ADMIN_API_KEY` of the app's settings.
+
+    Raises:
+        HTTPException: with 401 if the key is missing or wrong, or if no admin
+                       key is configured.
+
+    Returns:
+        True if the key is right.
+    """
+    admin_api_key = request.app.state.settings.ADMIN_API_KEY
+    if (admin_api_key and x_admin_key
+            and hmac.compare_digest(x_admin_key.encode(), admin_api_key.encode())):
+        return True
+    logger.warning("[verify_admin_key] rejected admin request")
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail={
+            "data": None,
+            "message": "Unauthorized Access. Thanks for using TRU National ID Service",
+            "code": ErrorCodeEnum.UNAUTHORIZED.value,
+        },
+    )
+
+
+def _service_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail={
+            "data": None,
+            "message": "Service temporarily unavailable. Please try again later.",
+            "code": ErrorCodeEnum.SERVICE_UNAVAILABLE.value,
+        },
+    )
+
+
+def _key_not_found(prefix: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail={
+            "data": None,
+            "message": f"No active API key with prefix {prefix}",
+            "code": ErrorCodeEnum.NOT_FOUND.value,
+        },
+    )
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(verify_admin_key)])
+
+
+@router.get("/traces")
+async def recent_traces(
+    trace_id: str | None = None,
+    min_duration_ms: float = Query(0.0, ge=0),
+    limit: int = Query(20, ge=1, le=500),
+):
+    """
+    Recent traces of this worker in the OTLP/JSON format.
+
+    Args:
+        trace_id (str | None): only this trace.
+        min_duration_ms (float): only traces of requests at least this slow.
+        limit (int): maximum number of traces.
+
+    Returns:
+        JSONResponse: an OTLP `ExportTraceServiceRequest` body.
+    """
+    spans = tracing.STORE.traces(
+        trace_id=trace_id, min_duration_ms=min_duration_ms, limit=limit)
+    return JSONResponse(status_code=status.HTTP_200_OK, content=tracing.to_otlp_json(spans))
+
+
+@router.get("/usage")
+async def company_usage(
+    request: Request,
+    company_name: str,
+    start: datetime,
+    end: datetime,
+    key_store: KeyStore = Depends(app_key_store),
+):
+    """
+    Hourly uses of a company, for billing.
+
+    Args:
+        company_name (str): company of the report.
+        start (datetime): first hour of the period, ISO 8601.
+        end (datetime): end of the period, its hour is excluded.
+
+    Raises:
+        HTTPException: with 422 if `end` is not after `start`, with 503 if the
+                       rollup cannot be read.
+
+    Returns:
+        JSONResponse: the report of `usage_report`.
+    """
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "data": None,
+                "message": "end must be after start",
+                "code": ErrorCodeEnum.PARSING_ERROR.value,
+            },
+        )
+    try:
+        report = await usage_report(key_store.db_manager, company_name, start, end,
+                                    settle_seconds=request.app.state.settings.USAGE_REPORT_SETTLE_SECONDS)
+    except (OperationalError, DBAPIError) as db_error:
+        logger.error("[company_usage] failed to read the usage rollup: %s", db_error)
+        raise _service_unavailable() from db_error
+    return JSONResponse(status_code=status.HTTP_200_OK, content=report)
+
+
+def _issued_key(company_name: str, api_key: str) -> dict:
+    return {"company_name": company_name, "key_prefix": key_prefix(api_key), "api_key": api_key}
+
+
+@router.post("/keys", status_code=status.HTTP_201_CREATED)
+async def create_key(new_key: NewKey, key_store: KeyStore = Depends(app_key_store)):
+    """
+    Issue an API key to a company.
+
+    Returns:
+        JSONResponse: the company, the key prefix and the key, which is only
+                      shown this once.
+    """
+    try:
+        api_key = await key_store.create_key(new_key.company_name)
+    except (OperationalError, DBAPIError) as db_error:
+        logger.error("[create_key] failed to store the key: %s", db_error)
+        raise _service_unavailable() from db_error
+    logger.info("[create_key] issued key %s to %s", key_prefix(api_key), new_key.company_name)
+    return JSONResponse(status_code=status.HTTP_201_CREATED,
+                        content=_issued_key(new_key.company_name, api_key))
+
+
+@router.post("/keys/{prefix}/rotate")
+async def rotate_key(prefix: str, key_store: KeyStore = Depends(app_key_store)):
+    """
+    Replace an active key by a new one, the old one stops working at once on
+    this worker and at the next key reload on the others.
+
+    Raises:
+        HTTPException: with 404 if no active key has this prefix.
+
+    Returns:
+        JSONResponse: the company, the new key prefix and the new key.
+    """
+    try:
+        api_key = await key_store.rotate_key(prefix)
+    except (OperationalError, DBAPIError) as db_error:
+        logger.error("[rotate_key] failed to rotate %s: %s", prefix, db_error)
+        raise _service_unavailable() from db_error
+    if not api_key:
+        raise _key_not_found(prefix)
+    logger.info("[rotate_key] rotated key %s to %s", prefix, key_prefix(api_key))
+    company_name = key_store.keys.get(key_prefix(api_key)).company_name
+    return JSONResponse(status_code=status.HTTP_200_OK,
+                        content=_issued_key(company_name, api_key))
+
+
+@router.delete("/keys/{prefix}")
+async def revoke_key(prefix: str, key_store: KeyStore = Depends(app_key_store)):
+    """
+    Revoke an active key, its usage counts are kept.
+
+    Raises:
+        HTTPException: with 404 if no active key has this prefix.
+
+    Returns:
+        JSONResponse: the revoked prefix.
+    """
+    try:
+        revoked = await key_store.revoke_key(prefix)
+    except (OperationalError, DBAPIError) as db_error:
+        logger.error("[revoke_key] failed to revoke %s: %s", prefix, db_error)
+        raise _service_unavailable() from db_error
+    if not revoked:
+        raise _key_not_found(prefix)
+    logger.info("[revoke_key] revoked key %s", prefix)
+    return JSONResponse(status_code=status.HTTP_200_OK, content={"key_prefix": prefix, "revoked": True})
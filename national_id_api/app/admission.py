@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics, tracing
+from app.response_codes import ErrorCodeEnum
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER: bytes = b"x-request-timeout-ms"
+
+
+class AdmissionController:
+    """
+    Caps the number of in-flight requests of one worker.
+
+    Requests above `max_in_flight` wait in a bounded FIFO queue until a slot is
+    released or their deadline passes. Requests that find the queue full are
+    shed immediately.
+
+    Args:
+        max_in_flight (int): requests allowed to run concurrently.
+        max_queue (int): requests allowed to wait for a slot.
+        queue_timeout (float): longest time in seconds a request may wait.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight: int = 0
+        self.admitted: int = 0
+        self.shed_queue_full: int = 0
+        self.shed_queue_timeout: int = 0
+        self.shed_deadline_exceeded: int = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, deadline: float | None = None) -> bool:
+        """
+        Wait for an execution slot.
+
+        Args:
+            deadline (float | None): `time.monotonic()` value after which the
+                client is no longer interested in the answer.
+
+        Returns:
+            bool: `True` if a slot was acquired, `False` if the request was shed.
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            metrics.ADMISSION_SHED_QUEUE_FULL.inc()
+            return False
+
+        wait_until = time.monotonic() + self.queue_timeout
+        client_gave_up_first = deadline is not None and deadline < wait_until
+        if client_gave_up_first:
+            wait_until = deadline
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        granted = False
+        try:
+            await asyncio.wait_for(waiter, timeout=max(wait_until - time.monotonic(), 0))
+            granted = True
+        except asyncio.TimeoutError:
+            if client_gave_up_first:
+                self.record_deadline_exceeded()
+            else:
+                self.shed_queue_timeout += 1
+                metrics.ADMISSION_SHED_QUEUE_TIMEOUT.inc()
+        finally:
+            if not granted:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # the slot was handed over just as we gave up, pass it on.
+                    self.release()
+
+        if granted:
+            # `release` handed its slot over, `in_flight` is already counted.
+            self.admitted += 1
+        return granted
+
+    def release(self) -> None:
+        """Hand the slot to the oldest live waiter, or free it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def record_deadline_exceeded(self) -> None:
+        """Count a request dropped because the client budget ran out."""
+        self.shed_deadline_exceeded += 1
+        metrics.ADMISSION_SHED_DEADLINE.inc()
+
+    def snapshot(self) -> dict[str, int]:
+        """Current counters, used by the stats endpoint."""
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_queue_timeout": self.shed_queue_timeout,
+            "shed_deadline_exceeded": self.shed_deadline_exceeded,
+        }
+
+
+def _client_deadline(scope: Scope, arrived_at: float) -> float | None:
+    """Read the client time budget header as an absolute monotonic deadline."""
+    for name, value in scope.get("headers", ()):
+        if name == DEADLINE_HEADER:
+            try:
+                return arrived_at + float(value) / 1000
+            except ValueError:
+                return None
+    return None
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware that sheds load before any work is done for a request.
+
+    Shed requests get a 503 with `SERVICE_UNAVAILABLE` and a `Retry-After`
+    header. A client may send `X-Request-Timeout-Ms` with its remaining time
+    budget; the request is dropped when that budget runs out, whether it is
+    still queued or already running and has not started responding.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        controller: AdmissionController,
+        retry_after: int = 1,
+        exempt_paths: tuple[str, ...] = (),
+    ):
+        self.app = app
+        self.controller = controller
+        self.retry_after = retry_after
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        arrived_at = time.monotonic()
+        deadline = _client_deadline(scope, arrived_at)
+        if deadline is not None and deadline <= arrived_at:
+            self.controller.record_deadline_exceeded()
+            await self._shed(scope, receive, send)
+            return
+
+        with tracing.span("admission.queue"):
+            admitted = await self.controller.acquire(deadline)
+        if not admitted:
+            logger.warning("[admission] request shed, queue depth %s",
+                           self.controller.queue_depth)
+            await self._shed(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            if deadline is None:
+                await self.app(scope, receive, send_wrapper)
+                return
+            client_timeout = asyncio.timeout(deadline - time.monotonic())
+            try:
+                async with client_timeout:
+                    await self.app(scope, receive, send_wrapper)
+            except TimeoutError:
+                if not client_timeout.expired():
+                    raise
+                self.controller.record_deadline_exceeded()
+                if not response_started:
+                    await self._shed(scope, receive, send)
+        finally:
+            self.controller.release()
+
+    async def _shed(self, scope: Scope, receive: Receive, send: Send) -> None:
+        metrics.count_response(ErrorCodeEnum.SERVICE_UNAVAILABLE.value)
+        response = JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={
+                "data": None,
+                "message": "Service is overloaded. Please try again later.",
+                "code": ErrorCodeEnum.SERVICE_UNAVAILABLE.value,
+            },
+            headers={"Retry-After": str(self.retry_after)},
+        )
+        await response(scope, receive, send)
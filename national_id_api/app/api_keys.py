@@ -0,0 +1,117 @@
+"""
+API key format, hashing and the in-memory index used to verify keys.
+
+Keys are issued as `<prefix>.<secret>`, the 8 hex digit prefix is not secret
+and identifies the key in the database, the admin API and the logs. Only the
+prefix, a random salt and `sha256(salt + key)` are stored. A fast hash is
+enough because the keys are random, not chosen by people.
+
+Keys issued before this format (e.g. the seeded `test` key) have no prefix,
+theirs is derived from the key's SHA-256 and is 12 hex digits long, so it never
+collides with an issued one.
+
+`KeyIndex` maps the prefixes of the active keys to their row id, company, salt
+and hash: verifying a key is one dict lookup and one hash. It also remembers,
+for `MISSING_KEY_SECONDS`, up to `MAX_MISSING_KEYS` prefixes the database did
+not have, so repeated unknown or garbage keys are not looked up every time.
+"""
+import hashlib
+import hmac
+import re
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple
+
+PREFIX_LENGTH: int = 8
+LEGACY_PREFIX_LENGTH: int = 12
+MISSING_KEY_SECONDS: float = 5.0
+MAX_MISSING_KEYS: int = 10_000
+_ISSUED_KEY = re.compile(rf"^[0-9a-f]{{{PREFIX_LENGTH}}}\.")
+
+
+class KeyEntry(NamedTuple):
+    key_id: uuid.UUID
+    company_name: str
+    salt: str
+    key_hash: str
+
+
+def generate_key() -> str:
+    """A new random key, `<prefix>.<secret>`."""
+    return f"{secrets.token_hex(PREFIX_LENGTH // 2)}.{secrets.token_urlsafe(24)}"
+
+
+def key_prefix(api_key: str) -> str:
+    """The non-secret prefix identifying a key."""
+    if _ISSUED_KEY.match(api_key):
+        return api_key[:PREFIX_LENGTH]
+    return hashlib.sha256(api_key.encode()).hexdigest()[:LEGACY_PREFIX_LENGTH]
+
+
+def hash_key(api_key: str, salt: str) -> str:
+    return hashlib.sha256(salt.encode() + api_key.encode()).hexdigest()
+
+
+def new_entry(company_name: str, api_key: str) -> KeyEntry:
+    """The stored form of a new key, with a fresh id and salt."""
+    salt = secrets.token_hex(16)
+    return KeyEntry(key_id=uuid.uuid4(), company_name=company_name, salt=salt,
+                    key_hash=hash_key(api_key, salt))
+
+
+def matches(entry: KeyEntry, api_key: str) -> bool:
+    return hmac.compare_digest(entry.key_hash, hash_key(api_key, entry.salt))
+
+
+class KeyIndex:
+    """ active keys by prefix, and recently looked up prefixes with no key.
+
+    Args:
+        missing_seconds (float): time a prefix is remembered as missing.
+        max_missing (int): missing prefixes remembered, the oldest are dropped.
+    """
+
+    def __init__(self, missing_seconds: float = MISSING_KEY_SECONDS,
+                 max_missing: int = MAX_MISSING_KEYS):
+        self._entries: dict[str, KeyEntry] = {}
+        self._missing: OrderedDict[str, float] = OrderedDict()
+        self.missing_seconds = missing_seconds
+        self.max_missing = max_missing
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, prefix: str) -> bool:
+        return prefix in self._entries
+
+    def replace(self, entries: dict[str, KeyEntry]) -> None:
+        self._entries = entries
+        self._missing.clear()
+
+    def get(self, prefix: str) -> KeyEntry | None:
+        return self._entries.get(prefix)
+
+    def add(self, prefix: str, entry: KeyEntry) -> None:
+        self._entries[prefix] = entry
+        self._missing.pop(prefix, None)
+
+    def remove(self, prefix: str) -> None:
+        self._entries.pop(prefix, None)
+
+    def is_missing(self, prefix: str) -> bool:
+        """Whether the database had no key with this prefix a moment ago."""
+        missing_at = self._missing.get(prefix)
+        if missing_at is None:
+            return False
+        if time.monotonic() - missing_at < self.missing_seconds:
+            return True
+        del self._missing[prefix]
+        return False
+
+    def add_missing(self, prefix: str) -> None:
+        self._missing[prefix] = time.monotonic()
+        self._missing.move_to_end(prefix)
+        if len(self._missing) > self.max_missing:
+            self._missing.popitem(last=False)
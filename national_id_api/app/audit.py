@@ -0,0 +1,228 @@
+"""
+Audit log of validation requests, for compliance.
+
+Each `/validate-id`, `/validate-ids` and `/extract-ids` request, and each
+frame of `/ws/validate-id` (see app/streaming.py), leaves one record: when it
+came in, the non-secret prefix of its API key (see app/api_keys.py), the
+endpoint, the outcome `code` and the latency. Neither the key nor the national
+ID is recorded.
+
+`AuditMiddleware` only appends a tuple to the in-memory `AuditLog` buffer. A
+background task started in `lifespan` writes the buffer with asyncpg `COPY`
+into `RequestAudit`, a table partitioned by day, every `AUDIT_FLUSH_SECONDS` or
+as soon as `AUDIT_FLUSH_BATCH` records are waiting. Requests never wait for
+the audit log: when the buffer holds `AUDIT_BUFFER_SIZE` records, new records
+are dropped and counted in `national_id_audit_records{outcome="dropped"}`.
+The same task creates the coming partitions and drops the ones older than
+`AUDIT_RETENTION_DAYS` every `AUDIT_MAINTENANCE_SECONDS`.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+from app.api_keys import key_prefix
+from app.database_settings import DatabaseManager
+from app.models import REQUEST_AUDIT
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+AUDIT_COLUMNS: tuple[str, ...] = ("requested_at", "key_prefix", "endpoint", "code", "latency_ms")
+_PARTITION_NAME = re.compile(rf"^{REQUEST_AUDIT.name}_p(\d{{8}})$")
+
+# (requested_at, key_prefix, endpoint, code, latency_ms).
+AuditRecord = tuple[datetime, str | None, str, str, float]
+
+
+def partition_name(day: date) -> str:
+    return f"{REQUEST_AUDIT.name}_p{day:%Y%m%d}"
+
+
+class AuditLog:
+    """
+    Buffer of audit records and the task writing them.
+
+    Args:
+        db_manager (DatabaseManager): Postgres database holding `RequestAudit`.
+        buffer_size (int): records kept in memory before new ones are dropped.
+        flush_batch (int): waiting records that trigger a write.
+        flush_seconds (float): longest time a record waits to be written.
+        retention_days (int): days of partitions kept.
+        maintenance_seconds (float): time between partition maintenance runs.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, buffer_size: int = 100_000,
+                 flush_batch: int = 5_000, flush_seconds: float = 1.0,
+                 retention_days: int = 90, maintenance_seconds: float = 3600.0):
+        self.db_manager = db_manager
+        self.buffer_size = buffer_size
+        self.flush_batch = flush_batch
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self.maintenance_seconds = maintenance_seconds
+        self._buffer: deque[AuditRecord] = deque()
+        self._batch_ready = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._stopping = False
+        self._dropped = metrics.register_buffer(
+            metrics.BufferedCounter(metrics.AUDIT_RECORDS.labels("dropped")))
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def record(self, record: AuditRecord) -> None:
+        """Queue a record, drop it if the buffer is full. Never blocks."""
+        if len(self._buffer) >= self.buffer_size:
+            self._dropped.inc()
+            return
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_batch:
+            self._batch_ready.set()
+
+    def start(self) -> None:
+        if self._writer is None:
+            self._stopping = False
+            self._writer = asyncio.create_task(self._write_periodically())
+
+    async def close(self) -> None:
+        """
+        Stop the task once its current write is done, rather than cancelling
+        it with a batch taken out of the buffer, and write what is still buffered.
+        """
+        if self._writer is not None:
+            self._stopping = True
+            self._batch_ready.set()
+            await self._writer
+            self._writer = None
+        while self._buffer and await self.flush():
+            pass
+
+    async def flush(self) -> int:
+        """
+        Write up to `flush_batch` buffered records. Records of a failed write
+        are put back at the front of the buffer.
+
+        Returns:
+            int: number of records written.
+        """
+        batch = [self._buffer.popleft() for _ in range(min(self.flush_batch, len(self._buffer)))]
+        if not batch:
+            return 0
+        try:
+            await self.write(batch)
+        except Exception as error:
+            logger.error("[AuditLog] failed to write %s audit records: %s", len(batch), error)
+            # the oldest records are dropped if the buffer filled up meanwhile.
+            room = max(self.buffer_size - len(self._buffer), 0)
+            kept = batch[len(batch) - min(room, len(batch)):]
+            self._buffer.extendleft(reversed(kept))
+            if len(kept) < len(batch):
+                metrics.AUDIT_RECORDS.labels("dropped").inc(len(batch) - len(kept))
+            return 0
+        metrics.AUDIT_RECORDS.labels("written").inc(len(batch))
+        return len(batch)
+
+    async def write(self, batch: list[AuditRecord]) -> None:
+        """COPY one batch into `RequestAudit`."""
+        async with self.db_manager.session() as session:
+            connection = await session.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                REQUEST_AUDIT.name, records=batch, columns=AUDIT_COLUMNS)
+            await session.commit()
+
+    async def maintain_partitions(self, today: date | None = None) -> None:
+        """Create the partitions of today and the next two days, drop the expired ones."""
+        today = today or datetime.now(timezone.utc).date()
+        expired_before = today - timedelta(days=self.retention_days)
+        async with self.db_manager.session() as session:
+            for offset in range(3):
+                day = today + timedelta(days=offset)
+                await session.execute(sa.text(
+                    f'CREATE TABLE IF NOT EXISTS "{partition_name(day)}" '
+                    f'PARTITION OF "{REQUEST_AUDIT.name}" '
+                    f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+                ))
+            partitions = (await session.execute(
+                sa.text(
+                    "SELECT child.relname FROM pg_inherits "
+                    "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                    "WHERE parent.relname = :parent"
+                ),
+                {"parent": REQUEST_AUDIT.name},
+            )).all()
+            for (name,) in partitions:
+                match = _PARTITION_NAME.match(name)
+                if match and datetime.strptime(match.group(1), "%Y%m%d").date() < expired_before:
+                    await session.execute(sa.text(f'DROP TABLE IF EXISTS "{name}"'))
+                    logger.info("[AuditLog] dropped expired partition %s", name)
+            await session.commit()
+
+    async def _write_periodically(self) -> None:
+        maintained_at = float("-inf")
+        while not self._stopping:
+            if time.monotonic() - maintained_at >= self.maintenance_seconds:
+                try:
+                    await self.maintain_partitions()
+                    maintained_at = time.monotonic()
+                except Exception as error:
+                    logger.error("[AuditLog] partition maintenance failed: %s", error)
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            while not self._stopping and await self.flush() == self.flush_batch:
+                pass
+
+
+class AuditMiddleware:
+    """
+    ASGI middleware adding one `AuditLog` record per HTTP request to the given
+    paths. WebSocket frames are recorded by their handler.
+
+    Endpoints and exception handlers put the response `code` in
+    `request.state.outcome`; responses without one, e.g. shed by admission
+    control, are recorded as `HTTP_<status>`.
+    """
+
+    def __init__(self, app: ASGIApp, audit_log: AuditLog,
+                 paths: tuple[str, ...] = ("/validate-id", "/validate-ids", "/extract-ids")):
+        self.app = app
+        self.audit_log = audit_log
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        requested_at = datetime.now(timezone.utc)
+        started_at = time.perf_counter()
+        state = scope.setdefault("state", {})
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            api_key = next((value.decode("latin-1") for name, value in scope["headers"]
+                            if name == b"x-api-key"), None)
+            self.audit_log.record((
+                requested_at,
+                key_prefix(api_key) if api_key else None,
+                scope["path"],
+                state.get("outcome") or f"HTTP_{status_code}",
+                (time.perf_counter() - started_at) * 1000,
+            ))
@@ -0,0 +1,198 @@
+"""
+Response compression negotiated from `Accept-Encoding`.
+
+Batch and extraction results repeat the same governorate, gender and month
+names and messages on every row and compress 10-20x. `CompressionMiddleware`
+compresses them with zstd or gzip, whichever the client prefers (zstd on a
+tie), chunk by chunk as the response is sent: every chunk is flushed so that
+streamed results reach the client as they are produced.
+
+* Responses sent in one piece smaller than `minimum_size` bytes, e.g. single
+  ID results, are sent as they are.
+* Chunks of `thread_min_size` bytes or more are compressed in a thread, zlib
+  and zstd release the GIL, so the event loop keeps serving meanwhile.
+* Responses that already have a `Content-Encoding`, whose type is not in
+  `content_types`, or whose path is in `exempt_paths` (Prometheus scrapes of
+  `/metrics`) are not touched.
+
+Every response on a path that is not exempt carries `Vary: Accept-Encoding`,
+compressed or not (small, other types, no accepted encoding), so that caches
+never serve a compressed copy to a client that did not ask for one or the
+other way round. Responses with their own `Content-Encoding` are left alone.
+"""
+import asyncio
+import zlib
+
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+COMPRESSIBLE_TYPES: tuple[str, ...] = (
+    "application/json", "application/x-ndjson", "application/msgpack", "text/",
+)
+
+
+class GzipEncoder:
+    """ gzip stream, each chunk ends with a sync flush.
+    """
+
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        # wbits 16 + 15: zlib deflate in a gzip container.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        compressed = self._compressor.compress(data)
+        return compressed + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class ZstdEncoder:
+    """ zstd frame, each chunk ends a block.
+    """
+
+    encoding = "zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        compressed = self._compressor.compress(data)
+        return compressed + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+ENCODINGS: tuple[str, ...] = ("zstd", "gzip")
+
+
+def negotiate(accept_encoding: str, available: tuple[str, ...] = ENCODINGS) -> str | None:
+    """
+    The encoding to use for an `Accept-Encoding` header.
+
+    Args:
+        accept_encoding (str): the header, e.g. `gzip;q=0.8, zstd`.
+        available (tuple[str, ...]): supported encodings, preferred first.
+
+    Returns:
+        str | None: the accepted encoding with the highest weight, `None` if
+                    the client accepts none of them.
+    """
+    weights: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, parameters = item.partition(";")
+        weight = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        if name := name.strip():
+            weights[name] = weight
+    default = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def _vary(start: Message) -> Message:
+    """Add `Vary: Accept-Encoding` to a response start unless it is already encoded."""
+    headers = MutableHeaders(scope=start)
+    if "content-encoding" not in headers:
+        headers.add_vary_header("Accept-Encoding")
+    return start
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses, see the module docstring.
+
+    Args:
+        app (ASGIApp): the wrapped app.
+        minimum_size (int): smallest single-piece response compressed, in bytes.
+        gzip_level (int): zlib level, 1 (fast) to 9.
+        zstd_level (int): zstd level, 1 (fast) to 22.
+        thread_min_size (int): smallest chunk compressed in a thread, in bytes.
+        content_types (tuple[str, ...]): compressed media types or prefixes.
+        exempt_paths (tuple[str, ...]): paths never compressed.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6,
+                 zstd_level: int = 3, thread_min_size: int = 256 * 1024,
+                 content_types: tuple[str, ...] = COMPRESSIBLE_TYPES,
+                 exempt_paths: tuple[str, ...] = ()):
+        self.app = app
+        self.exempt_paths = exempt_paths
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "zstd": zstd_level}
+        self.thread_min_size = thread_min_size
+        self.content_types = content_types
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            async def send_uncompressed(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    _vary(message)
+                await send(message)
+
+            await self.app(scope, receive, send_uncompressed)
+            return
+
+        start: Message | None = None
+        encoder: GzipEncoder | ZstdEncoder | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                elif not content_type.startswith(self.content_types):
+                    passthrough = True
+                    await send(_vary(message))
+                else:
+                    start = _vary(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = (ZstdEncoder if encoding == "zstd" else GzipEncoder)(self.levels[encoding])
+                headers = MutableHeaders(raw=start["headers"])
+                headers["content-encoding"] = encoding
+                del headers["content-length"]
+                compressed = await self._compress(encoder, body, not more_body)
+                if not more_body:
+                    headers["content-length"] = str(len(compressed))
+                await send(start)
+            else:
+                compressed = await self._compress(encoder, body, not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    async def _compress(self, encoder: GzipEncoder | ZstdEncoder, data: bytes, final: bool) -> bytes:
+        if len(data) >= self.thread_min_size:
+            return await asyncio.to_thread(encoder.compress, data, final)
+        return encoder.compress(data, final)
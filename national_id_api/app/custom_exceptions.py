@@ -7,21 +7,36 @@ from fastapi.exceptions import RequestValidationError
 
 from slowapi.errors import RateLimitExceeded
 
+from app.metrics import count_response
 from app.response_codes import ErrorCodeEnum
+from app.wire import MsgpackResponse, accepts_msgpack, error_row
 
 logger: logging.Logger = logging.getLogger(__name__)
 
 
+def _error_response(request: Request, status_code: int, content: dict) -> JSONResponse | MsgpackResponse:
+    """ the error envelope, or its positional MessagePack form for clients asking for it.
+    """
+    request.state.outcome = content.get("code", ErrorCodeEnum.SOMETHING_WENT_WRONG.value)
+    if accepts_msgpack(request):
+        return MsgpackResponse(error_row(content.get("code", ErrorCodeEnum.SOMETHING_WENT_WRONG.value)), status_code=status_code)
+    return JSONResponse(status_code=status_code, content=content)
+
+
 async def http_exception_handler(request: Request, exc: HTTPException):
     logger.error(f"HTTPException: {exc.detail}")
 
     if isinstance(exc.detail, dict):
-        return JSONResponse(
+        count_response(exc.detail.get("code", ErrorCodeEnum.SOMETHING_WENT_WRONG.value))
+        return _error_response(
+            request,
             status_code=exc.status_code,
             content=exc.detail
         )
 
-    return JSONResponse(
+    count_response(ErrorCodeEnum.SOMETHING_WENT_WRONG.value)
+    return _error_response(
+        request,
         status_code=exc.status_code,
         content={
             "data": None,
@@ -42,7 +57,9 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         _type_: _description_
     """
     logger.error(f"Validation failed: {str(exc.body)}")
-    return JSONResponse(
+    count_response(ErrorCodeEnum.PARSING_ERROR.value)
+    return _error_response(
+        request,
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={
             "data": None,
@@ -53,7 +70,9 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 
 async def custom_rate_limit_handler(request: Request, exc: RateLimitExceeded):
-    return JSONResponse(
+    count_response(ErrorCodeEnum.TOO_MANY_REQUEST.value)
+    return _error_response(
+        request,
         status_code=status.HTTP_429_TOO_MANY_REQUESTS,
         content={
             "data": None,
@@ -1,21 +1,19 @@
 import logging
-from datetime import datetime, timezone
 
 from fastapi import status, HTTPException
 
-import sqlalchemy as sa
 from sqlalchemy.exc import DBAPIError, OperationalError
-from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import APIKeyUsage
+from app.key_store import KeyStore
 from app.response_codes import ErrorCodeEnum
 
 logger: logging.Logger = logging.getLogger(__name__)
 
 
-async def validate_api_key(db_session: AsyncSession, api_key: str) -> bool:
+async def validate_api_key(key_store: KeyStore, api_key: str, count: int = 1) -> bool:
     """
-    Validates an API key and atomically increments its usage count with row level locking.
+    Validates an API key and counts `count` uses of it, see `app/key_store.py`
+    for when the uses are written.
 
     Raises:
         HTTPException: with 401 if the key is invalid,
@@ -25,22 +23,9 @@ async def validate_api_key(db_session: AsyncSession, api_key: str) -> bool:
         True if the key is valid.
     """
     try:
-        query = (
-            sa.select(APIKeyUsage)
-            .where(APIKeyUsage.api_key == api_key)
-            .with_for_update()
-        )
-
-        result = await db_session.execute(query)
-
-        if row := result.scalars().first():
-            row.usage_count += 1
-            row.last_request_at = datetime.now(timezone.utc)
-
-            await db_session.commit()
-
+        if company_name := await key_store.use_key(api_key, count):
             logger.info(
-                "[validate_api_key] (%s) company has used the key", row.company_name)
+                "[validate_api_key] (%s) company has used the key", company_name)
             return True
 
         logger.error("[validate_api_key] : no key found")
@@ -56,7 +41,6 @@ async def validate_api_key(db_session: AsyncSession, api_key: str) -> bool:
     except HTTPException:
         raise
     except (OperationalError, DBAPIError) as db_error:
-        await db_session.rollback()
         logger.error("[validate_api_key] database error: %s", db_error)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -68,7 +52,6 @@ async def validate_api_key(db_session: AsyncSession, api_key: str) -> bool:
         ) from db_error
 
     except Exception as unexpected_error:
-        await db_session.rollback()
         logger.critical(
             "[validate_api_key] unexpected error: %s", unexpected_error)
         raise HTTPException(
@@ -79,3 +62,4 @@ async def validate_api_key(db_session: AsyncSession, api_key: str) -> bool:
                 "code": ErrorCodeEnum.SERVICE_UNAVAILABLE.value,
             },
         ) from unexpected_error
+
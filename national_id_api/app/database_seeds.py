@@ -1,28 +1,22 @@
 import asyncio
-from sqlalchemy.dialects.postgresql import insert
 from app.database_settings import DB_MANAGER
-from app.models import APIKeyUsage
+from app.key_store import get_key_store
 
 
 async def seed_tru_api_key():
-    """Seed 'Tru' API key """
-    DB_MANAGER.initialize()
-    async with DB_MANAGER.session() as session:
-        try:
-            stmt = insert(APIKeyUsage).values(
-                company_name="test",
-                api_key="test",
-                usage_count=0,
-                last_request_at=None,
-            ).on_conflict_do_nothing(index_elements=["api_key"])
-
-            await session.execute(stmt)
-            await session.commit()
-
-            print("[seed_tru_api_key] Tru API key seeded (or already exists).")
-        except Exception as e:
-            await session.rollback()
-            print(f"[seed_tru_api_key]  Seeding failed: {e}")
+    """Seed 'Tru' API key in the configured key store."""
+    key_store = get_key_store()
+    if key_store.backend == "postgres":
+        DB_MANAGER.initialize()
+    try:
+        await key_store.initialize()
+        await key_store.seed(company_name="test", api_key="test")
+        print(f"[seed_tru_api_key] Tru API key seeded in {key_store.backend} (or already exists).")
+    except Exception as e:
+        print(f"[seed_tru_api_key]  Seeding failed: {e}")
+    finally:
+        await key_store.close()
+        await DB_MANAGER.dispose()
 
 
 if __name__ == "__main__":
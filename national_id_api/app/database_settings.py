@@ -1,27 +1,93 @@
-from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncGenerator, Sequence
 import logging
 
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 import sqlalchemy as sa
 import sqlalchemy.orm as so
-from app.settings import settings
+from app import tracing
+from app.settings import Settings, settings
 
 
 logger = logging.getLogger(__name__)
 
+# errors of a read that lost its replica, it is retried on the primary.
+_CONNECTION_ERRORS = (sa.exc.OperationalError, sa.exc.InterfaceError, OSError)
+
+
+def _configure_sqlite(dbapi_connection, connection_record) -> None:
+    """ WAL lets readers run during the batched usage writes.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def _create_engine(database_url: str, pool_size: int, max_overflow: int) -> AsyncEngine:
+    if sa.engine.make_url(database_url).get_backend_name() == "sqlite":
+        # SQLite picks its own pool class, the in-memory one takes no size.
+        engine = create_async_engine(database_url)
+    else:
+        engine = create_async_engine(database_url, pool_size=pool_size, max_overflow=max_overflow)
+    tracing.instrument_engine(engine.sync_engine)
+    if engine.dialect.name == "sqlite":
+        sa.event.listen(engine.sync_engine, "connect", _configure_sqlite)
+    return engine
+
+
+class _Replica:
+    """ one read replica and whether it answered its last health check.
+    """
+
+    def __init__(self, name: str, database_url: str, pool_size: int, max_overflow: int):
+        self.name = name
+        self.engine = _create_engine(database_url, pool_size, max_overflow)
+        self.session_factory = async_sessionmaker(
+            self.engine, expire_on_commit=False, class_=AsyncSession)
+        self.healthy = True
+
 
 class DatabaseManager:
-    def __init__(self, database_url: str):
+    """
+    Engines and sessions of the primary database and its read replicas.
+
+    Writes use `session()` on the primary. Reads that tolerate replication lag
+    use `read()`, spread round robin over the healthy replicas and served by
+    the primary when there are none. A replica is taken out of the rotation
+    when a read on it loses its connection, that read is run again on the
+    primary; it is put back once a health check succeeds again.
+
+    Args:
+        database_url (str): primary database.
+        replica_urls (Sequence[str]): read replicas, none by default.
+        health_check_seconds (float): time between replica health checks.
+        pool_size (int): connections kept open per engine.
+        max_overflow (int): connections opened past `pool_size` under load.
+    """
+
+    def __init__(self, database_url: str, replica_urls: Sequence[str] = (),
+                 health_check_seconds: float = 5.0, pool_size: int = 5, max_overflow: int = 10):
         self._engine: AsyncEngine | None = None
         self._session_factory = None
         self._database_url = database_url
+        self._replica_urls = tuple(replica_urls)
+        self._replicas: list[_Replica] = []
+        self._next_replica = 0
+        self._health_check_seconds = health_check_seconds
+        self._health_checker: asyncio.Task | None = None
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
 
     def initialize(self) -> None:
-        self._engine = create_async_engine(self._database_url)
+        self._engine = _create_engine(self._database_url, self.pool_size, self.max_overflow)
         self._session_factory = async_sessionmaker(
             self._engine, expire_on_commit=False, class_=AsyncSession)
-        logger.info("Database engine initialized")
+        self._replicas = [_Replica(f"replica-{index}", url, self.pool_size, self.max_overflow)
+                          for index, url in enumerate(self._replica_urls)]
+        logger.info("Database engine initialized with %s read replicas", len(self._replicas))
 
     @asynccontextmanager
     async def session(self) -> AsyncGenerator[AsyncSession, None]:
@@ -35,13 +101,148 @@ class DatabaseManager:
         finally:
             await session.close()
 
-    async def validate_connection(self) -> None:
+    def _pick_replica(self) -> _Replica | None:
+        healthy = [replica for replica in self._replicas if replica.healthy]
+        if not healthy:
+            return None
+        self._next_replica = (self._next_replica + 1) % len(healthy)
+        return healthy[self._next_replica]
+
+    @asynccontextmanager
+    async def _replica_session(self, replica: _Replica) -> AsyncGenerator[AsyncSession, None]:
+        session = replica.session_factory()
+        try:
+            yield session
+        except Exception as error:
+            if isinstance(error, _CONNECTION_ERRORS):
+                replica.healthy = False
+                logger.error("[read] %s taken out of rotation: %s", replica.name, error)
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def read(self, statement: sa.Executable, parameters: dict[str, Any] | None = None) -> sa.Result:
+        """
+        Run a read on a healthy replica, or else the primary. A read whose
+        replica cannot be reached is run once more on the primary.
+
+        Args:
+            statement (sa.Executable): the query.
+            parameters (dict[str, Any] | None): its bound parameters.
+
+        Returns:
+            sa.Result: the buffered rows.
+        """
+        replica = self._pick_replica()
+        if replica is not None:
+            try:
+                async with self._replica_session(replica) as session:
+                    return await session.execute(statement, parameters)
+            except _CONNECTION_ERRORS:
+                pass
+        async with self.session() as session:
+            return await session.execute(statement, parameters)
+
+    async def check_replicas(self) -> None:
+        """Run `SELECT 1` on every replica and update its health."""
+        for replica in self._replicas:
+            try:
+                async with asyncio.timeout(self._health_check_seconds):
+                    async with replica.engine.connect() as connection:
+                        await connection.execute(sa.text("SELECT 1"))
+                healthy = True
+            except Exception as error:
+                healthy = False
+                if replica.healthy:
+                    logger.error("[check_replicas] %s is down: %s", replica.name, error)
+            if healthy and not replica.healthy:
+                logger.info("[check_replicas] %s is back", replica.name)
+            replica.healthy = healthy
+
+    def start_health_checks(self) -> None:
+        """Check the replicas every `health_check_seconds` until `dispose`."""
+        if self._replicas and self._health_checker is None:
+            self._health_checker = asyncio.create_task(self._check_replicas_periodically())
+
+    async def _check_replicas_periodically(self) -> None:
+        while True:
+            await self.check_replicas()
+            await asyncio.sleep(self._health_check_seconds)
+
+    def replica_health(self) -> dict[str, bool]:
+        return {replica.name: replica.healthy for replica in self._replicas}
+
+    async def ping(self) -> None:
+        """Run `SELECT 1` on the primary, raises if it cannot be reached."""
         async with self.session() as session:
             await session.execute(sa.text("SELECT 1"))
+
+    async def validate_connection(self) -> None:
+        await self.ping()
         logger.info("Database connection validated")
 
+    async def warm_up(self, connections: int,
+                      statements: Sequence[tuple[sa.Executable, dict[str, Any]]] = ()) -> int:
+        """
+        Open connections of the primary pool ahead of the first requests.
+
+        The connections are checked out at the same time so that each is a new
+        one, then `SELECT 1` and `statements` are run on each (with asyncpg this
+        prepares them in the connection's statement cache) and rolled back.
+
+        Args:
+            connections (int): connections to open, at most the pool size.
+            statements (Sequence[tuple[sa.Executable, dict[str, Any]]]):
+                statements and parameters run on every connection.
+
+        Returns:
+            int: connections opened.
+        """
+        size = self.pool_status().get("size")
+        count = min(connections, size) if size else connections
+
+        async def prepare(connection) -> None:
+            await connection.execute(sa.text("SELECT 1"))
+            for statement, parameters in statements:
+                await connection.execute(statement, parameters)
+            await connection.rollback()
+
+        async with AsyncExitStack() as stack:
+            opened = [await stack.enter_async_context(self._engine.connect()) for _ in range(count)]
+            await asyncio.gather(*(prepare(connection) for connection in opened))
+        return len(opened)
+
+    def pool_status(self) -> dict[str, int]:
+        """Connection counts of the primary engine pool, empty before `initialize`."""
+        if self._engine is None:
+            return {}
+        pool = self._engine.pool
+        if not hasattr(pool, "checkedout"):
+            return {}
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        }
+
+    def pool_headroom(self) -> int | None:
+        """Connections the primary pool can still hand out, `None` when it is unbounded."""
+        status = self.pool_status()
+        max_overflow = getattr(self._engine.pool, "_max_overflow", -1) if status else -1
+        if max_overflow < 0:
+            return None
+        return status["size"] + max_overflow - status["checked_out"]
+
     async def dispose(self) -> None:
-        """Dispose of the engine."""
+        """Dispose of the engines."""
+        if self._health_checker is not None:
+            self._health_checker.cancel()
+            self._health_checker = None
+        for replica in self._replicas:
+            await replica.engine.dispose()
+        self._replicas = []
         if self._engine:
             await self._engine.dispose()
             logger.info("Database engine disposed")
@@ -49,7 +250,20 @@ class DatabaseManager:
             self._session_factory = None
 
 
-DB_MANAGER = DatabaseManager(settings.DATABASE_URL)
+def database_manager(settings: Settings) -> DatabaseManager:
+    """A `DatabaseManager` configured from `settings`, not initialized yet."""
+    return DatabaseManager(
+        settings.DATABASE_URL,
+        replica_urls=settings.DATABASE_REPLICA_URLS,
+        health_check_seconds=settings.DATABASE_REPLICA_HEALTH_CHECK_SECONDS,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    )
+
+
+# database of the process settings, for scripts such as app/database_seeds.py.
+# Each app built by `create_app` has its own, in `app.state.db_manager`.
+DB_MANAGER = database_manager(settings)
 
 
 class Base(so.DeclarativeBase):
@@ -0,0 +1,201 @@
+"""
+Extraction of national IDs embedded in free text (OCR output, emails, forms).
+
+`IDScanner` works on UTF-8 bytes fed in chunks of any size. A candidate is a
+run of exactly 14 digits, ASCII or Arabic-Indic (٠-٩, two bytes each in UTF-8)
+and possibly mixed, not touching another digit. Runs crossing a chunk boundary
+are found because the tail of each chunk that could still be part of one is
+carried into the next.
+
+All the scanning is done by `bytes` methods and the regex engine, so it runs
+at C speed, see `IDScanner`. Candidates are normalized to ASCII and validated
+per chunk through `check_national_id`, once per distinct ID.
+
+Offsets are byte offsets into the whole stream, `end` excluded.
+"""
+import re
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+from app.national_id import NationalID
+from app.wire import check_national_id
+
+ID_LENGTH: int = 14
+_ARABIC_DIGIT = rb"\xd9[\xa0-\xa9]"
+_ANY_DIGIT = rb"(?:[0-9]|" + _ARABIC_DIGIT + rb")"
+_CANDIDATE = re.compile(
+    rb"(?<![0-9])(?<!" + _ARABIC_DIGIT + rb")" + _ANY_DIGIT + rb"{14}(?!" + _ANY_DIGIT + rb")"
+)
+_ARABIC_LEAD = b"\xd9"
+# Arabic-Indic digits once their lead byte is removed.
+_TO_ASCII = bytes.maketrans(bytes(range(0xA0, 0xAA)), b"0123456789")
+
+
+def _classes(digit_bytes: bytes) -> bytes:
+    """translation table marking `digit_bytes` with 1 and every other byte with 0."""
+    return bytes(0x31 if byte in digit_bytes else 0x30 for byte in range(256))
+
+
+# bytes that can be part of a digit, without and with Arabic-Indic digits.
+_ASCII_CLASSES = _classes(b"0123456789")
+_ARABIC_CLASSES = _classes(b"0123456789" + _ARABIC_LEAD + bytes(range(0xA0, 0xAA)))
+_DIGIT = b"1"
+_OTHER = b"0"
+_SHORTEST_RUN = _DIGIT * ID_LENGTH
+# longest run holding a candidate: 14 Arabic-Indic digits, up to three stray
+# continuation bytes of the character before and the lead byte of the one after.
+_LONGEST_RUN = ID_LENGTH * 2 + 4
+
+
+@dataclass(slots=True)
+class IDMatch:
+    start: int
+    end: int
+    national_id: str
+    code: str
+    result: NationalID | None
+
+    def to_dict(self) -> dict:
+        return {
+            "start": self.start,
+            "end": self.end,
+            "national_id": self.national_id,
+            "code": self.code,
+            "data": self.result.__dict__ if self.result else None,
+        }
+
+
+def normalize(candidate: bytes) -> str:
+    """A candidate as 14 ASCII digits."""
+    if _ARABIC_LEAD in candidate:
+        candidate = candidate.replace(_ARABIC_LEAD, b"").translate(_TO_ASCII)
+    return candidate.decode("ascii")
+
+
+class IDScanner:
+    """
+    Incremental scanner, `feed` chunks in order then call `finish`.
+
+    Each buffer is first translated into a map of the bytes that can belong to
+    a digit (`bytes.translate`), in which runs of at least 14 are found with
+    `bytes.find`. Only those runs are looked at further: without Arabic-Indic
+    digits a run is a candidate when it is exactly 14 long, otherwise the
+    candidate regex is run on it. The trailing run of a chunk is held back
+    until the next one shows where it ends.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        # offset in the stream of `_buffer[0]`.
+        self._base = 0
+        # the held back run is already too long to be a candidate.
+        self._skip_first_run = False
+        # that run has Arabic-Indic digits, its bytes are classed with them
+        # even where the next buffer has no lead byte left.
+        self._skip_arabic = False
+        self.candidates = 0
+
+    def feed(self, chunk: bytes) -> list[IDMatch]:
+        """
+        Scan the next chunk.
+
+        Returns:
+            list[IDMatch]: the candidates that are complete, in order.
+        """
+        return self._scan(chunk, final=False)
+
+    def finish(self) -> list[IDMatch]:
+        """
+        Scan what was held back at the end of the stream.
+
+        Returns:
+            list[IDMatch]: the last candidates.
+        """
+        return self._scan(b"", final=True)
+
+    def _scan(self, chunk: bytes, final: bool) -> list[IDMatch]:
+        buffer = self._buffer + chunk if self._buffer else chunk
+        arabic = self._skip_arabic or _ARABIC_LEAD in buffer
+        classes = buffer.translate(_ARABIC_CLASSES if arabic else _ASCII_CLASSES)
+        # runs from `tail` on may continue in the next chunk.
+        tail = len(buffer) if final else classes.rfind(_OTHER) + 1
+        position = 0
+        if self._skip_first_run:
+            position = classes.find(_OTHER)
+            if position < 0:
+                position = tail = len(buffer)
+
+        found: list[tuple[int, int, bytes]] = []
+        while (start := classes.find(_SHORTEST_RUN, position, tail)) >= 0:
+            end = classes.find(_OTHER, start + ID_LENGTH)
+            if end < 0:
+                end = len(buffer)
+            if not arabic:
+                if end - start == ID_LENGTH:
+                    found.append((start, end, buffer[start:end]))
+            else:
+                found.extend((match.start(), match.end(), match.group())
+                             for match in _CANDIDATE.finditer(buffer, start, end))
+            position = end
+
+        base = self._base
+        if final:
+            self._buffer, self._skip_first_run, self._skip_arabic = b"", False, False
+            self._base = base + len(buffer)
+        else:
+            # a held back run longer than any candidate is cut, and skipped next time.
+            carry_from = max(tail, len(buffer) - _LONGEST_RUN)
+            self._skip_first_run = carry_from > tail or (self._skip_first_run and position >= len(buffer))
+            self._skip_arabic = self._skip_first_run and arabic
+            self._buffer = buffer[carry_from:]
+            self._base = base + carry_from
+        return self._validate(found, base)
+
+    def _validate(self, found: list[tuple[int, int, bytes]], base: int) -> list[IDMatch]:
+        self.candidates += len(found)
+        results: dict[bytes, tuple[str, str, NationalID | None]] = {}
+        matches = []
+        for start, end, candidate in found:
+            if (result := results.get(candidate)) is None:
+                national_id = normalize(candidate)
+                result = results[candidate] = (national_id, *check_national_id(national_id))
+            matches.append(IDMatch(base + start, base + end, *result))
+        return matches
+
+
+def _as_bytes(chunk: bytes | str) -> bytes:
+    return chunk.encode() if isinstance(chunk, str) else chunk
+
+
+def extract_ids(text: bytes | str | Iterable[bytes | str]) -> Iterator[IDMatch]:
+    """
+    Find and validate the national IDs in a text.
+
+    Args:
+        text (bytes | str | Iterable[bytes | str]): the text, or its chunks in
+            order, e.g. a file opened in binary mode. `str` is encoded as UTF-8.
+
+    Yields:
+        IDMatch: each candidate with its byte offsets and validation result.
+    """
+    scanner = IDScanner()
+    chunks = [text] if isinstance(text, (bytes, str)) else text
+    for chunk in chunks:
+        yield from scanner.feed(_as_bytes(chunk))
+    yield from scanner.finish()
+
+
+async def extract_ids_async(chunks: AsyncIterable[bytes | str]) -> AsyncIterator[list[IDMatch]]:
+    """
+    `extract_ids` over an asynchronous stream, e.g. `Request.stream()`.
+
+    Yields:
+        list[IDMatch]: the candidates completed by each chunk, as soon as it
+                       is scanned.
+    """
+    scanner = IDScanner()
+    async for chunk in chunks:
+        if matches := scanner.feed(_as_bytes(chunk)):
+            yield matches
+    if matches := scanner.finish():
+        yield matches
@@ -0,0 +1,130 @@
+"""
+Liveness and readiness of a worker, for the orchestrator's probes.
+
+`/healthz` and `/readyz` answer from the state kept by `HealthMonitor` and never
+touch the database, so a probe costs microseconds however often it comes. A
+task started in `lifespan` refreshes that state every `HEALTH_PROBE_SECONDS`:
+
+* database: `SELECT 1` on the key store's database answers within
+  `HEALTH_PROBE_TIMEOUT_SECONDS`.
+* pool headroom: at least `HEALTH_MIN_POOL_HEADROOM` connections of the pool
+  are free.
+* usage flush: at most `HEALTH_MAX_USAGE_BACKLOG` uses wait in memory to be
+  written, more means the key store's writes are failing or falling behind.
+
+A worker is ready once it is serving (warmed up and not shutting down) and the
+last probe passed all three. It is live while the probe task keeps probing; a
+last probe older than three intervals means the task or the event loop is stuck.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+from app.key_store import KeyStore
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Last probe results of this worker and the task refreshing them.
+
+    Args:
+        interval (float): time between probes.
+        timeout (float): longest wait for the database.
+        min_pool_headroom (int): free pool connections needed to be ready.
+        max_usage_backlog (int): unwritten uses tolerated while ready.
+    """
+
+    def __init__(self, interval: float = 2.0, timeout: float = 1.0,
+                 min_pool_headroom: int = 1, max_usage_backlog: int = 1_000_000):
+        self.interval = interval
+        self.timeout = timeout
+        self.min_pool_headroom = min_pool_headroom
+        self.max_usage_backlog = max_usage_backlog
+        self.key_store: KeyStore | None = None
+        self.serving = False
+        self.checks: dict[str, bool] = {}
+        self.pool_headroom: int | None = None
+        self.usage_backlog = 0
+        self.probed_at: float | None = None
+        self._checked_at: str | None = None
+        self._prober: asyncio.Task | None = None
+        self.readiness: tuple[int, bytes] = self._render()
+
+    @property
+    def ready(self) -> bool:
+        return self.serving and bool(self.checks) and all(self.checks.values())
+
+    def live(self) -> bool:
+        if self._prober is None or self.probed_at is None:
+            return True
+        stale = time.monotonic() - self.probed_at > 3 * self.interval + self.timeout
+        return not self._prober.done() and not stale
+
+    def set_serving(self, serving: bool) -> None:
+        """Mark the worker as taking traffic, or as starting or draining."""
+        self.serving = serving
+        self.readiness = self._render()
+
+    async def start(self, key_store: KeyStore) -> None:
+        """Probe `key_store` once, then every `interval` until `stop`."""
+        self.key_store = key_store
+        await self.probe()
+        if self._prober is None:
+            self._prober = asyncio.create_task(self._probe_periodically())
+
+    def stop(self) -> None:
+        if self._prober is not None:
+            self._prober.cancel()
+            self._prober = None
+
+    async def probe(self) -> bool:
+        """
+        Check the database, the pool and the usage backlog.
+
+        Returns:
+            bool: whether all checks passed.
+        """
+        db_manager = self.key_store.db_manager
+        try:
+            async with asyncio.timeout(self.timeout):
+                await db_manager.ping()
+            database = True
+        except Exception as error:
+            if self.checks.get("database", True):
+                logger.error("[HealthMonitor] database probe failed: %s", error)
+            database = False
+        self.pool_headroom = db_manager.pool_headroom()
+        self.usage_backlog = self.key_store.backlog()
+        self.checks = {
+            "database": database,
+            "pool_headroom": self.pool_headroom is None or self.pool_headroom >= self.min_pool_headroom,
+            "usage_flush": self.usage_backlog <= self.max_usage_backlog,
+        }
+        self.probed_at = time.monotonic()
+        self._checked_at = datetime.now(timezone.utc).isoformat()
+        self.readiness = self._render()
+        return all(self.checks.values())
+
+    def _render(self) -> tuple[int, bytes]:
+        """status code and body of `/readyz`, encoded once per change."""
+        body = json.dumps({
+            "ready": self.ready,
+            "serving": self.serving,
+            "checks": self.checks,
+            "pool_headroom": self.pool_headroom,
+            "usage_backlog": self.usage_backlog,
+            "checked_at": self._checked_at,
+        }).encode()
+        return (200 if self.ready else 503), body
+
+    async def _probe_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.probe()
+            except Exception as error:
+                logger.error("[HealthMonitor] probe failed: %s", error)
@@ -0,0 +1,476 @@
+"""
+Storage of API keys and their usage counts.
+
+`validate_api_key`, the WebSocket channel, the admin API and the seed go
+through a `KeyStore` chosen by `KEY_STORE_BACKEND`:
+
+* `postgres`: the `ApiKeyUsages` table behind `DATABASE_URL`. Every use is
+  written during the request with one `UPDATE` by primary key.
+* `sqlite`: an embedded database file, `KEY_STORE_SQLITE_PATH`, in WAL mode for
+  single node deployments. Uses are added up in memory and written in one
+  transaction every `KEY_STORE_FLUSH_SECONDS` or `KEY_STORE_FLUSH_BATCH` uses,
+  so a crash loses at most that many uses.
+
+Keys are stored hashed, see app/api_keys.py. Both stores verify them against a
+`KeyIndex` of the active keys loaded at startup (or once before forking, see
+app/serve.py) and reloaded every flush interval (`KEY_STORE_FLUSH_SECONDS` or
+`USAGE_ROLLUP_FLUSH_SECONDS`). Keys missing from the index, e.g. created by
+another worker, are looked up once; a prefix the database does not have either
+is not looked up again for `MISSING_KEY_SECONDS` or until the next reload, so
+invalid keys cost no query. Keys revoked by another worker stay usable until
+the next reload.
+
+Both also add every use to the hourly `UsageRollup` of app/usage_rollup.py,
+written in the same batches (`postgres` every `USAGE_ROLLUP_FLUSH_SECONDS`).
+
+Both are SQLAlchemy based, database errors surface as SQLAlchemy exceptions.
+Key lookups read from a replica when the `DatabaseManager` has one, uses and
+key changes are always written to the primary.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import os
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from starlette.requests import HTTPConnection
+
+from app import tracing
+from app.api_keys import KeyEntry, KeyIndex, generate_key, key_prefix, matches, new_entry
+from app.database_settings import DB_MANAGER, Base, DatabaseManager
+from app.models import APIKeyUsage
+from app.settings import Settings, settings
+from app.usage_rollup import HOURLY_TABLE, UsageRollup
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+_ENTRY_COLUMNS = (APIKeyUsage.key_prefix, APIKeyUsage.id, APIKeyUsage.company_name,
+                  APIKeyUsage.key_salt, APIKeyUsage.key_hash)
+_ACTIVE = APIKeyUsage.revoked_at.is_(None)
+_LOOKUP_STATEMENT = sa.select(*_ENTRY_COLUMNS).where(
+    APIKeyUsage.key_prefix == sa.bindparam("prefix"), _ACTIVE)
+_API_KEY_USAGES = APIKeyUsage.__table__
+_CREDIT_STATEMENT = (
+    sa.update(_API_KEY_USAGES)
+    .where(_API_KEY_USAGES.c.id == sa.bindparam("key_id"))
+    .values(
+        usage_count=_API_KEY_USAGES.c.usage_count + sa.bindparam("uses"),
+        last_request_at=sa.bindparam("used_at"),
+    )
+)
+
+
+class KeyStore(ABC):
+    """
+    Common part of the key stores, a `DatabaseManager` holding `ApiKeyUsages`.
+
+    Args:
+        db_manager (DatabaseManager): database of the keys.
+    """
+
+    backend: str = ""
+    # INSERT of the backend's dialect, for `ON CONFLICT`.
+    _insert = staticmethod(postgresql.insert)
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+        self.rollup = UsageRollup()
+        self.keys = KeyIndex()
+        # the index was loaded by `preload`, `initialize` keeps it.
+        self.preloaded = False
+
+    async def initialize(self) -> None:
+        """Prepare the store, called once at startup."""
+
+    async def close(self) -> None:
+        """Write what is still buffered, called once at shutdown."""
+
+    async def flush(self) -> None:
+        """Write buffered uses now."""
+
+    def backlog(self) -> int:
+        """Uses counted in memory and not written yet."""
+        return self.rollup.uses
+
+    @abstractmethod
+    async def use_key(self, api_key: str, count: int = 1) -> str | None:
+        """
+        Count `count` uses of a key.
+
+        Returns:
+            str | None: the key's company name, `None` if there is no such key.
+        """
+
+    @abstractmethod
+    async def credit(self, api_key: str, count: int) -> None:
+        """Count `count` uses of a key already known to exist."""
+
+    async def load_keys(self) -> None:
+        """Replace the index with the active keys of the database."""
+        rows = await self.db_manager.read(sa.select(*_ENTRY_COLUMNS).where(_ACTIVE))
+        self.keys.replace({prefix: KeyEntry(*entry) for prefix, *entry in rows})
+
+    async def preload(self) -> None:
+        """
+        Load the index before `initialize`, e.g. once in the process that forks
+        the workers so that they share it. The engine is disposed of again, no
+        connection is inherited.
+        """
+        self.db_manager.initialize()
+        try:
+            await self.load_keys()
+        finally:
+            await self.db_manager.dispose()
+        self.preloaded = True
+
+    async def resolve(self, api_key: str | None) -> KeyEntry | None:
+        """
+        The entry of an active key, from the index or else the database.
+
+        Returns:
+            KeyEntry | None: the key's entry, `None` if the key is missing,
+                             unknown, revoked or does not match.
+        """
+        if not api_key:
+            return None
+        prefix = key_prefix(api_key)
+        entry = self.keys.get(prefix)
+        if entry is None:
+            if self.keys.is_missing(prefix):
+                return None
+            row = (await self.db_manager.read(_LOOKUP_STATEMENT, {"prefix": prefix})).first()
+            if row is None:
+                self.keys.add_missing(prefix)
+                return None
+            entry = KeyEntry(*row[1:])
+            self.keys.add(prefix, entry)
+        return entry if matches(entry, api_key) else None
+
+    async def warm_up(self, connections: int) -> int:
+        """
+        Open `connections` pool connections with the statements of `resolve`
+        and of counting a use prepared on each, called once at startup.
+
+        Returns:
+            int: connections opened.
+        """
+        return await self.db_manager.warm_up(connections, [
+            (_LOOKUP_STATEMENT, {"prefix": ""}),
+            (_CREDIT_STATEMENT, {"key_id": uuid.UUID(int=0), "uses": 0, "used_at": None}),
+        ])
+
+    async def exists(self, api_key: str) -> bool:
+        return await self.resolve(api_key) is not None
+
+    async def seed(self, company_name: str, api_key: str) -> None:
+        """Add a key with no uses, nothing happens if it exists already."""
+        entry = new_entry(company_name, api_key)
+        async with self.db_manager.session() as session:
+            await session.execute(
+                self._insert(APIKeyUsage)
+                .values(id=entry.key_id, company_name=company_name, key_prefix=key_prefix(api_key),
+                        key_salt=entry.salt, key_hash=entry.key_hash,
+                        usage_count=0, last_request_at=None)
+                .on_conflict_do_nothing(index_elements=["key_prefix"])
+            )
+            await session.commit()
+
+    async def create_key(self, company_name: str) -> str:
+        """
+        Issue a new key for a company.
+
+        Returns:
+            str: the key, it is not stored and cannot be shown again.
+        """
+        api_key = generate_key()
+        entry = new_entry(company_name, api_key)
+        async with self.db_manager.session() as session:
+            await session.execute(sa.insert(APIKeyUsage).values(
+                id=entry.key_id, company_name=company_name, key_prefix=key_prefix(api_key),
+                key_salt=entry.salt, key_hash=entry.key_hash, usage_count=0))
+            await session.commit()
+        self.keys.add(key_prefix(api_key), entry)
+        return api_key
+
+    async def rotate_key(self, prefix: str) -> str | None:
+        """
+        Replace an active key by a new one, its usage counts are kept.
+
+        Returns:
+            str | None: the new key, `None` if no active key has this prefix.
+        """
+        api_key = generate_key()
+        entry = new_entry("", api_key)
+        # one conditional UPDATE, so that of concurrent rotations and revocations
+        # of the same key only one succeeds.
+        async with self.db_manager.session() as session:
+            row = (await session.execute(
+                sa.update(APIKeyUsage)
+                .where(APIKeyUsage.key_prefix == prefix, _ACTIVE)
+                .values(key_prefix=key_prefix(api_key), key_salt=entry.salt, key_hash=entry.key_hash)
+                .returning(APIKeyUsage.id, APIKeyUsage.company_name)
+            )).first()
+            await session.commit()
+        self.keys.remove(prefix)
+        if row is None:
+            return None
+        entry = entry._replace(key_id=row.id, company_name=row.company_name)
+        self.keys.add(key_prefix(api_key), entry)
+        return api_key
+
+    async def revoke_key(self, prefix: str) -> bool:
+        """
+        Revoke an active key, its row and usage counts are kept.
+
+        Returns:
+            bool: `False` if no active key has this prefix.
+        """
+        async with self.db_manager.session() as session:
+            result = await session.execute(
+                sa.update(APIKeyUsage)
+                .where(APIKeyUsage.key_prefix == prefix, _ACTIVE)
+                .values(revoked_at=datetime.now(timezone.utc))
+            )
+            await session.commit()
+        self.keys.remove(prefix)
+        return result.rowcount > 0
+
+    async def get(self, api_key: str | None) -> APIKeyUsage | None:
+        """The stored key, `None` if it does not match; buffered uses are not included."""
+        if not api_key:
+            return None
+        query = sa.select(APIKeyUsage).where(APIKeyUsage.key_prefix == key_prefix(api_key))
+        stored = (await self.db_manager.read(query)).scalars().first()
+        if stored is None or not matches(
+                KeyEntry(stored.id, stored.company_name, stored.key_salt, stored.key_hash), api_key):
+            return None
+        return stored
+
+    async def delete(self, api_key: str) -> None:
+        prefix = key_prefix(api_key)
+        async with self.db_manager.session() as session:
+            await session.execute(sa.delete(APIKeyUsage).where(APIKeyUsage.key_prefix == prefix))
+            await session.commit()
+        self.keys.remove(prefix)
+
+
+class PostgresKeyStore(KeyStore):
+    """
+    Keys in Postgres, every use is written before the request is answered.
+
+    Args:
+        db_manager (DatabaseManager): database of the keys.
+        rollup_flush_seconds (float): time between writes of the hourly rollup
+                                      and reloads of the key index.
+    """
+
+    backend = "postgres"
+
+    def __init__(self, db_manager: DatabaseManager, rollup_flush_seconds: float = 5.0):
+        super().__init__(db_manager)
+        self.rollup_flush_seconds = rollup_flush_seconds
+        self._flusher: asyncio.Task | None = None
+
+    async def initialize(self) -> None:
+        if not self.preloaded:
+            await self.load_keys()
+        self._flusher = asyncio.create_task(self._flush_periodically())
+        logger.info("Postgres key store ready with %s keys", len(self.keys))
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self.rollup:
+            return
+        try:
+            async with self.db_manager.session() as session:
+                await self.rollup.write(session)
+                await session.commit()
+        except Exception as error:
+            logger.error("[PostgresKeyStore] failed to write the usage rollup: %s", error)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.rollup_flush_seconds)
+            await self.flush()
+            try:
+                await self.load_keys()
+            except Exception as error:
+                logger.error("[PostgresKeyStore] failed to reload keys: %s", error)
+
+    async def _count_uses(self, entry: KeyEntry, count: int) -> None:
+        async with self.db_manager.session() as session:
+            with tracing.span("db.pool.checkout"):
+                await session.connection()
+            await session.execute(_CREDIT_STATEMENT, {
+                "key_id": entry.key_id, "uses": count, "used_at": datetime.now(timezone.utc)})
+            with tracing.span("db.commit"):
+                await session.commit()
+        self.rollup.add(entry.company_name, count)
+
+    async def use_key(self, api_key: str, count: int = 1) -> str | None:
+        entry = await self.resolve(api_key)
+        if entry is None:
+            return None
+        await self._count_uses(entry, count)
+        return entry.company_name
+
+    async def credit(self, api_key: str, count: int) -> None:
+        if entry := await self.resolve(api_key):
+            await self._count_uses(entry, count)
+
+
+class SQLiteKeyStore(KeyStore):
+    """
+    Keys in a local SQLite file with uses written in batches.
+
+    Args:
+        path (str): database file, created with its table if missing.
+        flush_seconds (float): longest time uses stay in memory, and time
+                               between reloads of the key index.
+        flush_batch (int): buffered uses that trigger a write.
+    """
+
+    backend = "sqlite"
+    _insert = staticmethod(sqlite.insert)
+
+    def __init__(self, path: str, flush_seconds: float = 1.0, flush_batch: int = 1000):
+        super().__init__(DatabaseManager(f"sqlite+aiosqlite:///{path}"))
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.flush_batch = flush_batch
+        self._pending: dict[uuid.UUID, tuple[int, datetime]] = {}
+        self._pending_uses = 0
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+    async def initialize(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_manager.initialize()
+        async with self.db_manager.session() as session:
+            connection = await session.connection()
+            await connection.run_sync(Base.metadata.create_all, tables=[_API_KEY_USAGES, HOURLY_TABLE])
+            await session.commit()
+        if not self.preloaded:
+            await self.load_keys()
+        self._flusher = asyncio.create_task(self._flush_periodically())
+        logger.info("SQLite key store ready at %s", self.path)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        await self.db_manager.dispose()
+
+    async def use_key(self, api_key: str, count: int = 1) -> str | None:
+        entry = await self.resolve(api_key)
+        if entry is None:
+            return None
+        await self._count_uses(entry, count)
+        return entry.company_name
+
+    async def credit(self, api_key: str, count: int) -> None:
+        if entry := await self.resolve(api_key):
+            await self._count_uses(entry, count)
+
+    async def delete(self, api_key: str) -> None:
+        if entry := self.keys.get(key_prefix(api_key)):
+            self._pending.pop(entry.key_id, None)
+        await super().delete(api_key)
+
+    def backlog(self) -> int:
+        return self._pending_uses
+
+    async def _count_uses(self, entry: KeyEntry, count: int) -> None:
+        self.rollup.add(entry.company_name, count)
+        uses, _ = self._pending.get(entry.key_id, (0, None))
+        self._pending[entry.key_id] = (uses + count, datetime.now(timezone.utc))
+        self._pending_uses += count
+        if self._pending_uses >= self.flush_batch:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_uses = 0
+            if not pending and not self.rollup:
+                return
+            try:
+                async with self.db_manager.session() as session:
+                    if pending:
+                        await session.execute(_CREDIT_STATEMENT, [
+                            {"key_id": key_id, "uses": uses, "used_at": used_at}
+                            for key_id, (uses, used_at) in pending.items()
+                        ])
+                    await self.rollup.write(session)
+                    await session.commit()
+            except Exception as error:
+                # keep the uses for the next flush.
+                for key_id, (uses, used_at) in pending.items():
+                    buffered, _ = self._pending.get(key_id, (0, None))
+                    self._pending[key_id] = (buffered + uses, used_at)
+                    self._pending_uses += uses
+                logger.error("[SQLiteKeyStore] failed to write %s key uses: %s",
+                             sum(uses for uses, _ in pending.values()), error)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+            try:
+                await self.load_keys()
+            except Exception as error:
+                logger.error("[SQLiteKeyStore] failed to reload keys: %s", error)
+
+
+def build_key_store(settings: Settings, db_manager: DatabaseManager) -> KeyStore:
+    """
+    The key store configured by `KEY_STORE_BACKEND`.
+
+    Args:
+        settings (Settings): configuration of the store.
+        db_manager (DatabaseManager): database of the `postgres` store.
+
+    Returns:
+        KeyStore: the key store.
+    """
+    if settings.KEY_STORE_BACKEND == "sqlite":
+        return SQLiteKeyStore(
+            settings.KEY_STORE_SQLITE_PATH,
+            flush_seconds=settings.KEY_STORE_FLUSH_SECONDS,
+            flush_batch=settings.KEY_STORE_FLUSH_BATCH,
+        )
+    return PostgresKeyStore(db_manager, rollup_flush_seconds=settings.USAGE_ROLLUP_FLUSH_SECONDS)
+
+
+@lru_cache
+def get_key_store() -> KeyStore:
+    """
+    The key store of the process settings, as a singleton, for scripts such as
+    app/database_seeds.py. Apps use the one given to `create_app`.
+
+    Returns:
+        KeyStore: the key store.
+    """
+    return build_key_store(settings, DB_MANAGER)
+
+
+def app_key_store(connection: HTTPConnection) -> KeyStore:
+    """
+    The key store of the app serving the request or WebSocket, the one given to
+    `create_app`.
+
+    Returns:
+        KeyStore: the key store.
+    """
+    return connection.app.state.key_store
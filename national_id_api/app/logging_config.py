@@ -0,0 +1,203 @@
+"""
+Non-blocking logging for the request path.
+
+Every logger hands its records to a bounded in-memory queue; a
+`QueueListener` thread formats and writes them. The event loop thread only
+resolves the message and enqueues it, and when the writer falls behind the
+record is dropped and counted instead of blocking the request.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from prometheus_client import Counter
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+
+REQUEST_ID_HEADER: bytes = b"x-request-id"
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+LOG_RECORDS_DROPPED = metrics.register_buffer(metrics.BufferedCounter(Counter(
+    "national_id_log_records_dropped",
+    "Log records dropped because the log queue was full.",
+)))
+
+# loggers uvicorn configures with its own synchronous stderr handlers.
+UVICORN_LOGGERS: tuple[str, ...] = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listener: QueueListener | None = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the id of the current request, if any, to every record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of chosen message types.
+
+    A message type is the unformatted message (`record.msg`), so all records
+    logged from one call site share a rate. Warnings and errors are never
+    sampled out.
+
+    Args:
+        rates (dict[str, float]): message type to the fraction of records kept.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(record.msg)
+        return rate is None or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """`QueueHandler` that drops records instead of waiting on a full queue."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # only resolve the message here; formatting and traceback rendering
+        # happen on the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The previous plain text format, with the request id appended."""
+
+    def __init__(self):
+        super().__init__(
+            fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s - [%(request_id)s]",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+
+
+def configure_logging(
+    level: str = "INFO",
+    json_output: bool = True,
+    queue_size: int = 10_000,
+    sampling: dict[str, float] | None = None,
+) -> None:
+    """
+    Route all logging through a bounded queue and a writer thread.
+
+    Safe to call again, the previous listener is stopped first.
+
+    Args:
+        level (str): root log level name.
+        json_output (bool): structured JSON lines, plain text otherwise.
+        queue_size (int): records buffered before new ones are dropped.
+        sampling (dict[str, float] | None): per message type sampling rates.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(
+        JsonFormatter() if json_output else TextFormatter())
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(SamplingFilter(sampling or {}))
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level.upper())
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(
+        queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flush the queue and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that sets the request id used by every log record.
+
+    The id is taken from the `X-Request-ID` header or generated, and echoed in
+    the response `X-Request-ID` header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:128]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (REQUEST_ID_HEADER, request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
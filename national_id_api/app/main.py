@@ -1,42 +1,104 @@
+import asyncio
+import json
 import logging
+import time
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, status, Header, Depends, HTTPException
+from fastapi import APIRouter, FastAPI, Request, status, Header, Depends, HTTPException
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
 
-from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.errors import RateLimitExceeded
 
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from app.schema import InputID
+from app import metrics, tracing, wire
+from app.admin import router as admin_router
+from app.admission import AdmissionController, AdmissionControlMiddleware
+from app.health import HealthMonitor
+from app.logging_config import RequestIdMiddleware, configure_logging
+from app.streaming import router as streaming_router
+from app.settings import Settings, settings
+from app.schema import InputID, InputIDs
 from app.response_codes import SuccessCodeEnum, ErrorCodeEnum
 from app.national_id import NationalID
-from app.database_settings import DB_MANAGER, db_session
+from app.database_settings import DatabaseManager, database_manager
 from app.database_operations import validate_api_key
+from app.key_store import KeyStore, app_key_store, build_key_store
 from app.custom_exceptions import (
     http_exception_handler,
     validation_exception_handler,
     custom_rate_limit_handler,
 )
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
-limiter = Limiter(
+logger: logging.Logger = logging.getLogger(__name__)
+
+# built here because the route decorators below are bound to it; `create_app`
+# switches it on or off from its settings and attaches it to the app.
+limiter = metrics.TimedLimiter(
     key_func=get_remote_address,
     default_limits=["10/minute"],
     storage_uri="memory://",
-    strategy="fixed-window"
+    strategy="fixed-window",
 )
+router = APIRouter()
+WARM_UP_ID: str = "29001011234567"
+# cheapest route through every middleware, requested once by `warm_up`.
+WARM_UP_PATH: str = "/admission-stats"
+# matches per chunk of the /extract-ids response, each chunk is compressed as one.
+EXTRACT_CHUNK_MATCHES: int = 1000
 
 
-logger: logging.Logger = logging.getLogger(__name__)
+async def refresh_metrics_periodically(db_manager: DatabaseManager, admission_controller: AdmissionController,
+                                       interval: float) -> None:
+    """Keep this worker's pool and admission gauges current."""
+    while True:
+        try:
+            metrics.refresh_gauges(db_manager, admission_controller)
+        except Exception as e:
+            logger.warning("Failed to refresh metrics gauges: %s", e)
+        await asyncio.sleep(interval)
+
+
+async def warm_up(app: FastAPI, key_store: KeyStore) -> None:
+    """
+    Get the worker ready for its first requests: open `DATABASE_POOL_MIN_CONNECTIONS`
+    pool connections with the auth statements prepared on each, run the
+    validation, extraction and encoding paths once and send one request through
+    the middleware stack, which Starlette builds on the first request.
+
+    Args:
+        app (FastAPI): the app being started.
+        key_store (KeyStore): store whose pool is warmed.
+    """
+    settings: Settings = app.state.settings
+    try:
+        connections = await key_store.warm_up(settings.DATABASE_POOL_MIN_CONNECTIONS)
+        logger.info(" Opened %s %s pool connections", connections, key_store.backend)
+    except Exception as e:
+        logger.critical(" Failed to warm up the %s pool: %s", key_store.backend, e)
+
+    from app import extraction
+    code, national_id = wire.check_national_id(WARM_UP_ID)
+    JSONResponse(content={"data": national_id.__dict__, "message": "", "code": code})
+    wire.MsgpackResponse(wire.result_row(code, national_id))
+    list(extraction.extract_ids(f"id {WARM_UP_ID}."))
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    await app({
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": WARM_UP_PATH, "raw_path": WARM_UP_PATH.encode(),
+        "query_string": b"", "root_path": "", "headers": [], "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80), "state": {},
+    }, receive, send)
 
 
 @asynccontextmanager
@@ -44,56 +106,270 @@ async def lifespan(app: FastAPI):
     """ startup and shut down events
 
     """
+    settings: Settings = app.state.settings
+    started_at = time.perf_counter()
+    db_manager: DatabaseManager = app.state.db_manager
+    db_manager.initialize()
 
-    DB_MANAGER.initialize()
-
+    key_store: KeyStore = app.state.key_store
+    if key_store.backend == "postgres":
+        try:
+            await db_manager.validate_connection()
+            logger.info(" Connected to the database")
+        except Exception as e:
+            logger.critical(
+                " Failed to connect to the database during startup: %s", e)
     try:
-        await DB_MANAGER.validate_connection()
-        logger.info(" Connected to the database")
+        await key_store.initialize()
     except Exception as e:
-        logger.critical(
-            " Failed to connect to the database during startup: %s", e)
+        logger.critical(" Failed to initialize the %s key store: %s", key_store.backend, e)
+    await warm_up(app, key_store)
+    health: HealthMonitor = app.state.health
+    await health.start(key_store)
+    db_manager.start_health_checks()
+    audit_log = app.state.audit_log
+    if audit_log is not None:
+        audit_log.start()
+
+    metrics_refresher = asyncio.create_task(
+        refresh_metrics_periodically(db_manager, app.state.admission, settings.METRICS_REFRESH_SECONDS))
+    app.state.ready = True
+    health.set_serving(True)
+    logger.info(" Ready to serve after %.3fs", time.perf_counter() - started_at)
 
     yield
 
+    app.state.ready = False
+    health.set_serving(False)
+    health.stop()
+    metrics_refresher.cancel()
+    if audit_log is not None:
+        try:
+            await audit_log.close()
+        except Exception as e:
+            logger.warning("Failed to write the audit log: %s", e)
+    metrics.mark_worker_dead()
     try:
-        await DB_MANAGER.dispose()
+        await key_store.close()
+    except Exception as e:
+        logger.warning("Failed to close the key store: %s", e)
+    try:
+        await db_manager.dispose()
         logger.info(" Database connection disposed")
     except Exception as e:
         logger.warning("Failed to dispose DB engine: %s", e)
 
-app = FastAPI(lifespan=lifespan)
-app.add_exception_handler(HTTPException, http_exception_handler)
-app.add_exception_handler(RequestValidationError, validation_exception_handler)
-app.add_exception_handler(RateLimitExceeded, custom_rate_limit_handler)
-app.add_middleware(SlowAPIMiddleware)
-app.state.limiter = limiter
+
+def create_app(settings: Settings = settings, key_store: KeyStore | None = None,
+               db_manager: DatabaseManager | None = None) -> FastAPI:
+    """
+    Build the application: logging, tracing, middlewares and routes.
+
+    Modules of features that are switched off (profiling, the audit log) are not
+    imported. The database manager and the key store are built from `settings`
+    unless given, and kept in `app.state`. The rate limiter is shared by the
+    apps of a process, as the routes are bound to it, and switched on or off
+    from `settings`.
+
+    Args:
+        settings (Settings): configuration, the process settings by default.
+        key_store (KeyStore | None): store of the API keys, opened and closed by
+                                     the app's lifespan. Built from `settings` by default.
+        db_manager (DatabaseManager | None): primary database and its replicas,
+                                             initialized by the app's lifespan.
+                                             Built from `settings` by default.
+
+    Returns:
+        FastAPI: the app, `app.state.ready` once its lifespan warmed it up.
+    """
+    configure_logging(
+        level=settings.LOG_LEVEL,
+        json_output=settings.LOG_JSON,
+        queue_size=settings.LOG_QUEUE_SIZE,
+        sampling=settings.LOG_SAMPLING,
+    )
+    tracing.configure(
+        capacity=settings.TRACING_BUFFER_SIZE,
+        export_path=settings.TRACING_EXPORT_PATH,
+    )
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.db_manager = db_manager if db_manager is not None else database_manager(settings)
+    app.state.key_store = (key_store if key_store is not None
+                           else build_key_store(settings, app.state.db_manager))
+    app.state.ready = False
+    app.state.health = HealthMonitor(
+        interval=settings.HEALTH_PROBE_SECONDS,
+        timeout=settings.HEALTH_PROBE_TIMEOUT_SECONDS,
+        min_pool_headroom=settings.HEALTH_MIN_POOL_HEADROOM,
+        max_usage_backlog=settings.HEALTH_MAX_USAGE_BACKLOG,
+    )
+    app.add_exception_handler(HTTPException, http_exception_handler)
+    app.add_exception_handler(RequestValidationError, validation_exception_handler)
+    app.add_exception_handler(RateLimitExceeded, custom_rate_limit_handler)
+    if settings.COMPRESSION_ENABLED:
+        from app.compression import CompressionMiddleware
+
+        # innermost, so that admission control and timings include compression.
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.COMPRESSION_MIN_SIZE,
+            gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+            zstd_level=settings.COMPRESSION_ZSTD_LEVEL,
+            thread_min_size=settings.COMPRESSION_THREAD_MIN_SIZE,
+            exempt_paths=("/metrics",),
+        )
+    if settings.ADMIN_API_KEY or settings.PROFILING_SAMPLE_RATE:
+        from app.profiling import ProfilingMiddleware
+
+        # inside SlowAPIMiddleware, which runs the endpoint in another task.
+        app.add_middleware(
+            ProfilingMiddleware,
+            admin_key=settings.ADMIN_API_KEY,
+            sample_rate=settings.PROFILING_SAMPLE_RATE,
+            output_dir=settings.PROFILING_OUTPUT_DIR,
+            max_files=settings.PROFILING_MAX_FILES,
+            interval=settings.PROFILING_INTERVAL_SECONDS,
+        )
+    app.add_middleware(SlowAPIMiddleware)
+    limiter.enabled = settings.RATE_LIMIT_ENABLED
+    app.state.limiter = limiter
+
+    admission_controller = AdmissionController(
+        max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+        max_queue=settings.ADMISSION_MAX_QUEUE,
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    )
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        controller=admission_controller,
+        retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+        exempt_paths=("/admission-stats", "/metrics", "/admin/traces", "/healthz", "/readyz"),
+    )
+    app.state.admission = admission_controller
+    app.add_middleware(metrics.RequestTimingMiddleware)
+    app.state.audit_log = None
+    if settings.AUDIT_ENABLED:
+        from app.audit import AuditLog, AuditMiddleware
+
+        app.state.audit_log = AuditLog(
+            app.state.db_manager,
+            buffer_size=settings.AUDIT_BUFFER_SIZE,
+            flush_batch=settings.AUDIT_FLUSH_BATCH,
+            flush_seconds=settings.AUDIT_FLUSH_SECONDS,
+            retention_days=settings.AUDIT_RETENTION_DAYS,
+            maintenance_seconds=settings.AUDIT_MAINTENANCE_SECONDS,
+        )
+        app.add_middleware(AuditMiddleware, audit_log=app.state.audit_log)
+    app.add_middleware(
+        tracing.TracingMiddleware,
+        sample_rate=settings.TRACING_SAMPLE_RATE,
+        exempt_paths=("/metrics", "/admin/traces", "/healthz", "/readyz"),
+    )
+    app.add_middleware(RequestIdMiddleware)
+    app.include_router(router)
+    app.include_router(admin_router)
+    app.include_router(streaming_router)
+    return app
+
+
+def __getattr__(name: str) -> FastAPI:
+    # `app.main:app`, created on first use so that importing the module has no
+    # side effects. Servers can also call `create_app` themselves (`--factory`).
+    if name == "app":
+        globals()["app"] = app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # API
 
 
-async def verify_api_key(x_api_key: str = Header(None), session: AsyncSession = Depends(db_session)) -> bool | JSONResponse:
+async def verify_api_key(x_api_key: str = Header(None), key_store: KeyStore = Depends(app_key_store)) -> bool | JSONResponse:
     """_summary_
 
     Args:
         x_api_key (str): service api key .
-        session (AsyncSession): database session. Defaults to Depends(db_session).
+        key_store (KeyStore): where keys are stored. Defaults to Depends(app_key_store).
 
     Returns:
         bool: `True` if it's right also it autoincrement usage, `false`  otherwise 
     """
+    return await _check_api_key(key_store, x_api_key)
+
+
+async def _check_api_key(key_store: KeyStore, api_key: str, count: int = 1) -> bool:
+    started_at = time.perf_counter()
     try:
-        return await validate_api_key(db_session=session, api_key=x_api_key)
+        with tracing.span("verify_api_key"):
+            return await validate_api_key(key_store=key_store, api_key=api_key, count=count)
     except Exception as except_error:
         logger.critical(
             "[unhandled_error] at verify_api_key error (%s) ", except_error)
         raise
+    finally:
+        metrics.STAGE_VERIFY_API_KEY.observe(time.perf_counter() - started_at)
+
 
+def _validate_body(model: type[InputID] | type[InputIDs], payload) -> InputID | InputIDs:
+    try:
+        return model.model_validate(payload)
+    except ValidationError as validation_error:
+        raise RequestValidationError(validation_error.errors(), body=payload) from validation_error
+
+
+async def read_input_id(request: Request) -> InputID:
+    """
+    The request body as `InputID`, sent as JSON or as a MessagePack encoded ID.
 
-@app.post("/validate-id")
+    Raises:
+        RequestValidationError: if the body is not a valid `InputID`.
+    """
+    payload = await wire.read_body(request)
+    if wire.sends_msgpack(request):
+        payload = {"national_id": payload}
+    return _validate_body(InputID, payload)
+
+
+async def verify_api_key_for_batch(
+    request: Request,
+    x_api_key: str = Header(None),
+    key_store: KeyStore = Depends(app_key_store),
+) -> list[str | int]:
+    """
+    Read a batch of IDs and count every ID as one use of the API key.
+
+    Raises:
+        RequestValidationError: if the body is not a valid `InputIDs` or holds
+                                more than `BATCH_MAX_IDS` IDs.
+        HTTPException: from `validate_api_key`.
+
+    Returns:
+        list[str | int]: the IDs of the batch.
+    """
+    payload = await wire.read_body(request)
+    if wire.sends_msgpack(request):
+        payload = {"national_ids": payload}
+    national_ids = _validate_body(InputIDs, payload).national_ids
+    max_ids = request.app.state.settings.BATCH_MAX_IDS
+    if len(national_ids) > max_ids:
+        raise RequestValidationError(
+            [{"type": "too_long", "loc": ("body", "national_ids"),
+              "msg": f"at most {max_ids} IDs per batch", "input": None}],
+            body=payload,
+        )
+    await _check_api_key(key_store, x_api_key, count=len(national_ids))
+    return national_ids
+
+
+@router.post("/validate-id", openapi_extra={"requestBody": {"required": True, "content": {
+    "application/json": {"schema": InputID.model_json_schema()},
+    "application/msgpack": {"schema": {"type": ["integer", "string"]}},
+}}})
 @limiter.limit("100/minute")
 @limiter.limit("5/second")
-async def validate_national_id(data: InputID, request: Request, valid_key: str = Depends(verify_api_key),):
+async def validate_national_id(request: Request, valid_key: str = Depends(verify_api_key), data: InputID = Depends(read_input_id)):
     """
     Validates the provided Egyptian National ID.
 
@@ -101,34 +377,59 @@ async def validate_national_id(data: InputID, request: Request, valid_key: str =
     - Be exactly 14 digits long.
     - Contain only numeric characters.
 
+    The body may be MessagePack and the response is MessagePack when asked for
+    in `Accept`, see `app/wire.py`.
+
     Returns:
         JSONResponse: A structured response indicating whether the ID is valid,
                       along with extracted data and a message.
     """
     try:
-
-        national_id = NationalID(id_number=str(data.national_id))
+        started_at = time.perf_counter()
+        with tracing.span("national_id.validate"):
+            national_id = NationalID(id_number=str(data.national_id))
+        validated_at = time.perf_counter()
+        metrics.STAGE_VALIDATION.observe(validated_at - started_at)
         logger.info("Validation completed. Result: %s",
                     "Valid" if national_id.is_valid else "Fake")
-        if national_id.is_valid:
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content={
-                    "data": national_id.__dict__,
-                    "message": " Valid ID .thanks for using TRU National ID Service",
-                    "code": SuccessCodeEnum.VALID_ID.value
-                }
-            )
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={
-                "data": national_id.__dict__,
-                "message": "Invalid ID .Thanks for using TRU National ID Service",
-                "code": ErrorCodeEnum.INVALID_ID.value
-            }
-        )
+        with tracing.span("response.encode"):
+            if wire.accepts_msgpack(request):
+                code = (SuccessCodeEnum.VALID_ID.value if national_id.is_valid
+                        else ErrorCodeEnum.INVALID_ID.value)
+                response = wire.MsgpackResponse(wire.result_row(code, national_id))
+            elif national_id.is_valid:
+                code = SuccessCodeEnum.VALID_ID.value
+                response = JSONResponse(
+                    status_code=status.HTTP_200_OK,
+                    content={
+                        "data": national_id.__dict__,
+                        "message": " Valid ID .thanks for using TRU National ID Service",
+                        "code": code
+                    }
+                )
+            else:
+                code = ErrorCodeEnum.INVALID_ID.value
+                response = JSONResponse(
+                    status_code=status.HTTP_200_OK,
+                    content={
+                        "data": national_id.__dict__,
+                        "message": "Invalid ID .Thanks for using TRU National ID Service",
+                        "code": code
+                    }
+                )
+        metrics.STAGE_SERIALIZATION.observe(time.perf_counter() - validated_at)
+        metrics.count_response(code)
+        request.state.outcome = code
+        return response
     except Exception as except_error:
         logger.critical("unhandled exception error: %s", except_error)
+        metrics.count_response(ErrorCodeEnum.SOMETHING_WENT_WRONG.value)
+        request.state.outcome = ErrorCodeEnum.SOMETHING_WENT_WRONG.value
+        if wire.accepts_msgpack(request):
+            return wire.MsgpackResponse(
+                wire.error_row(ErrorCodeEnum.SOMETHING_WENT_WRONG.value),
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={
@@ -137,3 +438,197 @@ async def validate_national_id(data: InputID, request: Request, valid_key: str =
                 "code": ErrorCodeEnum.SOMETHING_WENT_WRONG.value
             }
         )
+
+
+@router.post("/validate-ids", openapi_extra={"requestBody": {"required": True, "content": {
+    "application/json": {"schema": InputIDs.model_json_schema()},
+    "application/msgpack": {"schema": {"type": "array", "items": {"type": ["integer", "string"]}}},
+}}})
+@limiter.limit("100/minute")
+@limiter.limit("5/second")
+async def validate_national_ids(request: Request, national_ids: list[str | int] = Depends(verify_api_key_for_batch)):
+    """
+    Validates a batch of Egyptian National IDs, each one counts as a use of the key.
+
+    A malformed ID gets a `PARSING_ERROR` result instead of failing the batch.
+
+    Returns:
+        JSONResponse: one result per ID in the `/validate-id` format, in order,
+                      or a MessagePack array of positional results.
+    """
+    with tracing.span("national_id.validate", **{"batch.size": len(national_ids)}):
+        results = [wire.check_national_id(national_id) for national_id in national_ids]
+    for code, _ in results:
+        metrics.count_response(code)
+    all_valid = all(code == SuccessCodeEnum.VALID_ID.value for code, _ in results)
+    request.state.outcome = SuccessCodeEnum.VALID_ID.value if all_valid else ErrorCodeEnum.INVALID_ID.value
+
+    with tracing.span("response.encode"):
+        if wire.accepts_msgpack(request):
+            return wire.MsgpackResponse([wire.result_row(code, national_id) for code, national_id in results])
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "data": [
+                    {
+                        "data": national_id.__dict__ if national_id else None,
+                        "message": wire.RESULT_MESSAGES[code],
+                        "code": code,
+                    }
+                    for code, national_id in results
+                ],
+                "message": "Batch validated .Thanks for using TRU National ID Service",
+                "code": request.state.outcome,
+            }
+        )
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """ StreamingResponse whose content is produced while the request body is
+    still read: the body is left to the content, a disconnect surfaces from
+    `Request.stream()` as `ClientDisconnect` instead of through a listener.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/extract-ids", openapi_extra={"requestBody": {"required": True, "content": {
+    "text/plain": {"schema": {"type": "string"}},
+}}})
+@limiter.limit("100/minute")
+@limiter.limit("5/second")
+async def extract_national_ids(
+    request: Request,
+    x_api_key: str = Header(None),
+    key_store: KeyStore = Depends(app_key_store),
+):
+    """
+    Finds and validates the national IDs in a free text body (UTF-8, ASCII or
+    Arabic-Indic digits), scanned chunk by chunk as it is received. The
+    results of each chunk are sent as soon as it is scanned.
+
+    Each ID found counts as a use of the key, a text without any as one.
+
+    Raises:
+        HTTPException: with 401 or 503 from `validate_api_key`, with 413 if the
+                       declared `Content-Length` is larger than `EXTRACT_MAX_BYTES`.
+
+    Returns:
+        StreamingResponse: one JSON line per ID with its byte offsets `start`
+                           and `end`, the ASCII `national_id`, `code` and `data`.
+                           A body without `Content-Length` that grows past
+                           `EXTRACT_MAX_BYTES` ends the stream with a
+                           `PARSING_ERROR` line.
+    """
+    from app import extraction
+
+    await _check_api_key(key_store, x_api_key)
+    max_bytes = request.app.state.settings.EXTRACT_MAX_BYTES
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail={
+            "data": None,
+            "message": f"Text larger than {max_bytes} bytes",
+            "code": ErrorCodeEnum.PARSING_ERROR.value,
+        },
+    )
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise too_large
+
+    async def body():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise too_large
+            yield chunk
+
+    async def lines():
+        found = 0
+        request.state.outcome = ErrorCodeEnum.INVALID_ID.value
+        try:
+            with tracing.span("national_id.extract"):
+                async for matches in extraction.extract_ids_async(body()):
+                    found += len(matches)
+                    request.state.outcome = SuccessCodeEnum.VALID_ID.value
+                    for match in matches:
+                        metrics.count_response(match.code)
+                    for first in range(0, len(matches), EXTRACT_CHUNK_MATCHES):
+                        yield b"".join(json.dumps(match.to_dict()).encode() + b"\n"
+                                       for match in matches[first:first + EXTRACT_CHUNK_MATCHES])
+        except HTTPException as error:
+            request.state.outcome = error.detail["code"]
+            yield json.dumps(error.detail).encode() + b"\n"
+        finally:
+            if found > 1:
+                await key_store.credit(x_api_key, found - 1)
+
+    return BodyStreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/admission-stats")
+@limiter.exempt
+async def admission_stats(request: Request):
+    """
+    Queue depth and shed counters of this worker's admission control.
+
+    Returns:
+        JSONResponse: current admission counters.
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=request.app.state.admission.snapshot(),
+    )
+
+
+@router.get("/healthz")
+@limiter.exempt
+async def liveness(request: Request):
+    """
+    Liveness probe, from memory.
+
+    Returns:
+        Response: 200 while the health probe task keeps probing, 503 once it
+                  stopped or fell behind.
+    """
+    live = request.app.state.health.live()
+    return Response(
+        content=b'{"live":true}' if live else b'{"live":false}',
+        status_code=status.HTTP_200_OK if live else status.HTTP_503_SERVICE_UNAVAILABLE,
+        media_type="application/json",
+    )
+
+
+@router.get("/readyz")
+@limiter.exempt
+async def readiness(request: Request):
+    """
+    Readiness probe, the result of the last background probe, see `app/health.py`.
+
+    Returns:
+        Response: 200 when the worker is serving and its database, pool and
+                  usage flush checks passed, 503 otherwise, with the checks.
+    """
+    status_code, body = request.app.state.health.readiness
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+@router.get("/metrics")
+@limiter.exempt
+async def prometheus_metrics(request: Request):
+    """
+    Prometheus scrape endpoint, aggregated across workers in multiprocess mode.
+
+    Returns:
+        Response: metrics in the Prometheus text format.
+    """
+    metrics.refresh_gauges(request.app.state.db_manager, request.app.state.admission)
+    payload, content_type = metrics.render_metrics()
+    return Response(content=payload, media_type=content_type)
@@ -0,0 +1,294 @@
+"""
+Prometheus metrics for the API.
+
+Metrics are aggregated across uvicorn workers when the environment variable
+`PROMETHEUS_MULTIPROC_DIR` points to an empty, writable directory before the
+workers start. Without it every worker only reports its own numbers.
+
+Request-path metrics are recorded into plain per-worker buffers (a list
+increment and a float add) and flushed into the Prometheus values by the
+periodic refresher and before every scrape, so the hot path never takes the
+client library's locks or writes to its mmap files.
+"""
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Any
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from slowapi import Limiter
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import tracing
+from app.response_codes import ErrorCodeEnum, SuccessCodeEnum
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR: str | None = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_BUCKETS: tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+class BufferedHistogram:
+    """
+    Per-worker buffer in front of one labelled `Histogram` child.
+
+    Args:
+        child (Histogram): labelled child the buffer is flushed into.
+        buckets (tuple[float, ...]): the child's upper bounds, without `+Inf`.
+    """
+
+    def __init__(self, child: Histogram, buckets: tuple[float, ...]):
+        self._child = child
+        self._bounds = buckets
+        self._counts: list[int] = [0] * (len(buckets) + 1)
+        self._sum: float = 0.0
+
+    def observe(self, amount: float) -> None:
+        self._counts[bisect_left(self._bounds, amount)] += 1
+        self._sum += amount
+
+    def flush(self) -> None:
+        counts, self._counts = self._counts, [0] * len(self._counts)
+        amount, self._sum = self._sum, 0.0
+        if not any(counts):
+            return
+        # the client has no public bulk API, `observe` is per sample.
+        self._child._sum.inc(amount)
+        for bucket, count in zip(self._child._buckets, counts):
+            if count:
+                bucket.inc(count)
+
+
+class BufferedCounter:
+    """Per-worker buffer in front of one labelled `Counter` child."""
+
+    def __init__(self, child: Counter):
+        self._child = child
+        self._value: int = 0
+
+    def inc(self) -> None:
+        self._value += 1
+
+    def flush(self) -> None:
+        value, self._value = self._value, 0
+        if value:
+            self._child.inc(value)
+
+
+VALIDATE_ID_STAGE_SECONDS = Histogram(
+    "national_id_validate_id_stage_seconds",
+    "Time spent in each stage of a /validate-id request.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_RATE_LIMIT = BufferedHistogram(
+    VALIDATE_ID_STAGE_SECONDS.labels("rate_limit"), STAGE_BUCKETS)
+STAGE_VERIFY_API_KEY = BufferedHistogram(
+    VALIDATE_ID_STAGE_SECONDS.labels("verify_api_key"), STAGE_BUCKETS)
+STAGE_VALIDATION = BufferedHistogram(
+    VALIDATE_ID_STAGE_SECONDS.labels("validation"), STAGE_BUCKETS)
+STAGE_SERIALIZATION = BufferedHistogram(
+    VALIDATE_ID_STAGE_SECONDS.labels("serialization"), STAGE_BUCKETS)
+STAGE_TOTAL = BufferedHistogram(
+    VALIDATE_ID_STAGE_SECONDS.labels("total"), STAGE_BUCKETS)
+
+RESPONSES = Counter(
+    "national_id_responses",
+    "Responses by the `code` field of the response body.",
+    ["code"],
+)
+_RESPONSE_CODE_COUNTERS: dict[str, BufferedCounter] = {
+    code.value: BufferedCounter(RESPONSES.labels(code.value))
+    for code in (*SuccessCodeEnum, *ErrorCodeEnum)
+}
+
+_BUFFERS: list[BufferedHistogram | BufferedCounter] = [
+    STAGE_RATE_LIMIT,
+    STAGE_VERIFY_API_KEY,
+    STAGE_VALIDATION,
+    STAGE_SERIALIZATION,
+    STAGE_TOTAL,
+    *_RESPONSE_CODE_COUNTERS.values(),
+]
+
+ADMISSION_SHED = Counter(
+    "national_id_admission_shed",
+    "Requests shed by admission control.",
+    ["reason"],
+)
+ADMISSION_SHED_QUEUE_FULL = ADMISSION_SHED.labels("queue_full")
+ADMISSION_SHED_QUEUE_TIMEOUT = ADMISSION_SHED.labels("queue_timeout")
+ADMISSION_SHED_DEADLINE = ADMISSION_SHED.labels("deadline_exceeded")
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "national_id_admission_in_flight",
+    "Requests currently running.",
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "national_id_admission_queue_depth",
+    "Requests waiting for an execution slot.",
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "national_id_db_pool_connections",
+    "Database pool connections by state.",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+
+DB_REPLICA_HEALTHY = Gauge(
+    "national_id_db_replica_healthy",
+    "1 while a read replica is in the rotation of this worker, 0 otherwise.",
+    ["replica"],
+    multiprocess_mode="livemin",
+)
+
+AUDIT_RECORDS = Counter(
+    "national_id_audit_records",
+    "Audit records written to the database or dropped, see app/audit.py.",
+    ["outcome"],
+)
+
+CACHE_LOOKUPS = Counter(
+    "national_id_cache_lookups",
+    "In-process cache lookups by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+
+
+def count_response(code: str) -> None:
+    """Count one response by its body `code`."""
+    counter = _RESPONSE_CODE_COUNTERS.get(code)
+    if counter is None:
+        counter = _RESPONSE_CODE_COUNTERS[code] = BufferedCounter(
+            RESPONSES.labels(code))
+        _BUFFERS.append(counter)
+    counter.inc()
+
+
+def register_buffer(buffer: BufferedCounter | BufferedHistogram) -> Any:
+    """
+    Flush a buffer created outside this module with the others.
+
+    Returns:
+        BufferedCounter | BufferedHistogram: the registered buffer.
+    """
+    _BUFFERS.append(buffer)
+    return buffer
+
+
+def flush_buffers() -> None:
+    """Move everything recorded on the request path into the metrics."""
+    for buffer in _BUFFERS:
+        buffer.flush()
+
+
+def cache_counters(cache: str) -> tuple[BufferedCounter, BufferedCounter]:
+    """
+    Buffered hit and miss counters for one cache.
+
+    Args:
+        cache (str): cache name used as label.
+
+    Returns:
+        tuple[BufferedCounter, BufferedCounter]: `(hits, misses)` counters.
+    """
+    hits = register_buffer(BufferedCounter(CACHE_LOOKUPS.labels(cache, "hit")))
+    misses = register_buffer(BufferedCounter(CACHE_LOOKUPS.labels(cache, "miss")))
+    return hits, misses
+
+
+class TimedLimiter(Limiter):
+    """`Limiter` that records the time spent checking limits."""
+
+    def _check_request_limit(self, *args: Any, **kwargs: Any) -> None:
+        started_at = time.perf_counter()
+        try:
+            with tracing.span("rate_limit"):
+                super()._check_request_limit(*args, **kwargs)
+        finally:
+            STAGE_RATE_LIMIT.observe(time.perf_counter() - started_at)
+
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware recording the `total` stage for the given paths.
+
+    It should be the outermost middleware so the total includes admission
+    queueing and rate limiting.
+    """
+
+    def __init__(self, app: ASGIApp, paths: tuple[str, ...] = ("/validate-id",)):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            STAGE_TOTAL.observe(time.perf_counter() - started_at)
+
+
+def refresh_gauges(db_manager: Any, admission: Any) -> None:
+    """
+    Flush the request-path buffers and copy pool, replica and admission state of this
+    worker into the gauges.
+
+    Args:
+        db_manager (DatabaseManager): manager whose pool is reported.
+        admission (AdmissionController): admission controller of this worker.
+    """
+    flush_buffers()
+    for state, value in db_manager.pool_status().items():
+        DB_POOL_CONNECTIONS.labels(state).set(value)
+    for replica, healthy in db_manager.replica_health().items():
+        DB_REPLICA_HEALTHY.labels(replica).set(int(healthy))
+    ADMISSION_IN_FLIGHT.set(admission.in_flight)
+    ADMISSION_QUEUE_DEPTH.set(admission.queue_depth)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Render all metrics in the Prometheus text format.
+
+    Returns:
+        tuple[bytes, str]: payload and its content type.
+    """
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead() -> None:
+    """Flush this worker's buffers and drop its live gauges, called on shutdown."""
+    flush_buffers()
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def forget_worker(pid: int) -> None:
+    """Drop the live gauges of a worker that died without `mark_worker_dead`."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -24,12 +24,28 @@ class APIKeyUsage(Base):
         nullable=False,
     )
 
-    api_key: so.Mapped[str] = so.mapped_column(
-        sa.String(length=255),
+    # the key itself is never stored, see app/api_keys.py.
+    key_prefix: so.Mapped[str] = so.mapped_column(
+        sa.String(length=16),
         nullable=False,
         unique=True,
     )
 
+    key_salt: so.Mapped[str] = so.mapped_column(
+        sa.String(length=32),
+        nullable=False,
+    )
+
+    key_hash: so.Mapped[str] = so.mapped_column(
+        sa.String(length=64),
+        nullable=False,
+    )
+
+    revoked_at: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime(timezone=True),
+        nullable=True,
+    )
+
     usage_count: so.Mapped[int] = so.mapped_column(
         sa.Integer,
         nullable=False,
@@ -40,3 +56,40 @@ class APIKeyUsage(Base):
         sa.DateTime(timezone=True),
         nullable=True,
     )
+
+
+class APIKeyUsageHourly(Base):
+    """Uses of each company per hour, for billing reports."""
+
+    __tablename__ = "ApiKeyUsageHourly"
+
+    company_name: so.Mapped[str] = so.mapped_column(
+        sa.String(length=255),
+        primary_key=True,
+    )
+
+    # start of the hour, UTC.
+    hour: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime(timezone=True),
+        primary_key=True,
+    )
+
+    usage_count: so.Mapped[int] = so.mapped_column(
+        sa.BigInteger,
+        nullable=False,
+        server_default="0",
+    )
+
+
+# one row per validation request, see app/audit.py. Partitioned by day, the
+# partitions are created and dropped by the audit task.
+REQUEST_AUDIT = sa.Table(
+    "RequestAudit",
+    Base.metadata,
+    sa.Column("requested_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("key_prefix", sa.String(length=16), nullable=True),
+    sa.Column("endpoint", sa.String(length=64), nullable=False),
+    sa.Column("code", sa.String(length=32), nullable=False),
+    sa.Column("latency_ms", sa.Float, nullable=False),
+    postgresql_partition_by="RANGE (requested_at)",
+)
@@ -0,0 +1,200 @@
+"""
+Opt-in per-request sampling profiler.
+
+A profiled request gets a sampler thread that looks at the request task every
+`interval` seconds. When the task is running, the event loop thread's stack is
+recorded; when it is suspended (waiting for the DB pool, a row lock or the
+network), the task's chain of awaited coroutines is recorded with an
+`[awaiting]` leaf. Awaited time is therefore part of the profile, which
+`cProfile` would not show for coroutines.
+
+Profiles are written as collapsed stacks (`frame;frame;frame count`), the input
+format of flamegraph.pl, speedscope and most flamegraph viewers.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from types import FrameType
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+PROFILE_HEADER: bytes = b"x-profile-request"
+PROFILE_ID_HEADER: bytes = b"x-profile-id"
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _awaited_frames(task: asyncio.Task) -> list[FrameType]:
+    """Frames of the task's coroutine and everything it awaits, outermost first."""
+    frames: list[FrameType] = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = (getattr(awaitable, "cr_frame", None)
+                 or getattr(awaitable, "gi_frame", None)
+                 or getattr(awaitable, "ag_frame", None))
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = (getattr(awaitable, "cr_await", None)
+                     or getattr(awaitable, "gi_yieldfrom", None)
+                     or getattr(awaitable, "ag_await", None))
+    return frames
+
+
+class RequestSampler:
+    """
+    Samples one task from a background thread.
+
+    Args:
+        task (asyncio.Task): the task serving the request.
+        loop_thread_id (int): id of the thread running the event loop.
+        interval (float): seconds between samples.
+    """
+
+    def __init__(self, task: asyncio.Task, loop_thread_id: int, interval: float):
+        self.task = task
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.stacks: dict[str, int] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> dict[str, int]:
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as error:
+                logger.debug("[profiling] sample skipped: %s", error)
+
+    def _sample(self) -> None:
+        awaited = _awaited_frames(self.task)
+        if not awaited:
+            return
+        task_frame = awaited[0]
+
+        thread_stack: list[FrameType] = []
+        frame = sys._current_frames().get(self.loop_thread_id)
+        while frame is not None:
+            thread_stack.append(frame)
+            if frame is task_frame:
+                break
+            frame = frame.f_back
+
+        if thread_stack and thread_stack[-1] is task_frame:
+            # running on the loop thread right now
+            labels = [_frame_label(frame) for frame in reversed(thread_stack)]
+        else:
+            labels = [_frame_label(frame) for frame in awaited] + ["[awaiting]"]
+        stack = ";".join(labels)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+def write_profile(directory: Path, name: str, stacks: dict[str, int], max_files: int) -> Path:
+    """
+    Write collapsed stacks and drop the oldest profiles beyond `max_files`.
+
+    Returns:
+        Path: the written file.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.collapsed"
+    path.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.items()))
+
+    profiles = sorted(directory.glob("*.collapsed"), key=lambda profile: profile.stat().st_mtime)
+    for old_profile in profiles[:-max_files]:
+        old_profile.unlink(missing_ok=True)
+    return path
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling selected requests.
+
+    A request is profiled when its `X-Profile-Request` header equals the admin
+    key, or with probability `sample_rate`. Header-triggered responses carry
+    the profile name in `X-Profile-Id`.
+
+    It must sit inside `SlowAPIMiddleware`: `BaseHTTPMiddleware` runs the rest
+    of the stack in another task, which a sampler outside it would not see.
+
+    Args:
+        app (ASGIApp): the wrapped application.
+        admin_key (str | None): key accepted in the profiling header.
+        sample_rate (float): fraction of requests profiled without the header.
+        output_dir (str): where profiles are written.
+        max_files (int): profiles kept, the oldest are deleted.
+        interval (float): seconds between samples.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        admin_key: str | None = None,
+        sample_rate: float = 0.0,
+        output_dir: str = "profiles",
+        max_files: int = 100,
+        interval: float = 0.001,
+    ):
+        self.app = app
+        self.admin_key = admin_key.encode() if admin_key else None
+        self.sample_rate = sample_rate
+        self.output_dir = Path(output_dir)
+        self.max_files = max_files
+        self.interval = interval
+
+    def _requested_by_header(self, scope: Scope) -> bool:
+        if self.admin_key is None:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, self.admin_key)
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        by_header = self._requested_by_header(scope)
+        if not by_header and not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1_000_000_000:09d}-{scope['path'].strip('/').replace('/', '_') or 'root'}"
+
+        async def send_with_profile_id(message: Message) -> None:
+            if by_header and message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()),
+                                      (PROFILE_ID_HEADER, name.encode())]
+            await send(message)
+
+        sampler = RequestSampler(asyncio.current_task(), threading.get_ident(), self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            stacks = sampler.stop()
+            try:
+                path = await asyncio.to_thread(
+                    write_profile, self.output_dir, name, stacks, self.max_files)
+                logger.info("[profiling] profile written to %s", path)
+            except OSError as error:
+                logger.warning("[profiling] failed to write profile: %s", error)
@@ -8,6 +8,7 @@ class ErrorCodeEnum(Enum):
     SOMETHING_WENT_WRONG = "SOEMTHING_WENT_WRONG"
     TOO_MANY_REQUEST = "TOO_MANY_REQUEST"
     SERVICE_UNAVAILABLE = "SERVICE_UNAVAILABLE"
+    NOT_FOUND = "NOT_FOUND"
 
 
 class SuccessCodeEnum(Enum):
@@ -11,5 +11,16 @@ class InputID(BaseModel):
     """
     national_id: Annotated[
         Decimal,Field(ge=10000000000000, le=99999999999999)]
-    
 
+
+class InputIDs(BaseModel):
+    """ a batch of IDs, each is validated on its own so a malformed ID only
+    fails its own result.
+    """
+    national_ids: Annotated[list[str | int], Field(min_length=1)]
+
+
+class NewKey(BaseModel):
+    """ company an API key is issued to.
+    """
+    company_name: Annotated[str, Field(min_length=1, max_length=255)]
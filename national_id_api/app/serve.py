@@ -0,0 +1,260 @@
+"""
+Pre-fork server: `python -m app.serve`.
+
+The parent process loads what every worker only reads, binds the listening
+socket once and forks `SERVER_WORKERS` workers that all accept on it:
+
+* the validator and wire tables (`app.national_id`, `app.wire`,
+  `app.extraction`) are built at import;
+* the API key snapshot is loaded with `KeyStore.preload`, the workers keep it
+  until their first periodic reload instead of each querying the database at
+  startup.
+
+Those pages are shared copy-on-write. `gc.freeze()` keeps the collector from
+writing to them, so they stay shared. The parent starts no thread and keeps no
+connection open before forking; each worker builds its own app, event loop,
+log writer thread and connection pool in `create_app` and its lifespan.
+
+Pools: with `SERVER_DB_CONNECTIONS` set every worker's pool is capped at its
+share, so that the workers together never open more than the database allows
+for the service. Otherwise each gets `DATABASE_POOL_SIZE` plus
+`DATABASE_MAX_OVERFLOW`.
+
+Shutdown: SIGTERM or SIGINT to the parent is passed on as SIGTERM to every
+worker. A worker first answers `/readyz` with 503 for `SERVER_DRAIN_SECONDS`
+while it keeps serving, so the load balancer stops sending it traffic, then
+stops accepting, finishes its requests in flight and runs the lifespan
+shutdown, which writes its buffered usage counts, rollup and audit records.
+A second signal stops draining workers right away. Workers that die on
+their own are started again; one that fails to start stops the server.
+
+Set `PROMETHEUS_MULTIPROC_DIR` with more than one worker, see app/metrics.py.
+"""
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from types import FrameType
+
+import uvicorn
+
+from app import metrics, tracing
+from app.database_settings import DatabaseManager, database_manager
+from app.key_store import KeyStore, build_key_store
+from app.logging_config import stop_logging
+from app.settings import Settings, settings
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# exit code of a worker whose lifespan startup failed, as `uvicorn` uses it.
+STARTUP_FAILURE: int = 3
+
+
+def worker_count(settings: Settings) -> int:
+    return settings.SERVER_WORKERS or os.cpu_count() or 1
+
+
+def worker_pool(settings: Settings, workers: int) -> tuple[int, int]:
+    """
+    Pool size and overflow of each worker.
+
+    Args:
+        settings (Settings): the server settings.
+        workers (int): workers sharing `SERVER_DB_CONNECTIONS`.
+
+    Returns:
+        tuple[int, int]: `pool_size` and `max_overflow`.
+    """
+    if settings.SERVER_DB_CONNECTIONS is None:
+        return settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW
+    share = max(settings.SERVER_DB_CONNECTIONS // workers, 1)
+    pool_size = min(settings.DATABASE_POOL_SIZE, share)
+    return pool_size, share - pool_size
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    `uvicorn.Server` that turns not ready for `drain_seconds` before it stops.
+
+    Args:
+        config (uvicorn.Config): the server config, its app built by `create_app`.
+        drain_seconds (float): time between the stop signal and closing the socket.
+    """
+
+    def __init__(self, config: uvicorn.Config, drain_seconds: float = 0.0):
+        super().__init__(config)
+        self.drain_seconds = drain_seconds
+        self.draining_until: float | None = None
+
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        if self.draining_until is None and self.drain_seconds > 0:
+            self.draining_until = time.monotonic() + self.drain_seconds
+            self.config.app.state.health.set_serving(False)
+            logger.info("[DrainingServer] draining for %.1fs", self.drain_seconds)
+            return
+        if self.draining_until is not None and not self.should_exit and sig != signal.SIGINT:
+            return
+        super().handle_exit(sig, frame)
+        # exit with `run_worker`'s code rather than by raising the signal again.
+        self._captured_signals.clear()
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.draining_until is not None and time.monotonic() >= self.draining_until:
+            self.should_exit = True
+        return await super().on_tick(counter)
+
+
+def run_worker(sock: socket.socket, settings: Settings, key_store: KeyStore,
+               db_manager: DatabaseManager) -> int:
+    """
+    Serve on `sock` until stopped, in the current process.
+
+    Returns:
+        int: the process exit code.
+    """
+    from app.main import create_app
+
+    app = create_app(settings, key_store=key_store, db_manager=db_manager)
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        log_config=None,
+        access_log=settings.SERVER_ACCESS_LOG,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+    )
+    server = DrainingServer(config, drain_seconds=settings.SERVER_DRAIN_SECONDS)
+    server.run(sockets=[sock])
+    return 0 if server.started else STARTUP_FAILURE
+
+
+def bind(settings: Settings) -> socket.socket:
+    sock = socket.create_server((settings.SERVER_HOST, settings.SERVER_PORT), backlog=2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+async def preload(key_store: KeyStore) -> None:
+    """Load the key snapshot shared by the workers."""
+    try:
+        await key_store.preload()
+        logger.info("Preloaded %s %s keys", len(key_store.keys), key_store.backend)
+    except Exception as e:
+        logger.warning("Failed to preload the %s keys, each worker loads them: %s",
+                       key_store.backend, e)
+
+
+class Supervisor:
+    """
+    Parent process of the workers, see the module docstring.
+
+    Args:
+        sock (socket.socket): the bound listening socket.
+        settings (Settings): the settings of each worker.
+        workers (int): workers kept running.
+        key_store (KeyStore): the key store, its snapshot loaded, copied into each worker.
+        db_manager (DatabaseManager): the database, not initialized, copied into each worker.
+    """
+
+    def __init__(self, sock: socket.socket, settings: Settings, workers: int,
+                 key_store: KeyStore, db_manager: DatabaseManager):
+        self.sock = sock
+        self.settings = settings
+        self.workers = workers
+        self.key_store = key_store
+        self.db_manager = db_manager
+        self.children: set[int] = set()
+        self.stopping = False
+        self.exit_code = 0
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+        # worker process: never return into the parent's stack.
+        code = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            code = run_worker(self.sock, self.settings, self.key_store, self.db_manager)
+        except BaseException:
+            logger.exception("Worker %s failed", os.getpid())
+        finally:
+            tracing.stop_tracing()
+            stop_logging()
+            os._exit(code)
+
+    def stop(self, sig: int, frame: FrameType | None) -> None:
+        # a second signal stops draining workers right away.
+        forwarded = signal.SIGINT if self.stopping else signal.SIGTERM
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, forwarded)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info("Serving on %s:%s with %s workers",
+                    self.settings.SERVER_HOST, self.settings.SERVER_PORT, self.workers)
+        while self.children:
+            pid, status = os.wait()
+            self.children.discard(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+            metrics.forget_worker(pid)
+            if code == STARTUP_FAILURE:
+                logger.critical("Worker %s failed to start, stopping", pid)
+                self.exit_code = STARTUP_FAILURE
+                self.stop(signal.SIGTERM, None)
+                continue
+            logger.error("Worker %s exited with %s, starting another", pid, code)
+            time.sleep(1)
+            if not self.stopping:
+                self.spawn()
+        return self.exit_code
+
+
+def serve(settings: Settings = settings) -> int:
+    """
+    Run the server until it is stopped.
+
+    Returns:
+        int: the process exit code.
+    """
+    workers = worker_count(settings)
+    pool_size, max_overflow = worker_pool(settings, workers)
+    settings = settings.model_copy(update={"DATABASE_POOL_SIZE": pool_size, "DATABASE_MAX_OVERFLOW": max_overflow})
+    db_manager = database_manager(settings)
+    key_store = build_key_store(settings, db_manager)
+    sock = bind(settings)
+    if workers == 1:
+        return run_worker(sock, settings, key_store, db_manager)
+    if not hasattr(os, "fork"):
+        logger.critical("SERVER_WORKERS=%s needs os.fork, not available on %s", workers, sys.platform)
+        return 1
+    if not metrics.MULTIPROC_DIR:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set, /metrics only shows the worker answering")
+
+    # the tables built at import and the key snapshot, shared by the workers.
+    from app import extraction, main, national_id, wire  # noqa: F401
+    asyncio.run(preload(key_store))
+    gc.freeze()
+    return Supervisor(sock, settings, workers, key_store, db_manager).run()
+
+
+if __name__ == "__main__":
+    # plain logging in the parent, the queue and its writer thread are started by
+    # each worker's `create_app`.
+    logging.basicConfig(level=settings.LOG_LEVEL.upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    sys.exit(serve())
@@ -1,5 +1,6 @@
 from functools import lru_cache
 import os
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -22,6 +23,123 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     TEST_DATABASE_URL: str
 
+    # read replicas, e.g. DATABASE_REPLICA_URLS='["postgresql+asyncpg://...@replica-1/db"]'.
+    # Key lookups and reports read from them, usage counts are written to DATABASE_URL.
+    DATABASE_REPLICA_URLS: list[str] = []
+    DATABASE_REPLICA_HEALTH_CHECK_SECONDS: float = 5.0
+    # connection pool of each worker: DATABASE_POOL_SIZE connections kept open
+    # and up to DATABASE_MAX_OVERFLOW more under load. `python -m app.serve`
+    # overrides both from SERVER_DB_CONNECTIONS when it is set.
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    # connections each worker opens, with the auth statements prepared, before
+    # it serves; at most the pool size.
+    DATABASE_POOL_MIN_CONNECTIONS: int = 5
+
+    # where API keys and usage counts live, `postgres` (DATABASE_URL) or
+    # `sqlite` (a local file with batched usage writes), see app/key_store.py.
+    KEY_STORE_BACKEND: Literal["postgres", "sqlite"] = "postgres"
+    KEY_STORE_SQLITE_PATH: str = "data/keys.db"
+    KEY_STORE_FLUSH_SECONDS: float = 1.0
+    KEY_STORE_FLUSH_BATCH: int = 1000
+
+    # hourly usage per company, see app/usage_rollup.py. Reports of periods
+    # that ended USAGE_REPORT_SETTLE_SECONDS ago are cached, it should exceed
+    # the flush intervals.
+    USAGE_ROLLUP_FLUSH_SECONDS: float = 5.0
+    USAGE_REPORT_SETTLE_SECONDS: float = 60.0
+
+    # request audit log in the partitioned RequestAudit table of DATABASE_URL,
+    # see app/audit.py. Records are dropped when AUDIT_BUFFER_SIZE are waiting.
+    AUDIT_ENABLED: bool = False
+    AUDIT_BUFFER_SIZE: int = 100_000
+    AUDIT_FLUSH_BATCH: int = 5_000
+    AUDIT_FLUSH_SECONDS: float = 1.0
+    AUDIT_RETENTION_DAYS: int = 90
+    AUDIT_MAINTENANCE_SECONDS: float = 3600.0
+
+    # key for admin endpoints and headers, admin features are off without it.
+    ADMIN_API_KEY: str | None = None
+
+    # per client IP rate limits, switched off for load tests.
+    RATE_LIMIT_ENABLED: bool = True
+
+    # admission control, per worker process.
+    ADMISSION_MAX_IN_FLIGHT: int = 64
+    ADMISSION_MAX_QUEUE: int = 128
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+
+    # /healthz and /readyz, answered from the last background probe, see
+    # app/health.py. Not ready when the database does not answer within the
+    # timeout, fewer pool connections than HEALTH_MIN_POOL_HEADROOM are free or
+    # more than HEALTH_MAX_USAGE_BACKLOG uses wait to be written.
+    HEALTH_PROBE_SECONDS: float = 2.0
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 1.0
+    HEALTH_MIN_POOL_HEADROOM: int = 1
+    HEALTH_MAX_USAGE_BACKLOG: int = 1_000_000
+
+    # how often each worker copies pool and admission state into its gauges.
+    METRICS_REFRESH_SECONDS: float = 5.0
+
+    # logging, see app/logging_config.py.
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    LOG_QUEUE_SIZE: int = 10_000
+    # message template to the fraction of records kept, e.g.
+    # LOG_SAMPLING='{"Validation completed. Result: %s": 0.01}'
+    LOG_SAMPLING: dict[str, float] = {}
+
+    # per-request profiling, see app/profiling.py. Off unless a sample rate
+    # is set or ADMIN_API_KEY is sent in the `X-Profile-Request` header.
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_OUTPUT_DIR: str = "profiles"
+    PROFILING_MAX_FILES: int = 100
+    PROFILING_INTERVAL_SECONDS: float = 0.001
+
+    # request tracing, see app/tracing.py. Requests with a sampled W3C
+    # `traceparent` header are always traced.
+    TRACING_SAMPLE_RATE: float = 0.0
+    TRACING_BUFFER_SIZE: int = 10_000
+    # OTLP/JSON lines file, only the in-memory buffer is kept without it.
+    TRACING_EXPORT_PATH: str | None = None
+
+    # most IDs accepted by one /validate-ids request.
+    BATCH_MAX_IDS: int = 1000
+
+    # largest text accepted by /extract-ids, see app/extraction.py.
+    EXTRACT_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # response compression negotiated from Accept-Encoding, see app/compression.py.
+    # Responses under COMPRESSION_MIN_SIZE bytes (single ID results) are sent
+    # as they are, chunks of COMPRESSION_THREAD_MIN_SIZE bytes or more are
+    # compressed in a thread.
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_THREAD_MIN_SIZE: int = 256 * 1024
+
+    # `python -m app.serve`, see app/serve.py. SERVER_WORKERS=0 starts one
+    # worker per CPU. SERVER_DB_CONNECTIONS is the most connections all the
+    # workers may open together, split evenly into their pools. On SIGTERM a
+    # worker answers /readyz with 503 for SERVER_DRAIN_SECONDS while it keeps
+    # serving, then stops accepting and waits at most
+    # SERVER_GRACEFUL_SHUTDOWN_SECONDS for the requests in flight.
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1
+    SERVER_DB_CONNECTIONS: int | None = None
+    SERVER_DRAIN_SECONDS: float = 0.0
+    SERVER_GRACEFUL_SHUTDOWN_SECONDS: int = 30
+    SERVER_ACCESS_LOG: bool = True
+
+    # WebSocket validation channel, see app/streaming.py.
+    WS_WINDOW: int = 32
+    WS_MAX_BATCH: int = 1000
+    WS_USAGE_FLUSH_COUNT: int = 1000
+    WS_USAGE_FLUSH_SECONDS: float = 5.0
+
     model_config = SettingsConfigDict(
         env_file="test.env" if os.getenv("TEST_MODE") == "true" else ".env",
         extra="ignore",
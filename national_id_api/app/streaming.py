@@ -0,0 +1,273 @@
+"""
+WebSocket channel validating a stream of IDs over one authenticated connection.
+
+The API key is checked once when connecting (`X-API-Key` header or `api_key`
+query parameter) and the validated IDs are credited to it in batches, so the
+per-ID cost is the validation itself.
+
+After the server's `ready` message (carrying `window` and `max_batch`) the
+client sends frames without waiting for replies; every frame is answered in
+order and every result carries the correlation id it was sent with.
+
+Text frames hold JSON, one object or a list of up to `max_batch` objects:
+
+    {"id": 7, "national_id": "29001011234567"}
+
+and are answered with the `/validate-id` envelope plus the id, or a list of them:
+
+    {"id": 7, "data": {...}, "message": "...", "code": "VALID_ID"}
+
+Binary frames hold up to `max_batch` records of a big-endian uint32
+correlation id followed by the 14 ASCII digits (`BINARY_REQUEST`) and are
+answered with one `BINARY_RESULT` record per ID: correlation id, index of the
+code in `app.wire.CODES`, year, month, day, governorate id and gender
+(0 unknown, 1 male, 2 female). Fields of unparsable IDs are 0.
+
+With the audit log enabled (app/audit.py) every answered frame, and every
+refused connection, leaves one record: the frame's code, or for a list
+`VALID_ID` if all its IDs are valid and `INVALID_ID` otherwise, as
+`/validate-ids` does.
+
+Flow control: at most `window` frames are buffered per connection. Beyond that
+the server stops reading, and the client is slowed down by TCP backpressure.
+"""
+import asyncio
+import json
+import logging
+import struct
+import time
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, Header, WebSocket, status
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from app import metrics
+from app.api_keys import key_prefix
+from app.key_store import KeyStore, app_key_store
+from app.national_id import NationalID
+from app.response_codes import ErrorCodeEnum, SuccessCodeEnum
+from app.settings import Settings
+from app.wire import CODE_INDEX, GENDERS, RESULT_MESSAGES, check_national_id
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+BINARY_REQUEST = struct.Struct(">I14s")
+BINARY_RESULT = struct.Struct(">IBHBBBB")
+
+router = APIRouter()
+
+
+def encode_binary_result(correlation_id: int, code: str, national_id: NationalID | None) -> bytes:
+    if national_id is None:
+        return BINARY_RESULT.pack(correlation_id, CODE_INDEX[code], 0, 0, 0, 0, 0)
+    return BINARY_RESULT.pack(
+        correlation_id,
+        CODE_INDEX[code],
+        national_id.year_of_birth or 0,
+        national_id.month_of_birth or 0,
+        national_id.day_of_birth or 0,
+        national_id.governorate_id or 0,
+        GENDERS.index(national_id.gender),
+    )
+
+
+class FrameError(Exception):
+    """A frame that cannot be answered, the connection is closed with `close_code`."""
+
+    def __init__(self, close_code: int, reason: str):
+        super().__init__(reason)
+        self.close_code = close_code
+        self.reason = reason
+
+
+class UsageBatcher:
+    """
+    Credits validated IDs to an API key every `flush_count` IDs or
+    `flush_seconds`, whichever comes first, and when the connection closes.
+
+    Args:
+        key_store (KeyStore): where the uses are counted.
+        api_key (str): the connection's key.
+        flush_count (int): IDs that trigger a write.
+        flush_seconds (float): longest time IDs stay uncredited while the connection is open.
+    """
+
+    def __init__(self, key_store: KeyStore, api_key: str, flush_count: int, flush_seconds: float):
+        self.key_store = key_store
+        self.api_key = api_key
+        self.flush_count = flush_count
+        self.flush_seconds = flush_seconds
+        self.pending = 0
+        self._lock = asyncio.Lock()
+
+    async def add(self, count: int) -> None:
+        self.pending += count
+        if self.pending >= self.flush_count:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            count, self.pending = self.pending, 0
+            if not count:
+                return
+            try:
+                await self.key_store.credit(self.api_key, count)
+            except Exception as error:
+                # keep the uses and retry with the next batch.
+                self.pending += count
+                logger.error("[validate_id_stream] failed to credit %s uses: %s", count, error)
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+
+def frame_outcome(codes: list[str]) -> str:
+    """Audited code of a frame, see the module docstring."""
+    if len(codes) == 1:
+        return codes[0]
+    if all(code == SuccessCodeEnum.VALID_ID.value for code in codes):
+        return SuccessCodeEnum.VALID_ID.value
+    return ErrorCodeEnum.INVALID_ID.value
+
+
+def answer_text_frame(text: str, max_batch: int) -> tuple[str, int, str]:
+    """
+    Answer a JSON frame.
+
+    Returns:
+        tuple[str, int, str]: the reply, the number of IDs it answers and its
+                              audited code.
+    """
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        payload = None
+    items = payload if isinstance(payload, list) else [payload]
+    if len(items) > max_batch:
+        raise FrameError(status.WS_1009_MESSAGE_TOO_BIG, f"more than {max_batch} IDs in a frame")
+
+    results = []
+    for item in items:
+        if isinstance(item, dict):
+            correlation_id = item.get("id")
+            code, national_id = check_national_id(item.get("national_id"))
+        else:
+            correlation_id, code, national_id = None, ErrorCodeEnum.PARSING_ERROR.value, None
+        metrics.count_response(code)
+        results.append({
+            "id": correlation_id,
+            "data": national_id.__dict__ if national_id else None,
+            "message": RESULT_MESSAGES[code],
+            "code": code,
+        })
+    outcome = frame_outcome([result["code"] for result in results])
+    return json.dumps(results if isinstance(payload, list) else results[0]), len(items), outcome
+
+
+def answer_binary_frame(frame: bytes, max_batch: int) -> tuple[bytes, int, str]:
+    """
+    Answer a binary frame.
+
+    Returns:
+        tuple[bytes, int, str]: the reply, the number of IDs it answers and its
+                                audited code.
+    """
+    count, remainder = divmod(len(frame), BINARY_REQUEST.size)
+    if remainder or not count:
+        raise FrameError(status.WS_1007_INVALID_FRAME_PAYLOAD_DATA,
+                         f"binary frames hold {BINARY_REQUEST.size} byte records")
+    if count > max_batch:
+        raise FrameError(status.WS_1009_MESSAGE_TOO_BIG, f"more than {max_batch} IDs in a frame")
+
+    reply = bytearray()
+    codes = []
+    for correlation_id, digits in BINARY_REQUEST.iter_unpack(frame):
+        code, national_id = check_national_id(digits.decode("latin-1"))
+        metrics.count_response(code)
+        codes.append(code)
+        reply += encode_binary_result(correlation_id, code, national_id)
+    return bytes(reply), count, frame_outcome(codes)
+
+
+async def _receive_frames(websocket: WebSocket, frames: asyncio.Queue) -> None:
+    """Read frames into the bounded queue, `None` marks the disconnect."""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            await frames.put(message)
+    finally:
+        await frames.put(None)
+
+
+@router.websocket("/ws/validate-id")
+async def validate_id_stream(
+    websocket: WebSocket,
+    x_api_key: str | None = Header(None),
+    api_key: str | None = None,
+    key_store: KeyStore = Depends(app_key_store),
+):
+    """
+    Validate a stream of IDs, see the module docstring for the protocol.
+
+    Args:
+        websocket (WebSocket): the connection.
+        x_api_key (str | None): service api key.
+        api_key (str | None): service api key, for clients that cannot set headers.
+        key_store (KeyStore): where keys are stored.
+    """
+    key = x_api_key or api_key
+    audit_log = getattr(websocket.app.state, "audit_log", None)
+    prefix = key_prefix(key) if key else None
+
+    def audit(requested_at: datetime, started_at: float, code: str) -> None:
+        if audit_log is not None:
+            latency_ms = (time.perf_counter() - started_at) * 1000
+            audit_log.record((requested_at, prefix, websocket.scope["path"], code, latency_ms))
+
+    requested_at, started_at = datetime.now(timezone.utc), time.perf_counter()
+    try:
+        authorized = bool(key) and await key_store.exists(key)
+    except (OperationalError, DBAPIError) as db_error:
+        logger.error("[validate_id_stream] database error: %s", db_error)
+        metrics.count_response(ErrorCodeEnum.SERVICE_UNAVAILABLE.value)
+        audit(requested_at, started_at, ErrorCodeEnum.SERVICE_UNAVAILABLE.value)
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    if not authorized:
+        logger.error("[validate_id_stream] : no key found")
+        metrics.count_response(ErrorCodeEnum.UNAUTHORIZED.value)
+        audit(requested_at, started_at, ErrorCodeEnum.UNAUTHORIZED.value)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    settings: Settings = websocket.app.state.settings
+    max_batch = settings.WS_MAX_BATCH
+    await websocket.send_json({"type": "ready", "window": settings.WS_WINDOW, "max_batch": max_batch})
+
+    frames: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_WINDOW)
+    usage = UsageBatcher(key_store, key, settings.WS_USAGE_FLUSH_COUNT, settings.WS_USAGE_FLUSH_SECONDS)
+    receiver = asyncio.create_task(_receive_frames(websocket, frames))
+    flusher = asyncio.create_task(usage.flush_periodically())
+    try:
+        while (message := await frames.get()) is not None:
+            requested_at, started_at = datetime.now(timezone.utc), time.perf_counter()
+            if message.get("text") is not None:
+                reply, count, outcome = answer_text_frame(message["text"], max_batch)
+                await websocket.send_text(reply)
+            else:
+                reply, count, outcome = answer_binary_frame(message.get("bytes") or b"", max_batch)
+                await websocket.send_bytes(reply)
+            audit(requested_at, started_at, outcome)
+            await usage.add(count)
+    except FrameError as error:
+        logger.warning("[validate_id_stream] closing connection: %s", error.reason)
+        await websocket.close(code=error.close_code, reason=error.reason)
+    finally:
+        receiver.cancel()
+        flusher.cancel()
+        await usage.flush()
@@ -0,0 +1,390 @@
+"""
+Lightweight request tracing with a local, OpenTelemetry-compatible export.
+
+Spans are kept in an in-memory ring buffer (queryable through
+`/admin/traces`) and optionally appended as OTLP/JSON lines to a file by a
+writer thread. No collector is needed.
+
+A request is traced when it carries a W3C `traceparent` header with the sampled
+flag, or with probability `TRACING_SAMPLE_RATE`. For untraced requests `span()`
+returns a shared no-op context manager after one context variable lookup.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+SERVICE_NAME: str = "national-id-api"
+TRACEPARENT_HEADER: bytes = b"traceparent"
+
+STATUS_UNSET: int = 0
+STATUS_OK: int = 1
+STATUS_ERROR: int = 2
+
+SPAN_KIND_INTERNAL: int = 1
+SPAN_KIND_SERVER: int = 2
+SPAN_KIND_CLIENT: int = 3
+
+
+@dataclass
+class Span:
+    """ one timed operation, field names follow the OTLP span.
+    """
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    name: str
+    kind: int = SPAN_KIND_INTERNAL
+    start_time_unix_nano: int = 0
+    end_time_unix_nano: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    status_code: int = STATUS_UNSET
+    status_message: str = ""
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_time_unix_nano - self.start_time_unix_nano) / 1_000_000
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def to_otlp(self) -> dict[str, Any]:
+        otlp: dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time_unix_nano),
+            "endTimeUnixNano": str(self.end_time_unix_nano),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+        if self.parent_span_id:
+            otlp["parentSpanId"] = self.parent_span_id
+        return otlp
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def to_otlp_json(spans: Iterable[Span]) -> dict[str, Any]:
+    """Wrap spans in the OTLP/JSON `ExportTraceServiceRequest` envelope."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]
+    }
+
+
+class SpanStore:
+    """
+    Ring buffer of finished spans with an optional file export.
+
+    Args:
+        capacity (int): spans kept in memory, the oldest are dropped.
+        export_path (str | None): file receiving one OTLP/JSON object per
+            finished trace, written by a background thread until `close`.
+    """
+
+    def __init__(self, capacity: int = 10_000, export_path: str | None = None):
+        self.spans: deque[Span] = deque(maxlen=capacity)
+        self.export_path = export_path
+        self._export_queue: queue.SimpleQueue[list[Span] | None] | None = None
+        self._exporter: threading.Thread | None = None
+        if export_path:
+            self._export_queue = queue.SimpleQueue()
+            self._exporter = threading.Thread(target=self._write_exports, args=(self._export_queue,),
+                                              name="span-exporter", daemon=True)
+            self._exporter.start()
+
+    def add(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def export_trace(self, spans: list[Span]) -> None:
+        """Queue the finished spans of a trace, spans not ended yet are left out."""
+        if self._export_queue is None:
+            return
+        finished = [span for span in spans if span.end_time_unix_nano]
+        if finished:
+            self._export_queue.put(finished)
+
+    def close(self) -> None:
+        """Write the queued traces and stop the export thread."""
+        export_queue, self._export_queue = self._export_queue, None
+        if export_queue is not None:
+            export_queue.put(None)
+            self._exporter.join()
+            self._exporter = None
+
+    def _write_exports(self, export_queue: queue.SimpleQueue) -> None:
+        import json
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.export_path)), exist_ok=True)
+        with open(self.export_path, "a", encoding="utf-8") as export_file:
+            while (spans := export_queue.get()) is not None:
+                export_file.write(json.dumps(to_otlp_json(spans)) + "\n")
+                export_file.flush()
+
+    def traces(self, trace_id: str | None = None, min_duration_ms: float = 0.0,
+               limit: int = 50) -> list[Span]:
+        """
+        Spans of the most recent traces, newest first.
+
+        Args:
+            trace_id (str | None): only this trace.
+            min_duration_ms (float): only traces whose root span took at least this long.
+            limit (int): maximum number of traces.
+
+        Returns:
+            list[Span]: spans of the selected traces.
+        """
+        by_trace: dict[str, list[Span]] = {}
+        for span in list(self.spans):
+            if trace_id is None or span.trace_id == trace_id:
+                by_trace.setdefault(span.trace_id, []).append(span)
+
+        selected: list[Span] = []
+        for spans in reversed(list(by_trace.values())):
+            root = next((span for span in spans if span.kind == SPAN_KIND_SERVER), spans[-1])
+            if root.duration_ms < min_duration_ms:
+                continue
+            selected.extend(spans)
+            limit -= 1
+            if limit == 0:
+                break
+        return selected
+
+
+@dataclass
+class _Trace:
+    """ spans of the request being traced.
+    """
+    trace_id: str
+    spans: list[Span] = field(default_factory=list)
+
+
+_current_trace: ContextVar[_Trace | None] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+STORE: SpanStore = SpanStore()
+
+
+def configure(capacity: int, export_path: str | None) -> SpanStore:
+    """Replace the span store. Safe to call again, the previous store's export is stopped first."""
+    global STORE
+    STORE.close()
+    STORE = SpanStore(capacity=capacity, export_path=export_path)
+    return STORE
+
+
+def stop_tracing() -> None:
+    """Write the queued traces and stop the export thread."""
+    STORE.close()
+
+
+atexit.register(stop_tracing)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Span | None:
+    """Start a child of the current span, `None` when the request is not traced."""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = _current_span.get()
+    span = Span(
+        trace_id=trace.trace_id,
+        span_id=_new_id(64),
+        parent_span_id=parent.span_id if parent else None,
+        name=name,
+        kind=kind,
+        start_time_unix_nano=time.time_ns(),
+        attributes=attributes,
+    )
+    trace.spans.append(span)
+    return span
+
+
+def end_span(span: Span) -> None:
+    span.end_time_unix_nano = time.time_ns()
+    STORE.add(span)
+
+
+class _SpanContext:
+    """Context manager making its span current while it is open."""
+
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, span: Span):
+        self._span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc is not None:
+            self._span.set_error(exc)
+        _current_span.reset(self._token)
+        end_span(self._span)
+
+
+class _NoopSpanContext:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        return None
+
+
+_NOOP = _NoopSpanContext()
+
+
+def span(name: str, **attributes: Any) -> _SpanContext | _NoopSpanContext:
+    """
+    Time a block as a child of the current span.
+
+    Usage:
+        with tracing.span("national_id.validate") as current:
+            ...
+
+    `current` is `None` when the request is not traced.
+    """
+    if _current_trace.get() is None:
+        return _NOOP
+    return _SpanContext(start_span(name, **attributes))
+
+
+def _parse_traceparent(value: bytes) -> tuple[str, str, bool] | None:
+    """`(trace_id, parent_span_id, sampled)` of a W3C traceparent header."""
+    parts = value.decode("latin-1").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of traced requests.
+
+    Args:
+        app (ASGIApp): wrapped application.
+        sample_rate (float): fraction of requests without a sampled
+            `traceparent` that are traced.
+        exempt_paths (tuple[str, ...]): paths never traced.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float = 0.0, exempt_paths: tuple[str, ...] = ()):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER:
+                parent = _parse_traceparent(value)
+                break
+        sampled = parent[2] if parent else (
+            self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = _Trace(trace_id=parent[0] if parent else _new_id(128))
+        trace_token = _current_trace.set(trace)
+        root = start_span(f"{scope['method']} {scope['path']}", kind=SPAN_KIND_SERVER,
+                          **{"http.method": scope["method"], "http.target": scope["path"]})
+        root.parent_span_id = parent[1] if parent else None
+        span_token = _current_span.set(root)
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status_code = STATUS_ERROR
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as error:
+            root.set_error(error)
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            end_span(root)
+            STORE.export_trace(trace.spans)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Record a client span for every SQL statement run through `engine`.
+
+    The span covers the driver round trip, so for `SELECT ... FOR UPDATE` it
+    includes the time spent waiting for the row lock.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = start_span("db.statement", kind=SPAN_KIND_CLIENT, **{
+            "db.system": engine.dialect.name,
+            "db.statement": statement,
+        })
+        if started is not None and context is not None:
+            context._trace_span = started
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_trace_span", None)
+        if started is not None:
+            end_span(started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        started = getattr(context, "_trace_span", None)
+        if started is not None:
+            started.set_error(exception_context.original_exception)
+            end_span(started)
@@ -0,0 +1,145 @@
+"""
+Hourly usage per company, for billing.
+
+Key stores add every counted use to a `UsageRollup` in memory, keyed by
+company and hour. The buffered counts are written with one batched upsert into
+`ApiKeyUsageHourly` when the key store flushes, so the request path never
+writes a rollup row itself. `usage_report` answers range queries from the
+rollup table through its `(company_name, hour)` primary key; reports of closed
+periods, which cannot change anymore, are cached.
+"""
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.database_settings import DatabaseManager
+from app.models import APIKeyUsageHourly
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+HOURLY_TABLE = APIKeyUsageHourly.__table__
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def hour_of(moment: datetime) -> datetime:
+    """The start of the UTC hour of `moment`, naive datetimes are taken as UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert_statement(dialect: str) -> sa.Insert:
+    statement = _INSERTS[dialect](HOURLY_TABLE)
+    return statement.on_conflict_do_update(
+        index_elements=["company_name", "hour"],
+        set_={"usage_count": HOURLY_TABLE.c.usage_count + statement.excluded.usage_count},
+    )
+
+
+class UsageRollup:
+    """ uses per `(company_name, hour)` waiting to be written.
+    """
+
+    def __init__(self):
+        self._pending: dict[tuple[str, datetime], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def uses(self) -> int:
+        return sum(self._pending.values())
+
+    def add(self, company_name: str, count: int, at: datetime | None = None) -> None:
+        bucket = (company_name, hour_of(at or datetime.now(timezone.utc)))
+        self._pending[bucket] = self._pending.get(bucket, 0) + count
+
+    async def write(self, session: AsyncSession) -> int:
+        """
+        Upsert the buffered uses in `session`, the caller commits.
+
+        The buffer is emptied first and restored if the upsert fails, so uses
+        added meanwhile are kept either way.
+
+        Args:
+            session (AsyncSession): session on the primary database.
+
+        Returns:
+            int: number of rollup rows written.
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [
+            {"company_name": company_name, "hour": hour, "usage_count": uses}
+            for (company_name, hour), uses in pending.items()
+        ]
+        try:
+            await session.execute(_upsert_statement(session.get_bind().dialect.name), rows)
+        except Exception:
+            for bucket, uses in pending.items():
+                self._pending[bucket] = self._pending.get(bucket, 0) + uses
+            raise
+        return len(rows)
+
+
+_REPORT_CACHE: OrderedDict[tuple[str, datetime, datetime], dict] = OrderedDict()
+_REPORT_CACHE_SIZE = 1024
+_REPORT_CACHE_HITS, _REPORT_CACHE_MISSES = metrics.cache_counters("usage_report")
+
+
+async def usage_report(db_manager: DatabaseManager, company_name: str, start: datetime,
+                       end: datetime, settle_seconds: float = 60.0) -> dict:
+    """
+    Hourly uses of a company from the hour of `start` up to the hour of `end`,
+    excluded, read from a replica when there is one.
+
+    Periods that ended more than `settle_seconds` ago are closed: every worker
+    has flushed its uses for them, so their reports are cached.
+
+    Args:
+        db_manager (DatabaseManager): database holding the rollup table.
+        company_name (str): company of the report.
+        start (datetime): first hour of the period.
+        end (datetime): end of the period.
+        settle_seconds (float): time after which buffered uses are written.
+
+    Returns:
+        dict: `company_name`, `start`, `end`, `total` and the non-empty `hours`.
+    """
+    start, end = hour_of(start), hour_of(end)
+    closed = end <= datetime.now(timezone.utc) - timedelta(seconds=settle_seconds)
+    cache_key = (company_name, start, end)
+    if closed and (report := _REPORT_CACHE.get(cache_key)) is not None:
+        _REPORT_CACHE.move_to_end(cache_key)
+        _REPORT_CACHE_HITS.inc()
+        return report
+    _REPORT_CACHE_MISSES.inc()
+
+    query = (
+        sa.select(HOURLY_TABLE.c.hour, HOURLY_TABLE.c.usage_count)
+        .where(HOURLY_TABLE.c.company_name == company_name,
+               HOURLY_TABLE.c.hour >= start,
+               HOURLY_TABLE.c.hour < end)
+        .order_by(HOURLY_TABLE.c.hour)
+    )
+    rows = (await db_manager.read(query)).all()
+    hours = [{"hour": hour_of(hour).isoformat(), "usage_count": uses} for hour, uses in rows]
+    report = {
+        "company_name": company_name,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total": sum(row["usage_count"] for row in hours),
+        "hours": hours,
+    }
+
+    if closed:
+        _REPORT_CACHE[cache_key] = report
+        if len(_REPORT_CACHE) > _REPORT_CACHE_SIZE:
+            _REPORT_CACHE.popitem(last=False)
+    return report
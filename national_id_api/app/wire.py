@@ -0,0 +1,132 @@
+"""
+MessagePack encoding of requests and results, negotiated per request.
+
+Clients opt in with `Content-Type: application/msgpack` (the body is the ID,
+an integer or a 14 character string, or an array of them for `/validate-ids`)
+and `Accept: application/msgpack`. Results are then a fixed positional array,
+`RESULT_FIELDS`, instead of the JSON envelope:
+
+    [code, year_of_birth, month_of_birth, day_of_birth, governorate_id, gender, century]
+
+`code` is an index into `CODES`, which also covers the failure codes, and
+`gender` an index into `GENDERS`. Fields that are not known are `nil`, failures
+other than `INVALID_ID` and `PARSING_ERROR` only carry the code. New codes and
+fields are only ever appended.
+
+JSON stays the default for both directions.
+"""
+import json
+from typing import Any
+
+import msgpack
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+
+from app.national_id import NationalID
+from app.response_codes import ErrorCodeEnum, SuccessCodeEnum
+
+MSGPACK_MEDIA_TYPES: tuple[str, ...] = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+CODES: tuple[str, ...] = (
+    SuccessCodeEnum.VALID_ID.value,
+    ErrorCodeEnum.INVALID_ID.value,
+    ErrorCodeEnum.PARSING_ERROR.value,
+    ErrorCodeEnum.UNAUTHORIZED.value,
+    ErrorCodeEnum.SOMETHING_WENT_WRONG.value,
+    ErrorCodeEnum.TOO_MANY_REQUEST.value,
+    ErrorCodeEnum.SERVICE_UNAVAILABLE.value,
+)
+CODE_INDEX: dict[str, int] = {code: index for index, code in enumerate(CODES)}
+RESULT_MESSAGES: dict[str, str] = {
+    SuccessCodeEnum.VALID_ID.value: " Valid ID .thanks for using TRU National ID Service",
+    ErrorCodeEnum.INVALID_ID.value: "Invalid ID .Thanks for using TRU National ID Service",
+    ErrorCodeEnum.PARSING_ERROR.value: "Validation failed: national_id must be 14 digits",
+}
+GENDERS: tuple[str | None, ...] = (None, "Male", "Female")
+RESULT_FIELDS: tuple[str, ...] = (
+    "code",
+    "year_of_birth",
+    "month_of_birth",
+    "day_of_birth",
+    "governorate_id",
+    "gender",
+    "century",
+)
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content)
+
+
+def sends_msgpack(request: Request) -> bool:
+    content_type = request.headers.get("content-type", "")
+    return content_type.split(";", 1)[0].strip() in MSGPACK_MEDIA_TYPES
+
+
+def accepts_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+async def read_body(request: Request) -> Any:
+    """
+    Decode the request body as MessagePack or JSON, depending on its content type.
+
+    Raises:
+        RequestValidationError: if the body cannot be decoded.
+    """
+    body = await request.body()
+    try:
+        if sends_msgpack(request):
+            return msgpack.unpackb(body)
+        return json.loads(body)
+    except (ValueError, TypeError, msgpack.UnpackException) as decode_error:
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ("body",), "msg": str(decode_error), "input": {}}],
+            body=body,
+        ) from decode_error
+
+
+def check_national_id(value: Any) -> tuple[str, NationalID | None]:
+    """
+    Validate one ID received outside the `InputID` schema.
+
+    Args:
+        value (Any): the ID as a string or an integer.
+
+    Returns:
+        tuple[str, NationalID | None]: the response code, and the parsed ID
+        unless the code is `PARSING_ERROR`.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or len(value) != 14 or not (value.isascii() and value.isdigit()):
+        return ErrorCodeEnum.PARSING_ERROR.value, None
+    national_id = NationalID(id_number=value)
+    if national_id.is_valid:
+        return SuccessCodeEnum.VALID_ID.value, national_id
+    return ErrorCodeEnum.INVALID_ID.value, national_id
+
+
+def result_row(code: str, national_id: NationalID | None) -> list[Any]:
+    """The positional `RESULT_FIELDS` of one result."""
+    if national_id is None:
+        return error_row(code)
+    return [
+        CODE_INDEX[code],
+        national_id.year_of_birth,
+        national_id.month_of_birth,
+        national_id.day_of_birth,
+        national_id.governorate_id,
+        GENDERS.index(national_id.gender),
+        national_id.century,
+    ]
+
+
+def error_row(code: str) -> list[Any]:
+    """The positional `RESULT_FIELDS` of a failure without a parsed ID."""
+    return [CODE_INDEX.get(code, CODE_INDEX[ErrorCodeEnum.SOMETHING_WENT_WRONG.value])] + [None] * (len(RESULT_FIELDS) - 1)
@@ -0,0 +1,94 @@
+"""
+`validate_api_key` against a real Postgres and an embedded SQLite key store.
+
+Uses `BENCH_DATABASE_URL`, falling back to `TEST_DATABASE_URL`, e.g. the
+docker-compose database on `localhost:5433` after `alembic upgrade head`.
+The SQLite store lives in a temporary directory.
+"""
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncGenerator
+
+from fastapi import HTTPException
+
+from app.database_operations import validate_api_key
+from app.database_settings import DatabaseManager
+from app.key_store import KeyStore, PostgresKeyStore, SQLiteKeyStore
+from benchmarks.harness import BenchmarkResult, bench_async
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+BENCH_API_KEY: str = "benchmark-api-key"
+
+
+@asynccontextmanager
+async def benchmark_api_key(key_store: KeyStore) -> AsyncGenerator[str, None]:
+    """Create a throwaway key for the run and delete it afterwards."""
+    await key_store.seed(company_name="Benchmark", api_key=BENCH_API_KEY)
+    try:
+        yield BENCH_API_KEY
+    finally:
+        await key_store.flush()
+        await key_store.delete(BENCH_API_KEY)
+
+
+async def database_available(db_manager: DatabaseManager) -> bool:
+    try:
+        await db_manager.validate_connection()
+        return True
+    except Exception as error:
+        logger.warning("[bench_api_key] database unavailable, skipped: %s", error)
+        return False
+
+
+async def rejected(key_store: KeyStore) -> None:
+    try:
+        await validate_api_key(key_store, "unknown-benchmark-key")
+    except HTTPException:
+        pass
+
+
+async def accepted(key_store: KeyStore, api_key: str) -> None:
+    await validate_api_key(key_store, api_key)
+
+
+async def bench_key_store(key_store: KeyStore, iterations: int) -> list[BenchmarkResult]:
+    async with benchmark_api_key(key_store) as api_key:
+        return [
+            await bench_async(f"validate_api_key.{key_store.backend}.valid",
+                              lambda: accepted(key_store, api_key), iterations),
+            await bench_async(f"validate_api_key.{key_store.backend}.unknown",
+                              lambda: rejected(key_store), iterations),
+        ]
+
+
+async def run(database_url: str, iterations: int) -> list[BenchmarkResult]:
+    """
+    Benchmark a valid and an unknown key on every key store backend.
+
+    Args:
+        database_url (str): asyncpg database url.
+        iterations (int): validations per case.
+
+    Returns:
+        list[BenchmarkResult]: results, without Postgres if it is unreachable.
+    """
+    results: list[BenchmarkResult] = []
+    db_manager = DatabaseManager(database_url)
+    db_manager.initialize()
+    try:
+        if await database_available(db_manager):
+            results += await bench_key_store(PostgresKeyStore(db_manager), iterations)
+    finally:
+        await db_manager.dispose()
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_store = SQLiteKeyStore(str(Path(directory) / "keys.db"))
+        await sqlite_store.initialize()
+        try:
+            results += await bench_key_store(sqlite_store, iterations)
+        finally:
+            await sqlite_store.close()
+    return results
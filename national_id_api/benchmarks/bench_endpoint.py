@@ -0,0 +1,56 @@
+"""
+End-to-end `/validate-id` through an in-process ASGI client.
+
+The rate limiter is disabled for the run, otherwise nearly every request
+would be answered with 429. Needs the same database as `bench_api_key`.
+"""
+import httpx
+
+from app.database_settings import DatabaseManager
+from app.key_store import PostgresKeyStore
+from app.main import create_app, limiter
+from benchmarks.bench_api_key import benchmark_api_key, database_available
+from benchmarks.harness import BenchmarkResult, bench_async
+
+VALID_ID: int = 29905228800910
+INVALID_ID: int = 29902308800910
+
+
+async def run(database_url: str, iterations: int) -> list[BenchmarkResult]:
+    """
+    Benchmark a valid and an invalid ID through the whole ASGI stack.
+
+    Args:
+        database_url (str): asyncpg database url.
+        iterations (int): requests per case.
+
+    Returns:
+        list[BenchmarkResult]: results, empty if the database is unreachable.
+    """
+    db_manager = DatabaseManager(database_url)
+    db_manager.initialize()
+
+    key_store = PostgresKeyStore(db_manager)
+    app = create_app(key_store=key_store, db_manager=db_manager)
+    limiter_was_enabled, limiter.enabled = limiter.enabled, False
+    try:
+        if not await database_available(db_manager):
+            return []
+        async with benchmark_api_key(key_store) as api_key:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                         headers={"x-api-key": api_key}) as client:
+
+                async def post(national_id: int) -> None:
+                    response = await client.post("/validate-id", json={"national_id": national_id})
+                    response.raise_for_status()
+
+                return [
+                    await bench_async("endpoint.validate_id.valid",
+                                      lambda: post(VALID_ID), iterations),
+                    await bench_async("endpoint.validate_id.invalid",
+                                      lambda: post(INVALID_ID), iterations),
+                ]
+    finally:
+        limiter.enabled = limiter_was_enabled
+        await db_manager.dispose()
@@ -0,0 +1,33 @@
+"""
+Hot-path cost of the /validate-id instrumentation, see `app/metrics.py`.
+"""
+from time import perf_counter
+
+from app import metrics
+from benchmarks.harness import BenchmarkResult, bench
+
+
+def record_one_request() -> None:
+    started_at = perf_counter()
+    metrics.STAGE_RATE_LIMIT.observe(perf_counter() - started_at)
+    metrics.STAGE_VERIFY_API_KEY.observe(perf_counter() - started_at)
+    metrics.STAGE_VALIDATION.observe(perf_counter() - started_at)
+    metrics.STAGE_SERIALIZATION.observe(perf_counter() - started_at)
+    metrics.STAGE_TOTAL.observe(perf_counter() - started_at)
+    metrics.count_response("VALID_ID")
+
+
+def run(iterations: int) -> list[BenchmarkResult]:
+    """
+    Benchmark recording one request and flushing the buffers.
+
+    Args:
+        iterations (int): recorded requests.
+
+    Returns:
+        list[BenchmarkResult]: record and flush results.
+    """
+    recorded = bench("metrics.record_request", record_one_request, iterations)
+    flushed = bench("metrics.flush", lambda: (record_one_request(), metrics.flush_buffers()),
+                    max(iterations // 10, 1))
+    return [recorded, flushed]
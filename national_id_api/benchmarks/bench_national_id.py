@@ -0,0 +1,33 @@
+"""
+`NationalID` construction for a valid ID and each kind of invalid ID.
+"""
+from app.national_id import NationalID
+from benchmarks.harness import BenchmarkResult, bench
+
+CASES: dict[str, str] = {
+    "valid": "29905228800910",
+    "invalid_length": "2990522880091",
+    # a non digit in the last position, earlier ones make the parser raise.
+    "non_digit": "2990522880091x",
+    "invalid_century": "49905228800910",
+    "future_year": "39905228800910",
+    "invalid_month": "29913228800910",
+    "feb_30": "29902308800910",
+    "invalid_governorate": "29905229900910",
+}
+
+
+def run(iterations: int) -> list[BenchmarkResult]:
+    """
+    Benchmark every case.
+
+    Args:
+        iterations (int): constructions per case.
+
+    Returns:
+        list[BenchmarkResult]: one result per case.
+    """
+    return [
+        bench(f"national_id.{case}", lambda id_number=id_number: NationalID(id_number=id_number), iterations)
+        for case, id_number in CASES.items()
+    ]
@@ -0,0 +1,97 @@
+"""
+Time to first request of a new worker process.
+
+Each run starts a fresh interpreter that imports `app.main`, builds the app
+with `create_app`, runs its lifespan (including the warm-up) and sends one
+`/validate-id` request through an in-process ASGI client. The key store is
+SQLite in a temporary directory, seeded once beforehand, so no database server
+is needed. Three cases per run, all measured from the moment the process was
+spawned except the last:
+
+* `startup.ready`: lifespan done, the worker would report ready.
+* `startup.first_request`: first response received.
+* `startup.first_request.latency`: the first request alone.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.harness import BenchmarkResult, summarize
+
+VALID_ID: int = 29905228800910
+API_KEY: str = "benchmark-api-key"
+CASES: tuple[str, ...] = ("startup.ready", "startup.first_request", "startup.first_request.latency")
+
+
+async def seed(path: str) -> None:
+    from app.key_store import SQLiteKeyStore
+
+    key_store = SQLiteKeyStore(path)
+    await key_store.initialize()
+    try:
+        await key_store.seed(company_name="Benchmark", api_key=API_KEY)
+    finally:
+        await key_store.close()
+        await key_store.db_manager.dispose()
+
+
+async def first_request(spawned_at: float) -> dict[str, float]:
+    """Start the app and send one request, the child process side of a run."""
+    import httpx
+
+    from app.main import create_app, lifespan
+
+    app = create_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"x-api-key": API_KEY}) as client:
+        async with lifespan(app):
+            ready_at = time.time()
+            response = await client.post("/validate-id", json={"national_id": VALID_ID})
+            answered_at = time.time()
+            response.raise_for_status()
+    return {
+        "startup.ready": ready_at - spawned_at,
+        "startup.first_request": answered_at - spawned_at,
+        "startup.first_request.latency": answered_at - ready_at,
+    }
+
+
+async def run(runs: int) -> list[BenchmarkResult]:
+    """
+    Start `runs` worker processes one after the other.
+
+    Args:
+        runs (int): processes started.
+
+    Returns:
+        list[BenchmarkResult]: one result per case, "ops/s" being starts per second.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "keys.db")
+        await seed(path)
+        env = {**os.environ, "KEY_STORE_BACKEND": "sqlite", "KEY_STORE_SQLITE_PATH": path,
+               "RATE_LIMIT_ENABLED": "false", "LOG_LEVEL": "WARNING"}
+        samples: dict[str, list[int]] = {case: [] for case in CASES}
+        started_at = time.perf_counter()
+        for _ in range(runs):
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "benchmarks.bench_startup", str(time.time()),
+                env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+            output, errors = await process.communicate()
+            if process.returncode:
+                raise RuntimeError(f"worker failed to start: {errors.decode()[-2000:]}")
+            for case, seconds in json.loads(output.decode().splitlines()[-1]).items():
+                samples[case].append(int(seconds * 1e9))
+        wall_seconds = time.perf_counter() - started_at
+    return [summarize(case, samples[case], wall_seconds) for case in CASES]
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(first_request(float(sys.argv[1])))))
@@ -0,0 +1,202 @@
+"""
+Timing, reporting and baseline comparison shared by the benchmarks.
+"""
+import json
+import math
+import platform
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+
+@dataclass
+class BenchmarkResult:
+    """ outcome of one benchmark case.
+    """
+    name: str
+    iterations: int
+    ops_per_second: float
+    p50_us: float
+    p99_us: float
+
+    def row(self) -> str:
+        return (f"{self.name:<45} {self.ops_per_second:>14,.0f} ops/s "
+                f"{self.p50_us:>10.2f} us p50 {self.p99_us:>10.2f} us p99")
+
+
+def percentile(sorted_samples: list[int], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples: the smallest sample
+    with at least `fraction` of the samples at or below it."""
+    return sorted_samples[max(math.ceil(fraction * len(sorted_samples)) - 1, 0)]
+
+
+def summarize(name: str, samples_ns: list[int], wall_seconds: float) -> BenchmarkResult:
+    """
+    Build a result from per-operation latencies.
+
+    Args:
+        name (str): benchmark case name.
+        samples_ns (list[int]): latency of each operation in nanoseconds.
+        wall_seconds (float): total time of the measured loop.
+
+    Returns:
+        BenchmarkResult: throughput and latency percentiles.
+    """
+    samples_ns.sort()
+    return BenchmarkResult(
+        name=name,
+        iterations=len(samples_ns),
+        ops_per_second=len(samples_ns) / wall_seconds,
+        p50_us=statistics.median(samples_ns) / 1000,
+        p99_us=percentile(samples_ns, 0.99) / 1000,
+    )
+
+
+def bench(name: str, operation: Callable[[], Any], iterations: int, warmup: int = 100) -> BenchmarkResult:
+    """
+    Time a synchronous operation one call at a time.
+
+    Args:
+        name (str): benchmark case name.
+        operation (Callable[[], Any]): the operation, called without arguments.
+        iterations (int): measured calls.
+        warmup (int): calls made before measuring.
+
+    Returns:
+        BenchmarkResult: result of the case.
+    """
+    for _ in range(warmup):
+        operation()
+    clock = time.perf_counter_ns
+    samples = [0] * iterations
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        op_started_at = clock()
+        operation()
+        samples[i] = clock() - op_started_at
+    return summarize(name, samples, time.perf_counter() - started_at)
+
+
+async def bench_async(name: str, operation: Callable[[], Awaitable[Any]], iterations: int, warmup: int = 20) -> BenchmarkResult:
+    """
+    Time an asynchronous operation one await at a time.
+
+    Args:
+        name (str): benchmark case name.
+        operation (Callable[[], Awaitable[Any]]): returns the awaitable to time.
+        iterations (int): measured awaits.
+        warmup (int): awaits made before measuring.
+
+    Returns:
+        BenchmarkResult: result of the case.
+    """
+    for _ in range(warmup):
+        await operation()
+    clock = time.perf_counter_ns
+    samples = [0] * iterations
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        op_started_at = clock()
+        await operation()
+        samples[i] = clock() - op_started_at
+    return summarize(name, samples, time.perf_counter() - started_at)
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram with about 1% precision.
+
+    Values (integer microseconds) are truncated to their 8 most significant
+    bits, so memory stays small however many values are recorded and
+    histograms of several runs or processes can be merged.
+    """
+
+    SIGNIFICANT_BITS: int = 8
+
+    def __init__(self, counts: dict[int, int] | None = None):
+        self.counts: dict[int, int] = counts or {}
+        self.total: int = sum(self.counts.values())
+
+    def record(self, value_us: int) -> None:
+        shift = value_us.bit_length() - self.SIGNIFICANT_BITS
+        if shift > 0:
+            value_us = value_us >> shift << shift
+        self.counts[value_us] = self.counts.get(value_us, 0) + 1
+        self.total += 1
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.total += other.total
+
+    def percentile(self, fraction: float) -> int:
+        """Smallest recorded value with at least `fraction` of values at or below it."""
+        if not self.total:
+            return 0
+        rank = max(fraction * self.total, 1)
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen >= rank:
+                return value
+        return max(self.counts)
+
+    def summary(self) -> dict[str, int]:
+        return {
+            f"p{label}_us": self.percentile(fraction)
+            for label, fraction in (("50", 0.5), ("90", 0.9), ("99", 0.99),
+                                    ("99.9", 0.999), ("100", 1.0))
+        }
+
+
+def save_results(results: list[BenchmarkResult], path: Path) -> None:
+    """Write results with some context about the machine as JSON."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": [asdict(result) for result in results],
+    }, indent=2))
+
+
+def load_results(path: Path) -> dict[str, BenchmarkResult]:
+    """Read results written by `save_results`, keyed by case name."""
+    payload = json.loads(path.read_text())
+    return {entry["name"]: BenchmarkResult(**entry) for entry in payload["results"]}
+
+
+def find_regressions(
+    results: list[BenchmarkResult],
+    baseline: dict[str, BenchmarkResult],
+    threshold: float,
+    p99_threshold: float,
+) -> list[str]:
+    """
+    Compare results with a baseline.
+
+    A case regresses when its throughput drops by more than `threshold` or its
+    p99 latency grows by more than `p99_threshold` (both fractions). Cases
+    missing from the baseline are ignored.
+
+    Returns:
+        list[str]: one description per regression, empty if none.
+    """
+    regressions: list[str] = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if reference is None:
+            continue
+        if result.ops_per_second < reference.ops_per_second * (1 - threshold):
+            regressions.append(
+                f"{result.name}: {result.ops_per_second:,.0f} ops/s, "
+                f"baseline {reference.ops_per_second:,.0f} ops/s")
+        if result.p99_us > reference.p99_us * (1 + p99_threshold):
+            regressions.append(
+                f"{result.name}: p99 {result.p99_us:.2f} us, "
+                f"baseline {reference.p99_us:.2f} us")
+    return regressions
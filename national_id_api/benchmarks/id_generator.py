@@ -0,0 +1,233 @@
+"""
+Vectorized synthetic national ID generator for load tests and benchmarks.
+
+Every ID is labelled with the kind it was generated as, so the output also
+serves as a test oracle: `valid` IDs must be answered with `VALID_ID`, the
+invalid kinds with `INVALID_ID` and `non_digit` with `PARSING_ERROR` (the API
+rejects it before the validator runs).
+
+From `national_id_api`:
+
+    python -m benchmarks.id_generator --count 5000000 --seed 7 ids.csv
+    python -m benchmarks.id_generator --count 1000 --mix valid=0.5,feb_30=0.5 -
+
+Each output line is `<id>,<kind code>` with the codes in `KIND_CODES`.
+"""
+import argparse
+import sys
+import time
+from datetime import date
+from functools import lru_cache
+from typing import BinaryIO, Iterator
+
+import numpy as np
+
+from app.national_id import Governorates
+from app.response_codes import ErrorCodeEnum, SuccessCodeEnum
+
+KINDS: tuple[str, ...] = (
+    "valid",
+    "invalid_century",
+    "future_year",
+    "feb_30",
+    "unknown_governorate",
+    "non_digit",
+)
+KIND_CODES: dict[str, str] = {
+    "valid": "v",
+    "invalid_century": "c",
+    "future_year": "f",
+    "feb_30": "d",
+    "unknown_governorate": "g",
+    "non_digit": "n",
+}
+EXPECTED_CODES: dict[str, str] = {
+    "valid": SuccessCodeEnum.VALID_ID.value,
+    "invalid_century": ErrorCodeEnum.INVALID_ID.value,
+    "future_year": ErrorCodeEnum.INVALID_ID.value,
+    "feb_30": ErrorCodeEnum.INVALID_ID.value,
+    "unknown_governorate": ErrorCodeEnum.INVALID_ID.value,
+    "non_digit": ErrorCodeEnum.PARSING_ERROR.value,
+}
+DEFAULT_MIX: dict[str, float] = {
+    "valid": 0.9,
+    "invalid_century": 0.02,
+    "future_year": 0.02,
+    "feb_30": 0.02,
+    "unknown_governorate": 0.02,
+    "non_digit": 0.02,
+}
+
+ID_LENGTH: int = 14
+LINE_LENGTH: int = ID_LENGTH + 3  # `,<code>\n`
+FIRST_BIRTH_DATE = np.datetime64("1900-01-01")
+
+GOVERNORATE_CODES = np.array([governorate.value for governorate in Governorates], dtype=np.int64)
+UNKNOWN_GOVERNORATE_CODES = np.setdiff1d(np.arange(100), GOVERNORATE_CODES)
+INVALID_CENTURIES = np.array([1, 4, 5, 6, 7, 8, 9], dtype=np.int64)
+# `e` is left out: `...e12` still parses as a number (an exponent) and would be
+# answered with `INVALID_ID` instead of `PARSING_ERROR`.
+NON_DIGIT_LETTERS = np.frombuffer(b"abcdfghijklmnopqrstuvwxyz", dtype=np.uint8)
+# the century digit 3 only covers 2000-2099, so no future year is left after 2098.
+LAST_FUTURE_YEAR_TODAY: int = 2098
+_KIND_CODE_BYTES = np.frombuffer("".join(KIND_CODES[kind] for kind in KINDS).encode(), dtype=np.uint8)
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """
+    Parse `kind=fraction,...` into a normalized mix.
+
+    Raises:
+        ValueError: on unknown kinds or fractions that do not sum up to more than 0.
+    """
+    mix = {kind: 0.0 for kind in KINDS}
+    for part in text.split(","):
+        kind, _, fraction = part.partition("=")
+        if kind.strip() not in mix:
+            raise ValueError(f"unknown kind {kind!r}, expected one of {', '.join(KINDS)}")
+        mix[kind.strip()] = float(fraction)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("the mix fractions must sum up to more than 0")
+    return {kind: fraction / total for kind, fraction in mix.items()}
+
+
+@lru_cache(maxsize=4)
+def _birth_date_digits(today: np.datetime64) -> np.ndarray:
+    """
+    The first seven digits (century, year, month, day) of every birth date
+    from 1900-01-01 to `today`, so generating dates is a single gather.
+    """
+    dates = np.arange(FIRST_BIRTH_DATE, today + 1)
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    days = (dates - dates.astype("datetime64[M]")).astype(np.int64) + 1
+    table = np.empty((len(dates), 7), dtype=np.uint8)
+    table[:, 0] = np.where(years >= 2000, 3, 2)
+    for column, values in ((1, years % 100), (3, months), (5, days)):
+        table[:, column] = values // 10
+        table[:, column + 1] = values % 10
+    return table
+
+
+def generate(count: int, rng: np.random.Generator, mix: dict[str, float] | None = None,
+             today: date | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generate IDs and their kinds.
+
+    Args:
+        count (int): number of IDs.
+        rng (np.random.Generator): source of randomness, seed it for repeatable output.
+        mix (dict[str, float] | None): fraction of each kind, `DEFAULT_MIX` if omitted.
+        today (date | None): reference date for birth dates, today if omitted.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: `(count, 14)` uint8 array of ASCII
+        characters and the index in `KINDS` of every row.
+
+    Raises:
+        ValueError: if `future_year` IDs are requested after `LAST_FUTURE_YEAR_TODAY`.
+    """
+    mix = mix or DEFAULT_MIX
+    today = np.datetime64(today or date.today())
+    kinds = rng.choice(len(KINDS), size=count, p=[mix.get(kind, 0.0) for kind in KINDS])
+
+    # start from valid IDs and break the invalid kinds afterwards.
+    birth_dates = _birth_date_digits(today)
+    governorates = rng.choice(GOVERNORATE_CODES, size=count)
+    digits = np.empty((count, ID_LENGTH), dtype=np.uint8)
+    digits[:, :7] = birth_dates[rng.integers(0, len(birth_dates), size=count)]
+    digits[:, 7] = governorates // 10
+    digits[:, 8] = governorates % 10
+    # serial number, odd for men and even for women, then the check digit.
+    digits[:, 9:14] = rng.integers(0, 10, size=(count, 5))
+
+    rows = kinds == KINDS.index("invalid_century")
+    digits[rows, 0] = rng.choice(INVALID_CENTURIES, size=rows.sum())
+
+    rows = kinds == KINDS.index("future_year")
+    current_year = today.astype("datetime64[Y]").astype(np.int64) + 1970
+    if rows.any() and current_year > LAST_FUTURE_YEAR_TODAY:
+        raise ValueError(f"no future years are left to generate in {current_year}")
+    future_years = rng.integers(current_year % 100 + 1, 100, size=rows.sum())
+    digits[rows, 0] = 3
+    digits[rows, 1] = future_years // 10
+    digits[rows, 2] = future_years % 10
+
+    rows = np.flatnonzero(kinds == KINDS.index("feb_30"))
+    digits[rows, 3:7] = (0, 2, 3, 0)
+
+    rows = np.flatnonzero(kinds == KINDS.index("unknown_governorate"))
+    unknown = rng.choice(UNKNOWN_GOVERNORATE_CODES, size=len(rows))
+    digits[rows, 7] = unknown // 10
+    digits[rows, 8] = unknown % 10
+
+    characters = digits + ord("0")
+    rows = np.flatnonzero(kinds == KINDS.index("non_digit"))
+    characters[rows, rng.integers(0, ID_LENGTH, size=len(rows))] = rng.choice(
+        NON_DIGIT_LETTERS, size=len(rows))
+    return characters, kinds
+
+
+def encode_lines(characters: np.ndarray, kinds: np.ndarray) -> bytes:
+    """Render generated rows as `<id>,<kind code>\\n` lines."""
+    lines = np.empty((len(kinds), LINE_LENGTH), dtype=np.uint8)
+    lines[:, :ID_LENGTH] = characters
+    lines[:, ID_LENGTH] = ord(",")
+    lines[:, ID_LENGTH + 1] = _KIND_CODE_BYTES[kinds]
+    lines[:, ID_LENGTH + 2] = ord("\n")
+    return lines.tobytes()
+
+
+def iter_chunks(count: int, seed: int | None = None, mix: dict[str, float] | None = None,
+                chunk_size: int = 1_000_000) -> Iterator[bytes]:
+    """
+    Yield the encoded lines of `count` IDs, `chunk_size` at a time.
+
+    Args:
+        count (int): total number of IDs.
+        seed (int | None): random seed.
+        mix (dict[str, float] | None): fraction of each kind.
+        chunk_size (int): IDs per yielded chunk.
+    """
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    remaining = count
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        yield encode_lines(*generate(size, rng, mix, today))
+        remaining -= size
+
+
+def write(stream: BinaryIO, count: int, seed: int | None = None,
+          mix: dict[str, float] | None = None) -> None:
+    """Write `count` labelled IDs to a binary stream."""
+    for chunk in iter_chunks(count, seed, mix):
+        stream.write(chunk)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="e.g. valid=0.9,feb_30=0.05,non_digit=0.05")
+    parser.add_argument("output", nargs="?", default="-",
+                        help="output file, `-` for stdout")
+    args = parser.parse_args()
+
+    started_at = time.perf_counter()
+    if args.output == "-":
+        write(sys.stdout.buffer, args.count, args.seed, args.mix)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, "wb") as output:
+            write(output, args.count, args.seed, args.mix)
+    elapsed = time.perf_counter() - started_at
+    print(f"{args.count:,} IDs in {elapsed:.2f} s ({args.count / elapsed:,.0f} IDs/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
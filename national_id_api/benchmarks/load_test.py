@@ -0,0 +1,510 @@
+"""
+Load-testing harness for `/validate-id`, `/validate-ids` and `/extract-ids`
+against a locally started stack.
+
+Two ways to drive load:
+
+* open loop (`--rates`): requests are sent at a fixed arrival rate whatever the
+  server does, and latency is measured from the intended send time, so a
+  stalled server shows up in the percentiles instead of slowing the client
+  down (no coordinated omission).
+* closed loop (`--concurrency`): N clients each send their next request as
+  soon as the previous one is answered.
+
+For each worker count in `--workers` a pre-fork stack (`python -m app.serve`,
+see app/serve.py) is started (unless `--url` points to a running one), every
+rate or concurrency level runs for `--duration` seconds, and throughput,
+latency percentiles and response codes (including 429 and 503) are recorded.
+Responses are checked against the labels of `benchmarks.id_generator`.
+`--endpoint` picks the route: `validate-ids` posts `--batch-size` IDs per
+request, `extract-ids` a text with `--batch-size` IDs in it, and the IDs per
+second are reported next to the requests per second. With
+more than one worker count a scaling table follows: throughput of each count
+against the fewest workers at the same level, and that speedup per worker.
+
+From `national_id_api`, with Postgres migrated and seeded:
+
+    python -m benchmarks.load_test run --workers 1,2,4 --rates 200,400,800,1600 --output before.json
+    python -m benchmarks.load_test run --workers 4 --concurrency 8,32,128 --output closed.json
+    python -m benchmarks.load_test run --endpoint validate-ids --batch-size 100 --workers 1,2,4 --rates 50,100,200
+    python -m benchmarks.load_test compare before.json after.json
+
+or without Postgres, against a SQLite key store seeded in a temporary directory:
+
+    python -m benchmarks.load_test run --key-store sqlite --workers 1,2,4,8 --concurrency 64
+
+The stack is started with `RATE_LIMIT_ENABLED=false` unless
+`--keep-rate-limits` is given, because every request comes from one IP.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from benchmarks.harness import LatencyHistogram
+from benchmarks.id_generator import EXPECTED_CODES, KINDS, generate
+
+ENDPOINTS: dict[str, str] = {
+    "validate-id": "/validate-id",
+    "validate-ids": "/validate-ids",
+    "extract-ids": "/extract-ids",
+}
+CONTENT_TYPES: dict[str, str] = {
+    "validate-id": "application/json",
+    "validate-ids": "application/json",
+    "extract-ids": "text/plain; charset=utf-8",
+}
+
+
+@dataclass
+class LoadResult:
+    """ outcome of one load level.
+    """
+    workers: int
+    mode: str
+    level: int
+    duration_seconds: float
+    sent: int
+    completed: int
+    throughput: float
+    latency_us: dict[str, int]
+    status_codes: dict[str, int] = field(default_factory=dict)
+    response_codes: dict[str, int] = field(default_factory=dict)
+    oracle_mismatches: int = 0
+    client_dropped: int = 0
+    endpoint: str = "validate-id"
+    ids_per_request: float = 1.0
+
+    def row(self) -> str:
+        errors = {code: count for code, count in self.status_codes.items() if code != "200"}
+        ids = (f" ({self.throughput * self.ids_per_request:>10,.0f} IDs/s)"
+               if self.endpoint != "validate-id" else "")
+        return (f"workers={self.workers:<3} {self.mode}={self.level:<6} "
+                f"{self.throughput:>9,.0f} req/s{ids}  p50 {self.latency_us['p50_us'] / 1000:>8.2f} ms  "
+                f"p99 {self.latency_us['p99_us'] / 1000:>8.2f} ms  "
+                f"p99.9 {self.latency_us['p99.9_us'] / 1000:>8.2f} ms  errors {errors or '-'}")
+
+
+class LoadRecorder:
+    """Collects latencies and codes of one load level."""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.status_codes: dict[str, int] = {}
+        self.response_codes: dict[str, int] = {}
+        self.oracle_mismatches: int = 0
+        self.completed: int = 0
+
+    def record(self, latency_us: int, status: str, codes: list[str],
+               expected_codes: list[str]) -> None:
+        self.histogram.record(latency_us)
+        self.completed += 1
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        for code in codes:
+            self.response_codes[code] = self.response_codes.get(code, 0) + 1
+        if status == "200" and codes != expected_codes:
+            self.oracle_mismatches += 1
+
+
+def validate_id_payload(ids: list[tuple[str, str]]) -> bytes:
+    """`/validate-id` body of a single ID, a `non_digit` one sent as a string."""
+    (id_number, kind), = ids
+    national_id = id_number if kind == "non_digit" else int(id_number)
+    return json.dumps({"national_id": national_id}).encode()
+
+
+def validate_ids_payload(ids: list[tuple[str, str]]) -> bytes:
+    """`/validate-ids` body, every ID sent as a string."""
+    return json.dumps({"national_ids": [id_number for id_number, _ in ids]}).encode()
+
+
+def extract_ids_payload(ids: list[tuple[str, str]]) -> bytes:
+    """`/extract-ids` text with one ID per line, between words."""
+    return "".join(f"Applicant {index}: national ID {id_number}, received.\n"
+                   for index, (id_number, _) in enumerate(ids)).encode()
+
+
+PAYLOADS = {
+    "validate-id": validate_id_payload,
+    "validate-ids": validate_ids_payload,
+    "extract-ids": extract_ids_payload,
+}
+
+
+def expected_codes(endpoint: str, ids: list[tuple[str, str]]) -> list[str]:
+    """
+    Codes the response must carry for `ids`, in order. `/extract-ids` only
+    finds runs of 14 digits, so it answers nothing for `non_digit` IDs.
+    """
+    return [EXPECTED_CODES[kind] for _, kind in ids
+            if endpoint != "extract-ids" or kind != "non_digit"]
+
+
+def response_codes(endpoint: str, response: httpx.Response) -> list[str]:
+    """
+    The result codes of a response, one per ID.
+
+    Raises:
+        ValueError: if the body is not what the endpoint answers.
+    """
+    if endpoint == "extract-ids":
+        return [json.loads(line)["code"] for line in response.text.splitlines() if line]
+    content = response.json()
+    if endpoint == "validate-ids" and isinstance(content.get("data"), list):
+        return [result["code"] for result in content["data"]]
+    return [content["code"]]
+
+
+class RequestSource:
+    """Cycles through request bodies built from generated IDs, with the codes
+    expected in their responses."""
+
+    def __init__(self, size: int, seed: int, endpoint: str = "validate-id", batch_size: int = 1):
+        characters, kinds = generate(size, np.random.default_rng(seed))
+        ids = [(row.tobytes().decode(), KINDS[kind_index])
+               for row, kind_index in zip(characters, kinds)]
+        batch_size = 1 if endpoint == "validate-id" else batch_size
+        self.bodies: list[bytes] = []
+        self.expected: list[list[str]] = []
+        for first in range(0, len(ids) - batch_size + 1, batch_size):
+            batch = ids[first:first + batch_size]
+            self.bodies.append(PAYLOADS[endpoint](batch))
+            self.expected.append(expected_codes(endpoint, batch))
+        self.ids_per_request: int = batch_size
+        self._next = 0
+
+    def next(self) -> tuple[bytes, list[str]]:
+        index = self._next
+        self._next = (index + 1) % len(self.bodies)
+        return self.bodies[index], self.expected[index]
+
+
+async def send_one(client: httpx.AsyncClient, recorder: LoadRecorder, endpoint: str, body: bytes,
+                   expected: list[str], intended_at: float) -> None:
+    try:
+        response = await client.post(ENDPOINTS[endpoint], content=body)
+        status = str(response.status_code)
+        try:
+            codes = response_codes(endpoint, response)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            codes = []
+    except httpx.HTTPError as error:
+        status, codes = type(error).__name__, []
+    latency_us = int((time.perf_counter() - intended_at) * 1_000_000)
+    recorder.record(latency_us, status, codes, expected)
+
+
+async def run_open_loop(client: httpx.AsyncClient, source: RequestSource, endpoint: str, rate: int,
+                        duration: float, max_outstanding: int) -> tuple[LoadRecorder, int, int]:
+    """
+    Send `rate` requests per second for `duration` seconds.
+
+    Returns:
+        tuple[LoadRecorder, int, int]: recorder, requests sent and requests the
+        client dropped because `max_outstanding` were already in flight.
+    """
+    recorder = LoadRecorder()
+    outstanding: set[asyncio.Task] = set()
+    interval = 1 / rate
+    started_at = time.perf_counter()
+    sent = dropped = 0
+    while True:
+        intended_at = started_at + sent * interval
+        if intended_at - started_at >= duration:
+            break
+        delay = intended_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent += 1
+        if len(outstanding) >= max_outstanding:
+            dropped += 1
+            continue
+        body, expected = source.next()
+        task = asyncio.create_task(send_one(client, recorder, endpoint, body, expected, intended_at))
+        outstanding.add(task)
+        task.add_done_callback(outstanding.discard)
+    if outstanding:
+        await asyncio.wait(outstanding)
+    return recorder, sent, dropped
+
+
+async def run_closed_loop(client: httpx.AsyncClient, source: RequestSource, endpoint: str,
+                          concurrency: int, duration: float) -> tuple[LoadRecorder, int, int]:
+    """
+    Run `concurrency` clients back to back for `duration` seconds.
+
+    Returns:
+        tuple[LoadRecorder, int, int]: recorder, requests sent and `0`.
+    """
+    recorder = LoadRecorder()
+    ends_at = time.perf_counter() + duration
+
+    async def client_loop() -> None:
+        while time.perf_counter() < ends_at:
+            body, expected = source.next()
+            await send_one(client, recorder, endpoint, body, expected, time.perf_counter())
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return recorder, recorder.completed, 0
+
+
+async def run_level(base_url: str, api_key: str, workers: int, mode: str, level: int,
+                    args: argparse.Namespace) -> LoadResult:
+    source = RequestSource(size=max(10_000, 100 * args.batch_size), seed=args.seed,
+                           endpoint=args.endpoint, batch_size=args.batch_size)
+    connections = level if mode == "concurrency" else args.max_outstanding
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    headers = {"x-api-key": api_key, "content-type": CONTENT_TYPES[args.endpoint]}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits,
+                                 timeout=args.timeout) as client:
+        started_at = time.perf_counter()
+        if mode == "rate":
+            recorder, sent, dropped = await run_open_loop(
+                client, source, args.endpoint, level, args.duration, args.max_outstanding)
+        else:
+            recorder, sent, dropped = await run_closed_loop(
+                client, source, args.endpoint, level, args.duration)
+        elapsed = time.perf_counter() - started_at
+    return LoadResult(
+        workers=workers,
+        mode=mode,
+        level=level,
+        duration_seconds=elapsed,
+        sent=sent,
+        completed=recorder.completed,
+        throughput=recorder.completed / elapsed,
+        latency_us=recorder.histogram.summary(),
+        status_codes=recorder.status_codes,
+        response_codes=recorder.response_codes,
+        oracle_mismatches=recorder.oracle_mismatches,
+        client_dropped=dropped,
+        endpoint=args.endpoint,
+        ids_per_request=source.ids_per_request,
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_stack(workers: int, port: int, keep_rate_limits: bool,
+                env: dict[str, str] | None = None) -> subprocess.Popen:
+    """Start `app.serve` with `workers` processes and wait until it answers."""
+    env = {**os.environ, **(env or {}), "SERVER_HOST": "127.0.0.1", "SERVER_PORT": str(port),
+           "SERVER_WORKERS": str(workers), "SERVER_ACCESS_LOG": "false"}
+    if not keep_rate_limits:
+        env["RATE_LIMIT_ENABLED"] = "false"
+    server = subprocess.Popen([sys.executable, "-m", "app.serve"], env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/admission-stats", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"the stack did not start on port {port}")
+
+
+def stop_stack(server: subprocess.Popen) -> None:
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def find_knee(results: list[LoadResult], p99_factor: float) -> LoadResult | None:
+    """
+    First level where p99 grew past `p99_factor` times the lightest level's
+    p99, or where fewer than 95% of sent requests completed with 200.
+    """
+    if not results:
+        return None
+    reference_p99 = results[0].latency_us["p99_us"] or 1
+    for result in results:
+        ok = result.status_codes.get("200", 0)
+        if result.latency_us["p99_us"] > reference_p99 * p99_factor or ok < 0.95 * result.sent:
+            return result
+    return None
+
+
+async def seed_sqlite(path: str, api_key: str) -> None:
+    from app.key_store import SQLiteKeyStore
+
+    key_store = SQLiteKeyStore(path)
+    await key_store.initialize()
+    try:
+        await key_store.seed(company_name="Load test", api_key=api_key)
+    finally:
+        await key_store.close()
+        await key_store.db_manager.dispose()
+
+
+def scaling(results: list[LoadResult]) -> str:
+    """
+    Throughput of each worker count against the fewest workers, per level.
+
+    Returns:
+        str: markdown table.
+    """
+    by_level: dict[tuple[str, int], list[LoadResult]] = {}
+    for result in results:
+        by_level.setdefault((result.mode, result.level), []).append(result)
+    lines = [
+        "| mode | level | workers | req/s | speedup | per worker |",
+        "|---|---|---|---|---|---|",
+    ]
+    for (mode, level), level_results in sorted(by_level.items()):
+        level_results.sort(key=lambda result: result.workers)
+        reference = level_results[0]
+        for result in level_results:
+            speedup = result.throughput / reference.throughput if reference.throughput else 0.0
+            per_worker = speedup * reference.workers / result.workers
+            lines.append(f"| {mode} | {level} | {result.workers} | {result.throughput:,.0f} "
+                         f"| {speedup:.2f}x | {per_worker:.0%} |")
+    return "\n".join(lines)
+
+
+async def run_sweep(args: argparse.Namespace) -> list[LoadResult]:
+    mode = "rate" if args.rates else "concurrency"
+    levels = [int(level) for level in (args.rates or args.concurrency).split(",")]
+    results: list[LoadResult] = []
+    stack_env: dict[str, str] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if args.key_store == "sqlite" and args.url is None:
+            path = str(Path(directory) / "keys.db")
+            await seed_sqlite(path, args.api_key)
+            stack_env = {"KEY_STORE_BACKEND": "sqlite", "KEY_STORE_SQLITE_PATH": path}
+        for workers in [int(count) for count in args.workers.split(",")]:
+            results += await run_workers(args, workers, mode, levels, stack_env)
+    if len({result.workers for result in results}) > 1:
+        print(scaling(results), flush=True)
+    return results
+
+
+async def run_workers(args: argparse.Namespace, workers: int, mode: str, levels: list[int],
+                      stack_env: dict[str, str]) -> list[LoadResult]:
+    """All levels against one worker count."""
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        server = start_stack(workers, port, args.keep_rate_limits, stack_env)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        results: list[LoadResult] = []
+        for level in levels:
+            result = await run_level(base_url, args.api_key, workers, mode, level, args)
+            print(result.row(), flush=True)
+            results.append(result)
+        knee = find_knee(results, args.knee_factor)
+        print(f"workers={workers}: knee at {mode}={knee.level}" if knee
+              else f"workers={workers}: no knee within the tested levels", flush=True)
+        return results
+    finally:
+        if server is not None:
+            stop_stack(server)
+
+
+def save(results: list[LoadResult], path: Path, args: argparse.Namespace) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "duration_seconds": args.duration,
+        "endpoint": args.endpoint,
+        "batch_size": args.batch_size,
+        "results": [asdict(result) for result in results],
+    }, indent=2))
+
+
+def compare(base_path: Path, new_path: Path) -> str:
+    """
+    Side by side report of two runs, matched on workers, mode and level.
+
+    Returns:
+        str: markdown table.
+    """
+    def load(path: Path) -> dict[tuple, dict]:
+        return {(entry["workers"], entry["mode"], entry["level"]): entry
+                for entry in json.loads(path.read_text())["results"]}
+
+    base, new = load(base_path), load(new_path)
+    lines = [
+        "| workers | mode | level | req/s base | req/s new | p99 ms base | p99 ms new | non-200 base | non-200 new |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for key in sorted(base.keys() & new.keys()):
+        before, after = base[key], new[key]
+
+        def errors(entry: dict) -> int:
+            return entry["completed"] - entry["status_codes"].get("200", 0)
+
+        lines.append(
+            f"| {key[0]} | {key[1]} | {key[2]} "
+            f"| {before['throughput']:,.0f} | {after['throughput']:,.0f} "
+            f"| {before['latency_us']['p99_us'] / 1000:.2f} | {after['latency_us']['p99_us'] / 1000:.2f} "
+            f"| {errors(before)} | {errors(after)} |")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run a load sweep")
+    levels = run.add_mutually_exclusive_group(required=True)
+    levels.add_argument("--rates", help="comma separated arrival rates (req/s), open loop")
+    levels.add_argument("--concurrency", help="comma separated client counts, closed loop")
+    run.add_argument("--workers", default="1", help="comma separated worker counts")
+    run.add_argument("--endpoint", choices=tuple(ENDPOINTS), default="validate-id")
+    run.add_argument("--batch-size", type=int, default=100,
+                     help="IDs per request for validate-ids and extract-ids")
+    run.add_argument("--url", default=None, help="use a running stack instead of starting one")
+    run.add_argument("--key-store", choices=("configured", "sqlite"), default="configured",
+                     help="sqlite: seed `--api-key` in a temporary SQLite key store")
+    run.add_argument("--api-key", default="test")
+    run.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    run.add_argument("--timeout", type=float, default=10.0, help="client timeout in seconds")
+    run.add_argument("--max-outstanding", type=int, default=1000,
+                     help="open loop requests in flight before the client drops")
+    run.add_argument("--knee-factor", type=float, default=3.0,
+                     help="p99 growth over the lightest level that marks the knee")
+    run.add_argument("--keep-rate-limits", action="store_true")
+    run.add_argument("--seed", type=int, default=7)
+    run.add_argument("--output", type=Path, default=Path("benchmarks/results/load.json"))
+
+    diff = commands.add_parser("compare", help="compare two runs")
+    diff.add_argument("base", type=Path)
+    diff.add_argument("new", type=Path)
+
+    args = parser.parse_args()
+    if args.command == "run" and args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.command == "compare":
+        print(compare(args.base, args.new))
+        return
+    results = asyncio.run(run_sweep(args))
+    save(results, args.output, args)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Run the benchmark suite.
+
+From `national_id_api`:
+
+    python -m benchmarks.run                        # everything
+    python -m benchmarks.run --only validator,metrics
+    python -m benchmarks.run --only startup         # time to first request
+    python -m benchmarks.run --update-baseline      # store the reference run
+
+Results are printed and written as JSON to `--output`. When the baseline file
+exists the run fails (exit code 1) if a case regressed past the thresholds.
+Baselines are machine specific, create them on the machine that compares.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from benchmarks import bench_api_key, bench_endpoint, bench_metrics, bench_national_id, bench_startup
+from benchmarks.harness import (
+    BenchmarkResult,
+    find_regressions,
+    load_results,
+    save_results,
+)
+
+GROUPS: tuple[str, ...] = ("validator", "metrics", "auth", "endpoint", "startup")
+RESULTS_DIR: Path = Path(__file__).parent / "results"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(GROUPS),
+                        help=f"comma separated groups out of {', '.join(GROUPS)}")
+    parser.add_argument("--iterations", type=int, default=20_000,
+                        help="iterations of the in-memory cases")
+    parser.add_argument("--db-iterations", type=int, default=500,
+                        help="iterations of the cases that hit the database")
+    parser.add_argument("--startup-runs", type=int, default=10,
+                        help="worker processes started by the startup cases")
+    parser.add_argument("--database-url",
+                        default=os.getenv("BENCH_DATABASE_URL") or os.getenv("TEST_DATABASE_URL"))
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "latest.json")
+    parser.add_argument("--baseline", type=Path, default=RESULTS_DIR / "baseline.json")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="allowed throughput drop, as a fraction")
+    parser.add_argument("--p99-threshold", type=float, default=0.5,
+                        help="allowed p99 latency growth, as a fraction")
+    return parser.parse_args()
+
+
+def database_url(args: argparse.Namespace) -> str:
+    if args.database_url:
+        return args.database_url
+    from app.settings import settings
+    return settings.TEST_DATABASE_URL
+
+
+async def run_groups(args: argparse.Namespace) -> list[BenchmarkResult]:
+    groups = set(args.only.split(","))
+    results: list[BenchmarkResult] = []
+    if "validator" in groups:
+        results += bench_national_id.run(args.iterations)
+    if "metrics" in groups:
+        results += bench_metrics.run(args.iterations)
+    if "auth" in groups:
+        results += await bench_api_key.run(database_url(args), args.db_iterations)
+    if "endpoint" in groups:
+        results += await bench_endpoint.run(database_url(args), args.db_iterations)
+    if "startup" in groups:
+        results += await bench_startup.run(args.startup_runs)
+    return results
+
+
+def main() -> int:
+    args = parse_args()
+    results = asyncio.run(run_groups(args))
+    for result in results:
+        print(result.row())
+
+    save_results(results, args.output)
+    print(f"\nresults written to {args.output}")
+
+    if args.update_baseline:
+        save_results(results, args.baseline)
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("no baseline to compare with, run with --update-baseline first")
+        return 0
+
+    regressions = find_regressions(results, load_results(args.baseline),
+                                   args.threshold, args.p99_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,7 +9,7 @@ from alembic import context
 
 from app.settings import settings
 from app.database_settings import Base
-from app.models import APIKeyUsage
+from app.models import APIKeyUsage, APIKeyUsageHourly
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -0,0 +1,30 @@
+"""audit key prefix
+
+Revision ID: 5d8f2a7c1e63
+Revises: e91a3c5f7b42
+Create Date: 2026-10-19 18:20:41.530912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8f2a7c1e63'
+down_revision: Union[str, Sequence[str], None] = 'e91a3c5f7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the fingerprints were unsalted hashes of the keys, they are not kept.
+    op.execute(sa.text('UPDATE "RequestAudit" SET key_fingerprint = NULL'))
+    op.alter_column('RequestAudit', 'key_fingerprint', new_column_name='key_prefix')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('RequestAudit', 'key_prefix', new_column_name='key_fingerprint')
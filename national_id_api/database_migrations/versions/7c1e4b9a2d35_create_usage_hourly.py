@@ -0,0 +1,34 @@
+"""create hourly usage rollup
+
+Revision ID: 7c1e4b9a2d35
+Revises: 002b0dc2c518
+Create Date: 2026-10-19 10:12:41.530217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4b9a2d35'
+down_revision: Union[str, Sequence[str], None] = '002b0dc2c518'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the (company_name, hour) primary key serves the per company range scans.
+    op.create_table('ApiKeyUsageHourly',
+    sa.Column('company_name', sa.String(length=255), nullable=False),
+    sa.Column('hour', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('usage_count', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('company_name', 'hour')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ApiKeyUsageHourly')
@@ -0,0 +1,36 @@
+"""create request audit
+
+Revision ID: b4d28f6e9a10
+Revises: 7c1e4b9a2d35
+Create Date: 2026-10-19 13:40:07.118452
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d28f6e9a10'
+down_revision: Union[str, Sequence[str], None] = '7c1e4b9a2d35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # daily partitions are created and dropped by the audit task, see app/audit.py.
+    op.create_table('RequestAudit',
+    sa.Column('requested_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('key_fingerprint', sa.String(length=16), nullable=True),
+    sa.Column('endpoint', sa.String(length=64), nullable=False),
+    sa.Column('code', sa.String(length=32), nullable=False),
+    sa.Column('latency_ms', sa.Float(), nullable=False),
+    postgresql_partition_by='RANGE (requested_at)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('RequestAudit')
@@ -0,0 +1,68 @@
+"""hash api keys
+
+Revision ID: e91a3c5f7b42
+Revises: b4d28f6e9a10
+Create Date: 2026-10-19 16:05:52.804113
+
+"""
+import hashlib
+import re
+import secrets
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91a3c5f7b42'
+down_revision: Union[str, Sequence[str], None] = 'b4d28f6e9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# frozen copy of app/api_keys.py at this revision.
+_ISSUED_KEY = re.compile(r"^[0-9a-f]{8}\.")
+
+
+def _key_prefix(api_key: str) -> str:
+    if _ISSUED_KEY.match(api_key):
+        return api_key[:8]
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ApiKeyUsages', sa.Column('key_prefix', sa.String(length=16), nullable=True))
+    op.add_column('ApiKeyUsages', sa.Column('key_salt', sa.String(length=32), nullable=True))
+    op.add_column('ApiKeyUsages', sa.Column('key_hash', sa.String(length=64), nullable=True))
+    op.add_column('ApiKeyUsages', sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True))
+
+    connection = op.get_bind()
+    keys = sa.table('ApiKeyUsages', sa.column('id'), sa.column('api_key'), sa.column('key_prefix'),
+                    sa.column('key_salt'), sa.column('key_hash'))
+    for key_id, api_key in connection.execute(sa.select(keys.c.id, keys.c.api_key)).all():
+        salt = secrets.token_hex(16)
+        connection.execute(
+            keys.update().where(keys.c.id == key_id).values(
+                key_prefix=_key_prefix(api_key),
+                key_salt=salt,
+                key_hash=hashlib.sha256(salt.encode() + api_key.encode()).hexdigest(),
+            )
+        )
+
+    op.alter_column('ApiKeyUsages', 'key_prefix', nullable=False)
+    op.alter_column('ApiKeyUsages', 'key_salt', nullable=False)
+    op.alter_column('ApiKeyUsages', 'key_hash', nullable=False)
+    op.create_unique_constraint('ApiKeyUsages_key_prefix_key', 'ApiKeyUsages', ['key_prefix'])
+    op.drop_column('ApiKeyUsages', 'api_key')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # the keys cannot be recovered from their hashes, they have to be issued again.
+    op.add_column('ApiKeyUsages', sa.Column('api_key', sa.String(length=255), nullable=True))
+    op.drop_constraint('ApiKeyUsages_key_prefix_key', 'ApiKeyUsages', type_='unique')
+    op.drop_column('ApiKeyUsages', 'revoked_at')
+    op.drop_column('ApiKeyUsages', 'key_hash')
+    op.drop_column('ApiKeyUsages', 'key_salt')
+    op.drop_column('ApiKeyUsages', 'key_prefix')
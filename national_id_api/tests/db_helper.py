@@ -2,6 +2,7 @@ from typing import AsyncGenerator
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 
+from app.api_keys import key_prefix, new_entry
 from app.models import APIKeyUsage
 
 from sqlalchemy.sql import text
@@ -52,9 +53,13 @@ async def create_temp_api_key_usage(session: AsyncSession) -> AsyncGenerator[API
     Async context manager to create a temporary APIKeyUsage record in the DB,
     and automatically delete it after usage.
     """
+    entry = new_entry("Test Company", API_KEY)
     api_key_usage = APIKeyUsage(
-        company_name="Test Company",
-        api_key=API_KEY,
+        id=entry.key_id,
+        company_name=entry.company_name,
+        key_prefix=key_prefix(API_KEY),
+        key_salt=entry.salt,
+        key_hash=entry.key_hash,
         usage_count=0,
         last_request_at=datetime.now(timezone.utc)
     )
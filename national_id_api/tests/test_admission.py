@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI, status
+
+from app.admission import AdmissionController, AdmissionControlMiddleware
+from app.response_codes import ErrorCodeEnum
+
+
+def build_app(controller: AdmissionController, gate: asyncio.Event) -> FastAPI:
+    """tiny app whose endpoint blocks until `gate` is set.
+
+    Args:
+        controller (AdmissionController): admission controller under test.
+        gate (asyncio.Event): released by the test case.
+
+    Returns:
+        FastAPI: app wrapped with the admission middleware.
+    """
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        await gate.wait()
+        return {"ok": True}
+
+    app.add_middleware(AdmissionControlMiddleware,
+                       controller=controller, retry_after=3)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_acquire_until_queue_full() -> None:
+    """ slots, then queue, then shedding.
+    """
+    controller = AdmissionController(
+        max_in_flight=1, max_queue=1, queue_timeout=1)
+    assert await controller.acquire()
+
+    queued = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    assert controller.queue_depth == 1
+
+    assert await controller.acquire() is False
+    assert controller.shed_queue_full == 1
+
+    controller.release()
+    assert await queued is True
+    assert controller.in_flight == 1
+    assert controller.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_acquire_queue_timeout_and_deadline() -> None:
+    """ queued requests give up on the queue timeout or the client deadline.
+    """
+    controller = AdmissionController(
+        max_in_flight=1, max_queue=5, queue_timeout=0.01)
+    assert await controller.acquire()
+
+    assert await controller.acquire() is False
+    assert controller.shed_queue_timeout == 1
+
+    assert await controller.acquire(deadline=time.monotonic()) is False
+    assert controller.shed_deadline_exceeded == 1
+    assert controller.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_sheds_with_retry_after() -> None:
+    """ shed requests get 503, `SERVICE_UNAVAILABLE` and `Retry-After`.
+    """
+    controller = AdmissionController(
+        max_in_flight=1, max_queue=0, queue_timeout=1)
+    gate = asyncio.Event()
+    transport = httpx.ASGITransport(app=build_app(controller, gate))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = asyncio.create_task(client.get("/slow"))
+        while controller.in_flight == 0:
+            await asyncio.sleep(0)
+
+        shed = await client.get("/slow")
+        assert shed.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert shed.headers["retry-after"] == "3"
+        assert shed.json()["code"] == ErrorCodeEnum.SERVICE_UNAVAILABLE.value
+
+        gate.set()
+        assert (await first).status_code == status.HTTP_200_OK
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_drops_work_after_client_deadline() -> None:
+    """ the request is cancelled once the client time budget is spent.
+    """
+    controller = AdmissionController(
+        max_in_flight=4, max_queue=4, queue_timeout=1)
+    transport = httpx.ASGITransport(
+        app=build_app(controller, asyncio.Event()))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/slow", headers={"X-Request-Timeout-Ms": "20"})
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert controller.shed_deadline_exceeded == 1
+    assert controller.in_flight == 0
@@ -0,0 +1,196 @@
+import asyncio
+import uuid
+from datetime import date, datetime, timezone
+from typing import Any, AsyncGenerator
+
+import httpx
+import pytest
+import pytest_asyncio
+import sqlalchemy as sa
+from fastapi import FastAPI, HTTPException, Request
+
+from app.audit import AuditLog, AuditMiddleware, AuditRecord, partition_name
+from app.database_settings import DatabaseManager
+from app.models import REQUEST_AUDIT
+from tests.conftest import TEST_DATABASE_URL
+
+
+class MemoryAuditLog(AuditLog):
+    """ audit log writing its batches to a list, failing while `broken`.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(db_manager=None, **kwargs)
+        self.written: list[list[AuditRecord]] = []
+        self.broken = False
+        # set to hold writes until it is released.
+        self.release: asyncio.Event | None = None
+
+    async def write(self, batch: list[AuditRecord]) -> None:
+        if self.broken:
+            raise ConnectionError("database is down")
+        if self.release is not None:
+            await self.release.wait()
+        self.written.append(batch)
+
+    async def maintain_partitions(self, today: date | None = None) -> None:
+        pass
+
+
+def record(code: str) -> AuditRecord:
+    return (datetime.now(timezone.utc), "key", "/validate-id", code, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_drops_and_failed_writes_are_kept() -> None:
+    """ records beyond the buffer size are dropped, a failed batch is retried
+    in order.
+    """
+    audit_log = MemoryAuditLog(buffer_size=3, flush_batch=2)
+    for code in ("A", "B", "C", "D"):
+        audit_log.record(record(code))
+    assert len(audit_log) == 3
+
+    audit_log.broken = True
+    assert await audit_log.flush() == 0
+    assert len(audit_log) == 3
+
+    audit_log.broken = False
+    await audit_log.close()
+    assert [[row[3] for row in batch] for batch in audit_log.written] == [["A", "B"], ["C"]]
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_the_write_in_progress() -> None:
+    """ a batch the writer task is writing when the log is closed is not lost.
+    """
+    audit_log = MemoryAuditLog(flush_batch=2, flush_seconds=60)
+    audit_log.release = asyncio.Event()
+    audit_log.start()
+    for code in ("A", "B", "C"):
+        audit_log.record(record(code))
+    while len(audit_log) > 1:
+        await asyncio.sleep(0)
+
+    closing = asyncio.create_task(audit_log.close())
+    await asyncio.sleep(0.01)
+    assert not closing.done()
+    audit_log.release.set()
+    await closing
+
+    assert [[row[3] for row in batch] for batch in audit_log.written] == [["A", "B"], ["C"]]
+
+
+@pytest.mark.asyncio
+async def test_middleware_records_outcome_without_the_id() -> None:
+    """ one record per audited request with the endpoint's code, or the status
+    when no code was set, and the key's prefix rather than the key.
+    """
+    audit_log = MemoryAuditLog()
+    app = FastAPI()
+    app.add_middleware(AuditMiddleware, audit_log=audit_log)
+
+    @app.post("/validate-id")
+    async def validate(request: Request):
+        body = await request.json()
+        if body["national_id"] == "bad":
+            raise HTTPException(status_code=401)
+        request.state.outcome = "VALID_ID"
+        return {"code": "VALID_ID"}
+
+    @app.post("/extract-ids")
+    async def extract(request: Request):
+        request.state.outcome = "VALID_ID"
+        return {}
+
+    @app.get("/other")
+    async def other():
+        return {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.post("/validate-id", json={"national_id": "29001011234567"}, headers={"x-api-key": "0badc0de.secret"})
+        await client.post("/validate-id", json={"national_id": "bad"})
+        await client.post("/extract-ids", content=b"29001011234567")
+        await client.get("/other")
+    await audit_log.close()
+
+    rows = audit_log.written[0]
+    assert [(api_key, endpoint, code) for _, api_key, endpoint, code, _ in rows] == [
+        ("0badc0de", "/validate-id", "VALID_ID"),
+        (None, "/validate-id", "HTTP_401"),
+        (None, "/extract-ids", "VALID_ID"),
+    ]
+    assert all(latency_ms > 0 for *_, latency_ms in rows)
+    assert "29001011234567" not in repr(rows)
+    assert "secret" not in repr(rows)
+
+
+@pytest_asyncio.fixture(params=["postgres"])
+async def postgres_audit_log(request: pytest.FixtureRequest) -> AsyncGenerator[AuditLog, Any]:
+    """audit log on the test database, retention of two days.
+
+    Yields:
+        AuditLog: audit log, its task not started.
+    """
+    db = DatabaseManager(TEST_DATABASE_URL)
+    db.initialize()
+    yield AuditLog(db, flush_batch=10, retention_days=2)
+    await db.dispose()
+
+
+async def audit_partitions(audit_log: AuditLog) -> set[str]:
+    async with audit_log.db_manager.session() as session:
+        rows = await session.execute(sa.text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :parent"), {"parent": REQUEST_AUDIT.name})
+        return {name for (name,) in rows}
+
+
+@pytest.mark.asyncio
+async def test_maintain_partitions(postgres_audit_log: AuditLog) -> None:
+    """ the partitions of a day and the next two are created, the ones past the
+    retention are dropped.
+    """
+    days = [date(2001, 1, day) for day in range(10, 18)]
+    try:
+        await postgres_audit_log.maintain_partitions(today=days[0])
+        assert {partition_name(day) for day in days[:3]} <= await audit_partitions(postgres_audit_log)
+
+        await postgres_audit_log.maintain_partitions(today=days[5])
+        partitions = await audit_partitions(postgres_audit_log)
+        assert {partition_name(day) for day in days[5:8]} <= partitions
+        assert not {partition_name(day) for day in days[:3]} & partitions
+    finally:
+        async with postgres_audit_log.db_manager.session() as session:
+            for day in days:
+                await session.execute(sa.text(f'DROP TABLE IF EXISTS "{partition_name(day)}"'))
+            await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_copy_into_request_audit(postgres_audit_log: AuditLog) -> None:
+    """ buffered records are written with COPY.
+    """
+    endpoint = f"/audit-test-{uuid.uuid4().hex[:8]}"
+    await postgres_audit_log.maintain_partitions()
+    for code in ("VALID_ID", "INVALID_ID"):
+        postgres_audit_log.record((datetime.now(timezone.utc), "0badc0de", endpoint, code, 1.5))
+    try:
+        assert await postgres_audit_log.flush() == 2
+        async with postgres_audit_log.db_manager.session() as session:
+            rows = (await session.execute(
+                sa.select(REQUEST_AUDIT.c.key_prefix, REQUEST_AUDIT.c.code, REQUEST_AUDIT.c.latency_ms)
+                .where(REQUEST_AUDIT.c.endpoint == endpoint)
+                .order_by(REQUEST_AUDIT.c.code.desc())
+            )).all()
+        assert [tuple(row) for row in rows] == [
+            ("0badc0de", "VALID_ID", 1.5),
+            ("0badc0de", "INVALID_ID", 1.5),
+        ]
+    finally:
+        async with postgres_audit_log.db_manager.session() as session:
+            await session.execute(sa.delete(REQUEST_AUDIT).where(REQUEST_AUDIT.c.endpoint == endpoint))
+            await session.commit()
@@ -0,0 +1,74 @@
+from benchmarks.harness import (
+    BenchmarkResult,
+    LatencyHistogram,
+    bench,
+    find_regressions,
+    summarize,
+)
+
+
+def make_result(name: str, ops_per_second: float, p99_us: float) -> BenchmarkResult:
+    """result with the fields the comparison looks at.
+
+    Returns:
+        BenchmarkResult: result.
+    """
+    return BenchmarkResult(name=name, iterations=100, ops_per_second=ops_per_second,
+                           p50_us=1.0, p99_us=p99_us)
+
+
+def test_summarize() -> None:
+    """ throughput and nearest rank percentiles.
+    """
+    result = summarize("case", [1000] * 98 + [5000, 9000], wall_seconds=0.5)
+    assert result.iterations == 100
+    assert result.ops_per_second == 200
+    assert result.p50_us == 1.0
+    assert result.p99_us == 5.0
+    assert summarize("one", [3000], wall_seconds=1.0).p99_us == 3.0
+
+
+def test_bench_counts_iterations() -> None:
+    """ the operation is timed once per iteration.
+    """
+    calls: list[int] = []
+    result = bench("append", lambda: calls.append(1), iterations=50, warmup=5)
+    assert len(calls) == 55
+    assert result.iterations == 50
+
+
+def test_find_regressions() -> None:
+    """ throughput drops and p99 growth past the thresholds are reported.
+    """
+    baseline = {
+        "steady": make_result("steady", 1000, 10),
+        "slower": make_result("slower", 1000, 10),
+        "spiky": make_result("spiky", 1000, 10),
+    }
+    results = [
+        make_result("steady", 950, 12),
+        make_result("slower", 700, 10),
+        make_result("spiky", 1000, 20),
+        make_result("new_case", 1, 1000),
+    ]
+    regressions = find_regressions(results, baseline, threshold=0.15, p99_threshold=0.5)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("slower")
+    assert regressions[1].startswith("spiky: p99")
+
+
+def test_latency_histogram() -> None:
+    """ percentiles stay within 1% and histograms merge.
+    """
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for value in range(1, 5001):
+        first.record(value)
+    second.record(1_000_000)
+    first.merge(second)
+
+    assert first.total == 5001
+    assert abs(first.percentile(0.5) - 2500) <= 25
+    assert abs(first.percentile(0.99) - 4950) <= 50
+    assert first.percentile(1.0) <= 1_000_000
+    assert first.percentile(1.0) >= 990_000
+    assert len(first.counts) < 1000
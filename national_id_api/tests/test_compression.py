@@ -0,0 +1,204 @@
+import asyncio
+import json
+import zlib
+
+import httpx
+import pytest
+import zstandard
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app import compression, main
+from app.compression import CompressionMiddleware, negotiate
+
+
+@pytest.mark.parametrize(("accept_encoding", "available", "expected"), [
+    ("gzip, deflate, br", ("zstd", "gzip"), "gzip"),
+    ("zstd, gzip", ("zstd", "gzip"), "zstd"),
+    ("gzip;q=1.0, zstd;q=0.5", ("zstd", "gzip"), "gzip"),
+    ("zstd", ("gzip",), None),
+    ("*;q=0.1", ("zstd", "gzip"), "zstd"),
+    ("gzip;q=0, *", ("gzip",), None),
+    ("", ("zstd", "gzip"), None),
+])
+def test_negotiate(accept_encoding: str, available: tuple[str, ...], expected: str | None) -> None:
+    """ the accepted encoding with the highest weight wins, ties go to the
+    server's preference.
+    """
+    assert negotiate(accept_encoding, available) == expected
+
+
+def rows(count: int) -> list[dict]:
+    return [{"governorate_name": "Dakahlia", "gender": "Male", "month_of_birth_name": "January",
+             "message": " Valid ID .thanks for using TRU National ID Service", "row": row}
+            for row in range(count)]
+
+
+async def call(app: FastAPI, path: str, accept_encoding: str = "gzip") -> list[dict]:
+    """the ASGI messages of one request, to see every chunk as sent."""
+    messages: list[dict] = []
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive() -> dict:
+        if requests:
+            return requests.pop()
+        await asyncio.Event().wait()
+
+    async def send(message: dict) -> None:
+        messages.append(message)
+
+    await app({"type": "http", "method": "GET", "path": path, "headers": [
+        (b"accept-encoding", accept_encoding.encode())], "query_string": b""}, receive, send)
+    return messages
+
+
+@pytest.fixture
+def app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, thread_min_size=4096)
+
+    @app.get("/small")
+    async def small():
+        return JSONResponse(rows(1))
+
+    @app.get("/large")
+    async def large():
+        return JSONResponse(rows(200))
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for first in range(0, 30, 10):
+                yield "".join(json.dumps(row) + "\n" for row in rows(30)[first:first + 10])
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" * 1024, media_type="image/png")
+
+    @app.get("/encoded")
+    async def encoded():
+        return Response(zlib.compress(b"{}" * 1024), media_type="application/json",
+                        headers={"content-encoding": "deflate"})
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_small_responses_and_other_encodings_are_not_compressed(app: FastAPI) -> None:
+    """ small single-piece responses and clients without a supported encoding
+    get the response as it is.
+    """
+    for path, accept_encoding in (("/small", "gzip"), ("/large", "br")):
+        start, body = await call(app, path, accept_encoding)
+        assert b"content-encoding" not in dict(start["headers"])
+        assert json.loads(body["body"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(("path", "accept_encoding"), [
+    ("/small", "gzip"), ("/large", "br"), ("/large", ""), ("/image", "gzip"),
+])
+async def test_uncompressed_responses_vary(app: FastAPI, path: str, accept_encoding: str) -> None:
+    """ a response that could have been compressed for another client says so,
+    responses with their own encoding are left alone.
+    """
+    start, _ = await call(app, path, accept_encoding)
+
+    headers = dict(start["headers"])
+    assert b"content-encoding" not in headers
+    assert headers[b"vary"] == b"Accept-Encoding"
+
+    start, _ = await call(app, "/encoded", accept_encoding)
+    assert b"vary" not in dict(start["headers"])
+
+
+@pytest.mark.asyncio
+async def test_large_response_is_compressed_in_a_thread(app: FastAPI, monkeypatch: pytest.MonkeyPatch) -> None:
+    """ a large body is compressed off the event loop, with its length and Vary set.
+    """
+    threaded: list[int] = []
+    to_thread = asyncio.to_thread
+
+    async def counting_to_thread(function, data: bytes, final: bool) -> bytes:
+        threaded.append(len(data))
+        return await to_thread(function, data, final)
+
+    monkeypatch.setattr(compression.asyncio, "to_thread", counting_to_thread)
+    start, body = await call(app, "/large")
+
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(body["body"])
+    decompressed = zlib.decompress(body["body"], wbits=31)
+    assert json.loads(decompressed) == rows(200)
+    assert threaded == [len(decompressed)]
+    assert len(decompressed) / len(body["body"]) > 10
+
+
+def decompressor(encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=31)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+async def test_streamed_chunks_are_flushed(app: FastAPI, encoding: str) -> None:
+    """ every chunk of a streamed response can be decoded as soon as it arrives.
+    """
+    start, *bodies = await call(app, "/stream", encoding)
+    stream = decompressor(encoding)
+    lines = []
+    for body in bodies:
+        lines += stream.decompress(body["body"]).decode().splitlines()
+        assert len(lines) % 10 == 0
+
+    assert dict(start["headers"])[b"content-encoding"] == encoding.encode()
+    assert b"content-length" not in dict(start["headers"])
+    assert [json.loads(line) for line in lines] == rows(30)
+    assert stream.eof
+
+
+@pytest.mark.asyncio
+async def test_zstd_preferred(app: FastAPI) -> None:
+    """ zstd is chosen when the client accepts both, as one complete frame.
+    """
+    start, body = await call(app, "/large", "gzip, zstd")
+
+    assert dict(start["headers"])[b"content-encoding"] == b"zstd"
+    assert json.loads(decompressor("zstd").decompress(body["body"])) == rows(200)
+
+
+@pytest.mark.asyncio
+async def test_metrics_not_compressed(monkeypatch: pytest.MonkeyPatch) -> None:
+    """ Prometheus scrapes of /metrics get the plain text exposition.
+    """
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/metrics", headers={"accept-encoding": "gzip, zstd"})
+
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+    assert len(response.content) > 1024
+
+
+@pytest.mark.asyncio
+async def test_batch_results_compress(monkeypatch: pytest.MonkeyPatch) -> None:
+    """ the /validate-ids results of a full batch compress more than 10x.
+    """
+    async def accept(key_store, api_key: str, count: int = 1) -> bool:
+        return True
+
+    monkeypatch.setattr(main, "validate_api_key", accept)
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    monkeypatch.setattr(main.app.state, "key_store", None)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/validate-ids", json={"national_ids": ["29001011234567"] * 1000},
+                                     headers={"x-api-key": "test", "accept-encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.content) / int(response.headers["content-length"]) > 10
+    assert len(response.json()["data"]) == 1000
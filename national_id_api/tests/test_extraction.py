@@ -0,0 +1,154 @@
+import asyncio
+import json
+from typing import AsyncGenerator
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from app import main
+from app.extraction import IDScanner, extract_ids, normalize
+
+VALID_ID: str = "29001011234567"
+INVALID_ID: str = "29002301234567"
+ARABIC_ID: str = VALID_ID.translate(str.maketrans("0123456789", "٠١٢٣٤٥٦٧٨٩"))
+
+
+def scan_in_chunks(text: bytes, size: int) -> list:
+    scanner = IDScanner()
+    matches = []
+    for position in range(0, len(text), size):
+        matches.extend(scanner.feed(text[position:position + size]))
+    return matches + scanner.finish()
+
+
+def test_extract_ids_offsets_and_results() -> None:
+    """ ASCII, Arabic-Indic and mixed IDs are found with their byte offsets,
+    runs longer or shorter than 14 digits are not candidates.
+    """
+    text = (f"name: Ali, id {VALID_ID}; old id {INVALID_ID}, "
+            f"phone 201001234567890123, ref 1234, arabic {ARABIC_ID[:7]}{VALID_ID[7:]}.").encode()
+
+    matches = list(extract_ids(text))
+
+    assert [match.national_id for match in matches] == [VALID_ID, INVALID_ID, VALID_ID]
+    assert [match.code for match in matches] == ["VALID_ID", "INVALID_ID", "VALID_ID"]
+    assert all(text[match.start:match.end].decode().translate(
+        str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")) == match.national_id for match in matches)
+    assert matches[0].to_dict()["data"]["year_of_birth"] == 1990
+    assert matches[1].to_dict()["data"]["is_valid"] is False
+    assert normalize(ARABIC_ID.encode()) == VALID_ID
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 15, 64])
+def test_matches_do_not_depend_on_chunking(size: int) -> None:
+    """ IDs split across chunks, and long runs cut between chunks, are handled
+    as in one piece.
+    """
+    text = (f"{VALID_ID} x{ARABIC_ID}x {'9' * 40} {INVALID_ID}\n{'٣' * 30} {VALID_ID}").encode()
+    expected = [(match.start, match.end, match.code) for match in extract_ids(text)]
+
+    chunked = [(match.start, match.end, match.code) for match in scan_in_chunks(text, size)]
+
+    assert len(expected) == 4
+    assert chunked == expected
+
+
+@pytest.mark.parametrize("size", [64, 4096, 65536])
+def test_skipped_arabic_run_across_chunks(size: int) -> None:
+    """ a run of Arabic-Indic digits spanning whole chunks stays one run up to
+    its end, the ASCII digits closing it are not reported as an ID.
+    """
+    text = f"x{'٣' * 65536}{VALID_ID} end {VALID_ID}".encode()
+    expected = [(match.start, match.end, match.code) for match in extract_ids(text)]
+
+    chunked = [(match.start, match.end, match.code) for match in scan_in_chunks(text, size)]
+
+    assert len(expected) == 1
+    assert chunked == expected
+
+
+@pytest_asyncio.fixture
+async def client(monkeypatch: pytest.MonkeyPatch) -> AsyncGenerator[tuple[httpx.AsyncClient, list[int]], None]:
+    """client of the app with the key check and the key store replaced by counters.
+
+    Yields:
+        tuple[httpx.AsyncClient, list[int]]: the client and the uses counted.
+    """
+    counted: list[int] = []
+
+    async def count_use(key_store, api_key: str, count: int = 1) -> bool:
+        counted.append(count)
+        return True
+
+    class Credits:
+        async def credit(self, api_key: str, count: int) -> None:
+            counted.append(count)
+
+    monkeypatch.setattr(main, "validate_api_key", count_use)
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    monkeypatch.setattr(main.app.state, "key_store", Credits())
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http_client:
+        yield http_client, counted
+
+
+@pytest.mark.asyncio
+async def test_extract_ids_endpoint(client: tuple[httpx.AsyncClient, list[int]],
+                                    monkeypatch: pytest.MonkeyPatch) -> None:
+    """ one NDJSON line per ID, each ID counts as a use, too large texts get 413.
+    """
+    http_client, counted = client
+    body = f"ids: {VALID_ID}, {ARABIC_ID} and {INVALID_ID}".encode()
+
+    response = await http_client.post("/extract-ids", content=body,
+                                      headers={"x-api-key": "test", "content-type": "text/plain"})
+    empty = await http_client.post("/extract-ids", content=b"no ids here", headers={"x-api-key": "test"})
+    monkeypatch.setattr(main.settings, "EXTRACT_MAX_BYTES", 8)
+    too_large = await http_client.post("/extract-ids", content=body, headers={"x-api-key": "test"})
+
+    async def chunked():
+        yield body
+
+    grew_too_large = await http_client.post("/extract-ids", content=chunked(), headers={"x-api-key": "test"})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [line["code"] for line in lines] == ["VALID_ID", "VALID_ID", "INVALID_ID"]
+    assert [line["national_id"] for line in lines] == [VALID_ID, VALID_ID, INVALID_ID]
+    assert body[lines[1]["start"]:lines[1]["end"]].decode() == ARABIC_ID
+    assert empty.text == ""
+    assert too_large.status_code == 413
+    assert too_large.json()["code"] == "PARSING_ERROR"
+    assert grew_too_large.status_code == 200
+    assert [json.loads(line)["code"] for line in grew_too_large.text.splitlines()] == ["PARSING_ERROR"]
+    assert counted == [1, 2, 1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_extract_ids_endpoint_streams(client: tuple[httpx.AsyncClient, list[int]]) -> None:
+    """ the IDs of the first chunk are sent before the rest of the body arrives.
+    """
+    first_sent = asyncio.Event()
+    requests = [{"type": "http.request", "body": f"{VALID_ID} ".encode(), "more_body": True},
+                {"type": "http.request", "body": f"{INVALID_ID}.".encode(), "more_body": False}]
+    bodies: list[bytes] = []
+
+    async def receive() -> dict:
+        if len(requests) == 1:
+            await first_sent.wait()
+        if requests:
+            return requests.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.body" and message.get("body"):
+            bodies.append(message["body"])
+            first_sent.set()
+
+    async with asyncio.timeout(5):
+        await main.app({"type": "http", "method": "POST", "path": "/extract-ids", "query_string": b"",
+                        "headers": [(b"x-api-key", b"test"), (b"content-type", b"text/plain")]},
+                       receive, send)
+
+    assert [json.loads(body)["national_id"] for body in bodies] == [VALID_ID, INVALID_ID]
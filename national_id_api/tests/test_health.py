@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import status
+
+from app import main
+from app.health import HealthMonitor
+from app.key_store import SQLiteKeyStore
+from app.settings import settings
+
+
+@pytest.fixture
+def sqlite_store(tmp_path: Path) -> SQLiteKeyStore:
+    """SQLite key store in a temporary directory, not initialized yet."""
+    return SQLiteKeyStore(str(tmp_path / "keys.db"), flush_seconds=60)
+
+
+@pytest.mark.asyncio
+async def test_probe_checks(sqlite_store: SQLiteKeyStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    """ a worker is ready only while serving with its database answering, free
+    pool connections and its usage writes keeping up.
+    """
+    health = HealthMonitor(max_usage_backlog=2)
+    await sqlite_store.initialize()
+    await health.start(sqlite_store)
+    try:
+        assert health.checks == {"database": True, "pool_headroom": True, "usage_flush": True}
+        assert not health.ready and health.readiness[0] == status.HTTP_503_SERVICE_UNAVAILABLE
+        health.set_serving(True)
+        assert health.ready and health.readiness[0] == status.HTTP_200_OK
+
+        await sqlite_store.seed(company_name="test", api_key="test")
+        await sqlite_store.use_key("test", count=3)
+        assert not await health.probe()
+        assert health.checks["usage_flush"] is False and health.usage_backlog == 3
+        await sqlite_store.flush()
+
+        health.min_pool_headroom = sqlite_store.db_manager.pool_headroom() + 1
+        assert not await health.probe()
+        assert health.checks["pool_headroom"] is False
+        health.min_pool_headroom = 1
+
+        async def unreachable() -> None:
+            raise ConnectionRefusedError("database down")
+
+        monkeypatch.setattr(sqlite_store.db_manager, "ping", unreachable)
+        assert not await health.probe()
+        assert health.checks["database"] is False
+        assert health.readiness[0] == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert health.live()
+    finally:
+        health.stop()
+        await sqlite_store.close()
+        await sqlite_store.db_manager.dispose()
+
+
+@pytest.mark.asyncio
+async def test_probe_endpoints_do_not_touch_the_database(sqlite_store: SQLiteKeyStore,
+                                                         monkeypatch: pytest.MonkeyPatch) -> None:
+    """ /healthz and /readyz answer from memory, not ready before startup and
+    while draining.
+    """
+    app = main.create_app(settings.model_copy(update={"HEALTH_PROBE_SECONDS": 60.0}), key_store=sqlite_store)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        before_startup = await client.get("/readyz")
+        async with main.lifespan(app):
+            pings = 0
+            ping = sqlite_store.db_manager.ping
+
+            async def counted_ping() -> None:
+                nonlocal pings
+                pings += 1
+                await ping()
+
+            monkeypatch.setattr(sqlite_store.db_manager, "ping", counted_ping)
+            responses = [await client.get(path) for path in ("/healthz", "/readyz") * 50]
+            app.state.health.set_serving(False)
+            draining = await client.get("/readyz")
+
+    assert before_startup.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert {response.status_code for response in responses} == {status.HTTP_200_OK}
+    assert responses[1].json()["checks"] == {"database": True, "pool_headroom": True, "usage_flush": True}
+    assert pings == 0
+    assert draining.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert draining.json()["serving"] is False
@@ -0,0 +1,69 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from app.national_id import NationalID
+from app.schema import InputID
+from benchmarks.id_generator import KINDS, encode_lines, generate, parse_mix
+
+TODAY: date = date.today()
+
+
+def test_generated_ids_match_their_labels() -> None:
+    """ every kind is validated the way its label says.
+    """
+    mix = {kind: 1 / len(KINDS) for kind in KINDS}
+    characters, kinds = generate(3000, np.random.default_rng(1), mix, TODAY)
+
+    assert set(kinds.tolist()) == set(range(len(KINDS)))
+    for row, kind_index in zip(characters, kinds):
+        id_number = row.tobytes().decode()
+        kind = KINDS[kind_index]
+        if kind == "non_digit":
+            assert not id_number.isdigit()
+            with pytest.raises(ValidationError):
+                InputID(national_id=id_number)
+            continue
+        assert NationalID(id_number=id_number).is_valid is (kind == "valid"), id_number
+
+
+def test_same_seed_same_output() -> None:
+    """ output is repeatable for a seed.
+    """
+    first = encode_lines(*generate(100, np.random.default_rng(7), today=TODAY))
+    second = encode_lines(*generate(100, np.random.default_rng(7), today=TODAY))
+    assert first == second
+    assert len(first.splitlines()) == 100
+    assert first.splitlines()[0][14:15] == b","
+
+
+def test_non_digit_never_parses_as_a_number() -> None:
+    """ no injected letter forms a numeric literal, e.g. an exponent.
+    """
+    characters, _ = generate(5000, np.random.default_rng(3), {"non_digit": 1.0}, TODAY)
+
+    assert not np.isin(characters, np.frombuffer(b"eE", dtype=np.uint8)).any()
+
+
+def test_no_future_year_left() -> None:
+    """ the last year of the century has no future year, only that kind fails.
+    """
+    with pytest.raises(ValueError):
+        generate(10, np.random.default_rng(1), {"future_year": 1.0}, date(2099, 1, 1))
+
+    _, kinds = generate(10, np.random.default_rng(1), {"valid": 1.0}, date(2099, 1, 1))
+    assert len(kinds) == 10
+
+
+def test_parse_mix() -> None:
+    """ fractions are normalized, unknown kinds rejected.
+    """
+    mix = parse_mix("valid=3,feb_30=1")
+    assert mix["valid"] == 0.75
+    assert mix["feb_30"] == 0.25
+    assert mix["non_digit"] == 0
+
+    with pytest.raises(ValueError):
+        parse_mix("valid=1,unknown=1")
@@ -0,0 +1,183 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncGenerator, Any
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, HTTPException, status
+
+from app import admin
+from app.api_keys import key_prefix
+from app.custom_exceptions import http_exception_handler
+from app.database_operations import validate_api_key
+from app.key_store import KeyStore, SQLiteKeyStore
+from app.settings import settings
+
+ADMIN_KEY: str = "admin-secret"
+
+
+@pytest.mark.asyncio
+async def test_create_rotate_revoke(key_store: KeyStore) -> None:
+    """ issued keys are stored hashed, rotation keeps the usage counts and
+    revoked keys stop working.
+
+    Args:
+        key_store (KeyStore): key store.
+    """
+    api_key = await key_store.create_key("Key Company")
+    try:
+        stored = await key_store.get(api_key)
+        assert stored.key_prefix == key_prefix(api_key) == api_key[:8]
+        assert api_key not in (stored.key_hash, stored.key_salt)
+        assert await validate_api_key(key_store, api_key, count=2)
+        assert not await key_store.exists(api_key[:-1] + "x")
+        assert await key_store.get(api_key[:-1] + "x") is None
+
+        rotated = await key_store.rotate_key(key_prefix(api_key))
+        await key_store.flush()
+        assert not await key_store.exists(api_key)
+        assert (await key_store.get(rotated)).usage_count == 2
+
+        assert await key_store.revoke_key(key_prefix(rotated))
+        assert not await key_store.revoke_key(key_prefix(rotated))
+        with pytest.raises(HTTPException) as code:
+            await validate_api_key(key_store, rotated)
+        assert code.value.status_code == status.HTTP_401_UNAUTHORIZED
+        # a fresh index, as on another worker, does not load revoked keys.
+        await key_store.load_keys()
+        assert not await key_store.exists(rotated)
+    finally:
+        await key_store.delete(api_key)
+        await key_store.delete(rotated)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_rotations(key_store: KeyStore) -> None:
+    """ of two rotations of a key, or a rotation and a revocation, only one
+    succeeds and the key left active is the one returned.
+    """
+    api_key = await key_store.create_key("Race Company")
+    issued = [api_key]
+    try:
+        rotations = await asyncio.gather(*(key_store.rotate_key(key_prefix(api_key)) for _ in range(2)))
+        issued += [key for key in rotations if key]
+        assert len(issued) == 2
+        assert await key_store.exists(issued[1])
+
+        rotated, revoked = await asyncio.gather(key_store.rotate_key(key_prefix(issued[1])),
+                                                key_store.revoke_key(key_prefix(issued[1])))
+        assert (rotated is None) == revoked
+        if rotated:
+            issued.append(rotated)
+            await key_store.load_keys()
+            assert await key_store.exists(rotated)
+    finally:
+        for key in issued:
+            await key_store.delete(key)
+
+
+@pytest.mark.asyncio
+async def test_unknown_keys_looked_up_once(key_store: KeyStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    """ a prefix the database does not have is remembered, repeated invalid
+    keys cost no query until it expires.
+    """
+    lookups = []
+    read = key_store.db_manager.read
+
+    async def counting_read(*args, **kwargs):
+        lookups.append(True)
+        return await read(*args, **kwargs)
+
+    monkeypatch.setattr(key_store.db_manager, "read", counting_read)
+    for _ in range(3):
+        assert not await key_store.exists("0badc0de.not-a-key")
+    assert len(lookups) == 1
+
+    key_store.keys.missing_seconds = 0
+    assert not await key_store.exists("0badc0de.not-a-key")
+    assert len(lookups) == 2
+
+
+@pytest_asyncio.fixture
+async def admin_client(tmp_path: Path) -> AsyncGenerator[httpx.AsyncClient, Any]:
+    """client of the admin router on an SQLite key store.
+
+    Yields:
+        httpx.AsyncClient: client sending the admin key.
+    """
+    key_store = SQLiteKeyStore(str(tmp_path / "keys.db"), flush_seconds=60)
+    await key_store.initialize()
+    app = FastAPI()
+    app.add_exception_handler(HTTPException, http_exception_handler)
+    app.include_router(admin.router)
+    app.state.settings = settings.model_copy(update={"ADMIN_API_KEY": ADMIN_KEY})
+    app.state.key_store = key_store
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test",
+                                 headers={"x-admin-key": ADMIN_KEY}) as client:
+        yield client
+    await key_store.close()
+
+
+@pytest.mark.asyncio
+async def test_admin_key_endpoints(admin_client: httpx.AsyncClient) -> None:
+    """ keys are managed by prefix, the key itself is only shown when issued.
+    """
+    created = await admin_client.post("/admin/keys", json={"company_name": "Admin Company"})
+    prefix = created.json()["key_prefix"]
+    rotated = await admin_client.post(f"/admin/keys/{prefix}/rotate")
+    revoked = await admin_client.delete(f"/admin/keys/{rotated.json()['key_prefix']}")
+    missing = await admin_client.delete(f"/admin/keys/{prefix}")
+    anonymous = await admin_client.post("/admin/keys", json={"company_name": "x"},
+                                        headers={"x-admin-key": "wrong"})
+
+    assert created.status_code == status.HTTP_201_CREATED
+    assert created.json()["api_key"].startswith(prefix + ".")
+    assert rotated.json()["company_name"] == "Admin Company"
+    assert rotated.json()["key_prefix"] != prefix
+    assert revoked.json() == {"key_prefix": rotated.json()["key_prefix"], "revoked": True}
+    assert missing.status_code == status.HTTP_404_NOT_FOUND
+    assert missing.json()["code"] == "NOT_FOUND"
+    assert anonymous.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_admin_key_of_each_app() -> None:
+    """ the admin key is checked against the settings the app was built with,
+    not the process settings.
+    """
+    from app import main
+
+    statuses = []
+    for admin_key in ("first-admin-key", "second-admin-key"):
+        app = main.create_app(settings.model_copy(update={"ADMIN_API_KEY": admin_key}))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/admin/traces", headers={"x-admin-key": "first-admin-key"})
+        statuses.append(response.status_code)
+
+    assert statuses == [status.HTTP_200_OK, status.HTTP_401_UNAUTHORIZED]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("headers", [{}, {"x-api-key": ""}], ids=["missing", "empty"])
+async def test_missing_api_key_unauthorized(key_store: KeyStore, headers: dict[str, str],
+                                            monkeypatch: pytest.MonkeyPatch) -> None:
+    """ requests without a key, or with an empty one, are answered 401 by every
+    endpoint counting uses.
+    """
+    from app import main
+
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    app = main.create_app(settings.model_copy(update={"RATE_LIMIT_ENABLED": False}), key_store=key_store)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as client:
+        responses = [
+            await client.post("/validate-id", json={"national_id": "29001011234567"}),
+            await client.post("/validate-ids", json={"national_ids": ["29001011234567"]}),
+            await client.post("/extract-ids", content=b"id 29001011234567"),
+        ]
+
+    assert [response.status_code for response in responses] == [status.HTTP_401_UNAUTHORIZED] * 3
+    assert all(response.json()["code"] == "UNAUTHORIZED" for response in responses)
@@ -0,0 +1,90 @@
+import json
+import logging
+import queue
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.logging_config import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    RequestIdFilter,
+    RequestIdMiddleware,
+    SamplingFilter,
+    request_id_var,
+)
+
+SAMPLED_MESSAGE: str = "Validation completed. Result: %s"
+
+
+def make_record(msg: str, level: int = logging.INFO, *args) -> logging.LogRecord:
+    """log record as the logging module would create it.
+
+    Args:
+        msg (str): message template.
+        level (int): log level.
+
+    Returns:
+        logging.LogRecord: record.
+    """
+    return logging.LogRecord("test", level, __file__, 1, msg, args or None, None)
+
+
+def test_sampling_filter() -> None:
+    """ sampled message types are dropped, warnings and others are kept.
+    """
+    sampling = SamplingFilter({SAMPLED_MESSAGE: 0.0})
+    assert sampling.filter(make_record(SAMPLED_MESSAGE, logging.INFO, "Valid")) is False
+    assert sampling.filter(make_record(SAMPLED_MESSAGE, logging.WARNING, "Valid")) is True
+    assert sampling.filter(make_record("other message")) is True
+
+
+def test_queue_handler_drops_when_full() -> None:
+    """ a full queue never blocks the caller.
+    """
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record("first %s", logging.INFO, 1))
+    handler.handle(make_record("second"))
+
+    record = handler.queue.get_nowait()
+    assert record.msg == "first 1"
+    assert record.args is None
+    assert handler.queue.empty()
+
+
+def test_json_formatter_with_request_id() -> None:
+    """ structured output carries the request id of the context.
+    """
+    token = request_id_var.set("abc123")
+    try:
+        record = make_record("hello %s", logging.INFO, "world")
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello world"
+    assert entry["request_id"] == "abc123"
+    assert entry["level"] == "INFO"
+
+
+@pytest.mark.asyncio
+async def test_request_id_middleware() -> None:
+    """ the id is taken from the request or generated, and echoed back.
+    """
+    app = FastAPI()
+
+    @app.get("/id")
+    async def current_id():
+        return {"request_id": request_id_var.get()}
+
+    app.add_middleware(RequestIdMiddleware)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        given = await client.get("/id", headers={"X-Request-ID": "req-1"})
+        generated = await client.get("/id")
+
+    assert given.json()["request_id"] == "req-1"
+    assert given.headers["x-request-id"] == "req-1"
+    assert generated.headers["x-request-id"] == generated.json()["request_id"]
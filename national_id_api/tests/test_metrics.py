@@ -0,0 +1,61 @@
+import httpx
+import pytest
+from fastapi import status
+from prometheus_client import REGISTRY
+
+from app import metrics
+from app.main import app
+from app.response_codes import ErrorCodeEnum
+
+
+def sample(name: str, labels: dict[str, str]) -> float:
+    """current value of one sample of the default registry.
+
+    Args:
+        name (str): sample name.
+        labels (dict[str, str]): sample labels.
+
+    Returns:
+        float: value, `0` if it was never recorded.
+    """
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_count_response() -> None:
+    """ every response code has its own counter.
+    """
+    code = ErrorCodeEnum.UNAUTHORIZED.value
+    metrics.flush_buffers()
+    before = sample("national_id_responses_total", {"code": code})
+    metrics.count_response(code)
+    metrics.flush_buffers()
+    assert sample("national_id_responses_total",
+                  {"code": code}) == before + 1
+
+
+def test_stage_histogram() -> None:
+    """ buffered stage observations land in the right bucket on flush.
+    """
+    labels = {"stage": "validation"}
+    before = sample("national_id_validate_id_stage_seconds_count", labels)
+    metrics.STAGE_VALIDATION.observe(0.0001)
+    metrics.flush_buffers()
+    assert sample("national_id_validate_id_stage_seconds_count",
+                  labels) == before + 1
+    assert sample("national_id_validate_id_stage_seconds_bucket",
+                  {**labels, "le": "0.0001"}) >= 1
+    assert sample("national_id_validate_id_stage_seconds_bucket",
+                  {**labels, "le": "5e-05"}) == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint() -> None:
+    """ the scrape endpoint serves the Prometheus text format.
+    """
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "national_id_validate_id_stage_seconds" in response.text
+    assert "national_id_responses_total" in response.text
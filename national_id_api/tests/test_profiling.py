@@ -0,0 +1,76 @@
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.profiling import ProfilingMiddleware, write_profile
+
+ADMIN_KEY: str = "admin-secret"
+
+
+def busy_validation(seconds: float) -> None:
+    """burn CPU on the loop thread.
+
+    Args:
+        seconds (float): how long.
+    """
+    ends_at = time.perf_counter() + seconds
+    while time.perf_counter() < ends_at:
+        pass
+
+
+def build_app(output_dir: Path) -> FastAPI:
+    """app with one endpoint that waits and then works.
+
+    Args:
+        output_dir (Path): profile directory.
+
+    Returns:
+        FastAPI: app wrapped with the profiling middleware.
+    """
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        await asyncio.sleep(0.05)
+        busy_validation(0.05)
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware, admin_key=ADMIN_KEY,
+                       output_dir=str(output_dir), interval=0.001)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_profile_by_admin_header(tmp_path: Path) -> None:
+    """ the profile has awaited and on-CPU stacks of the request.
+    """
+    transport = httpx.ASGITransport(app=build_app(tmp_path))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        plain = await client.get("/work")
+        wrong_key = await client.get("/work", headers={"X-Profile-Request": "guess"})
+        profiled = await client.get("/work", headers={"X-Profile-Request": ADMIN_KEY})
+
+    assert "x-profile-id" not in plain.headers
+    assert "x-profile-id" not in wrong_key.headers
+    profile = tmp_path / f"{profiled.headers['x-profile-id']}.collapsed"
+    assert list(tmp_path.iterdir()) == [profile]
+
+    stacks = profile.read_text().splitlines()
+    assert any(stack.rsplit(" ", 1)[0].endswith("[awaiting]") for stack in stacks)
+    assert any("busy_validation" in stack for stack in stacks)
+
+
+def test_write_profile_rotation(tmp_path: Path) -> None:
+    """ only the newest profiles are kept.
+    """
+    for index in range(5):
+        write_profile(tmp_path, f"profile-{index}", {"a;b": index + 1}, max_files=3)
+        time.sleep(0.01)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "profile-2.collapsed", "profile-3.collapsed", "profile-4.collapsed"]
+    assert (tmp_path / "profile-4.collapsed").read_text() == "a;b 5\n"
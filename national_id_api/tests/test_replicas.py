@@ -0,0 +1,91 @@
+from pathlib import Path
+from typing import AsyncGenerator, Any
+
+import pytest
+import pytest_asyncio
+import sqlalchemy as sa
+
+from app.database_settings import DatabaseManager
+
+
+async def _create_marker(database_url: str, name: str) -> None:
+    """ create a database file holding its own name.
+    """
+    db = DatabaseManager(database_url)
+    db.initialize()
+    async with db.session() as session:
+        await session.execute(sa.text("CREATE TABLE marker (name TEXT)"))
+        await session.execute(sa.text("INSERT INTO marker VALUES (:name)"), {"name": name})
+        await session.commit()
+    await db.dispose()
+
+
+async def _read_marker(db: DatabaseManager) -> str:
+    return (await db.read(sa.text("SELECT name FROM marker"))).scalar()
+
+
+@pytest_asyncio.fixture
+async def replicated_db(tmp_path: Path) -> AsyncGenerator[DatabaseManager, Any]:
+    """primary with two healthy replicas and one in a missing directory.
+
+    Yields:
+        DatabaseManager: initialized database manager.
+    """
+    urls = {name: f"sqlite+aiosqlite:///{tmp_path / name}.db" for name in ("primary", "one", "two")}
+    for name, url in urls.items():
+        await _create_marker(url, name)
+    db = DatabaseManager(
+        urls["primary"],
+        replica_urls=[urls["one"], urls["two"], f"sqlite+aiosqlite:///{tmp_path}/missing/down.db"],
+        health_check_seconds=1,
+    )
+    db.initialize()
+    yield db
+    await db.dispose()
+
+
+@pytest.mark.asyncio
+async def test_reads_balance_over_healthy_replicas(replicated_db: DatabaseManager) -> None:
+    """ a failed health check takes a replica out, reads alternate between the others
+    and writes stay on the primary.
+    """
+    await replicated_db.check_replicas()
+    reads = [await _read_marker(replicated_db) for _ in range(4)]
+    async with replicated_db.session() as session:
+        written = (await session.execute(sa.text("SELECT name FROM marker"))).scalar()
+
+    assert replicated_db.replica_health() == {"replica-0": True, "replica-1": True, "replica-2": False}
+    assert sorted(reads) == ["one", "one", "two", "two"]
+    assert written == "primary"
+
+
+@pytest.mark.asyncio
+async def test_reads_fall_back_to_primary(replicated_db: DatabaseManager) -> None:
+    """ a replica that cannot be reached is taken out at once and the read is
+    answered by the primary, with no replica left reads go to the primary until a
+    health check succeeds.
+    """
+    for replica in replicated_db._replicas[:2]:
+        replica.healthy = False
+    assert await _read_marker(replicated_db) == "primary"
+
+    assert replicated_db.replica_health()["replica-2"] is False
+    assert await _read_marker(replicated_db) == "primary"
+
+    await replicated_db.check_replicas()
+    assert await _read_marker(replicated_db) in ("one", "two")
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_read_served_by_primary(tmp_path: Path) -> None:
+    """ the read that finds a replica down is answered by the primary, not failed.
+    """
+    primary = f"sqlite+aiosqlite:///{tmp_path / 'primary'}.db"
+    await _create_marker(primary, "primary")
+    db = DatabaseManager(primary, replica_urls=["postgresql+asyncpg://nobody@127.0.0.1:1/down"])
+    db.initialize()
+    try:
+        assert await _read_marker(db) == "primary"
+        assert db.replica_health() == {"replica-0": False}
+    finally:
+        await db.dispose()
@@ -0,0 +1,79 @@
+import asyncio
+import signal
+from pathlib import Path
+
+import pytest
+import uvicorn
+
+from app import main
+from app.key_store import SQLiteKeyStore
+from app.serve import DrainingServer, worker_pool
+from app.settings import settings
+
+
+def test_worker_pool() -> None:
+    """ SERVER_DB_CONNECTIONS is split between the workers, the configured pool
+    is kept when it is unset.
+    """
+    assert worker_pool(settings.model_copy(update={"SERVER_DB_CONNECTIONS": None}), 4) == (
+        settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW)
+    budget = settings.model_copy(update={"SERVER_DB_CONNECTIONS": 40, "DATABASE_POOL_SIZE": 5})
+    assert worker_pool(budget, 4) == (5, 5)
+    assert worker_pool(budget, 16) == (2, 0)
+    assert worker_pool(budget, 64) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_preloaded_keys_kept(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """ the snapshot loaded before the fork is not loaded again by each worker,
+    and no connection is left open to be inherited.
+    """
+    path = str(tmp_path / "keys.db")
+    seeding = SQLiteKeyStore(path)
+    await seeding.initialize()
+    await seeding.seed(company_name="test", api_key="test")
+    await seeding.close()
+    await seeding.db_manager.dispose()
+
+    key_store = SQLiteKeyStore(path, flush_seconds=60)
+    await key_store.preload()
+    assert key_store.preloaded and len(key_store.keys) == 1
+    assert key_store.db_manager.pool_status() == {}
+
+    loads = []
+
+    async def load_keys() -> None:
+        loads.append(True)
+
+    monkeypatch.setattr(key_store, "load_keys", load_keys)
+    await key_store.initialize()
+    try:
+        assert loads == []
+        assert await key_store.use_key("test") == "test"
+    finally:
+        await key_store.close()
+        await key_store.db_manager.dispose()
+
+
+@pytest.mark.asyncio
+async def test_draining_server() -> None:
+    """ SIGTERM turns the worker not ready and stops it after the drain time,
+    SIGINT during the drain stops it right away.
+    """
+    app = main.create_app()
+    health = app.state.health
+    server = DrainingServer(uvicorn.Config(app, log_config=None), drain_seconds=0.05)
+    health.set_serving(True)
+
+    server.handle_exit(signal.SIGTERM, None)
+    assert not health.serving and health.readiness[0] == 503
+    server.handle_exit(signal.SIGTERM, None)
+    assert not await server.on_tick(1)
+    await asyncio.sleep(0.06)
+    assert await server.on_tick(1)
+
+    server = DrainingServer(uvicorn.Config(app, log_config=None), drain_seconds=60)
+    server.handle_exit(signal.SIGTERM, None)
+    server.handle_exit(signal.SIGINT, None)
+    assert await server.on_tick(1)
+    assert server._captured_signals == []
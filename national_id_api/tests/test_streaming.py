@@ -0,0 +1,137 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import streaming
+from app.api_keys import key_prefix
+from app.key_store import KeyStore
+from app.settings import settings
+
+API_KEY: str = "stream-key"
+VALID_ID: str = "29001011234567"
+INVALID_ID: str = "29002301234567"
+
+
+class FakeKeyStore(KeyStore):
+    """ one key and its credited uses kept in memory.
+    """
+
+    def __init__(self):
+        self.credited: list[int] = []
+
+    async def exists(self, api_key: str) -> bool:
+        return api_key == API_KEY
+
+    async def use_key(self, api_key: str, count: int = 1) -> str | None:
+        return "Stream" if await self.exists(api_key) else None
+
+    async def credit(self, api_key: str, count: int) -> None:
+        assert api_key == API_KEY
+        self.credited.append(count)
+
+
+@pytest.fixture
+def database() -> FakeKeyStore:
+    """the store the endpoint uses.
+
+    Returns:
+        FakeKeyStore: the store.
+    """
+    return FakeKeyStore()
+
+
+class AuditRecords(list):
+    """ stands in for the `AuditLog` buffer.
+    """
+
+    def record(self, record: tuple) -> None:
+        self.append(record)
+
+
+def build_client(database: FakeKeyStore, audit_log: AuditRecords | None = None) -> TestClient:
+    app = FastAPI()
+    app.include_router(streaming.router)
+    # small limits so batching and oversized frames are easy to hit.
+    app.state.settings = settings.model_copy(update={"WS_USAGE_FLUSH_COUNT": 3, "WS_MAX_BATCH": 4})
+    app.state.key_store = database
+    app.state.audit_log = audit_log
+    return TestClient(app)
+
+
+def test_stream_json_and_binary_frames(database: FakeKeyStore) -> None:
+    """ JSON and binary frames are answered in order with their correlation
+    ids and usage is credited in batches.
+    """
+    with build_client(database).websocket_connect("/ws/validate-id", headers={"X-API-Key": API_KEY}) as websocket:
+        assert websocket.receive_json() == {"type": "ready", "window": settings.WS_WINDOW, "max_batch": 4}
+        websocket.send_json({"id": 1, "national_id": VALID_ID})
+        websocket.send_json([{"id": 2, "national_id": INVALID_ID},
+                             {"id": 3, "national_id": "2900101123456x"}])
+        websocket.send_bytes(streaming.BINARY_REQUEST.pack(4, VALID_ID.encode())
+                             + streaming.BINARY_REQUEST.pack(5, b"12345"))
+
+        single = websocket.receive_json()
+        batch = websocket.receive_json()
+        binary = websocket.receive_bytes()
+
+    assert single["id"] == 1 and single["code"] == "VALID_ID"
+    assert single["data"]["governorate_name"] == "Dakahlia"
+    assert [(result["id"], result["code"]) for result in batch] == [(2, "INVALID_ID"), (3, "PARSING_ERROR")]
+    assert list(streaming.BINARY_RESULT.iter_unpack(binary)) == [
+        (4, 0, 1990, 1, 1, 12, 2),
+        (5, 2, 0, 0, 0, 0, 0),
+    ]
+    assert database.credited == [3, 2]
+
+
+def test_stream_rejects_unknown_key(database: FakeKeyStore) -> None:
+    """ the handshake fails without a valid key.
+    """
+    with pytest.raises(WebSocketDisconnect) as disconnect:
+        with build_client(database).websocket_connect("/ws/validate-id?api_key=guess"):
+            pass
+    assert disconnect.value.code == 1008
+
+
+def test_stream_frames_audited(database: FakeKeyStore) -> None:
+    """ each answered frame, and a refused connection, leaves one audit record
+    with the key's prefix.
+    """
+    audit_log = AuditRecords()
+    with build_client(database, audit_log).websocket_connect(
+            "/ws/validate-id", headers={"X-API-Key": API_KEY}) as websocket:
+        websocket.receive_json()
+        websocket.send_json({"id": 1, "national_id": INVALID_ID})
+        websocket.receive_json()
+        websocket.send_json([{"id": 2, "national_id": VALID_ID}, {"id": 3, "national_id": VALID_ID}])
+        websocket.receive_json()
+        websocket.send_bytes(streaming.BINARY_REQUEST.pack(4, VALID_ID.encode())
+                             + streaming.BINARY_REQUEST.pack(5, INVALID_ID.encode()))
+        websocket.receive_bytes()
+    with pytest.raises(WebSocketDisconnect):
+        with build_client(database, audit_log).websocket_connect("/ws/validate-id?api_key=guess"):
+            pass
+
+    assert [(prefix, endpoint, code) for _, prefix, endpoint, code, _ in audit_log] == [
+        (key_prefix(API_KEY), "/ws/validate-id", "INVALID_ID"),
+        (key_prefix(API_KEY), "/ws/validate-id", "VALID_ID"),
+        (key_prefix(API_KEY), "/ws/validate-id", "INVALID_ID"),
+        (key_prefix("guess"), "/ws/validate-id", "UNAUTHORIZED"),
+    ]
+    assert API_KEY not in repr(audit_log)
+
+
+def test_stream_closes_on_oversized_frame(database: FakeKeyStore) -> None:
+    """ frames above `max_batch` close the connection, answered IDs are still credited.
+    """
+    with build_client(database).websocket_connect(f"/ws/validate-id?api_key={API_KEY}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"id": 1, "national_id": VALID_ID})
+        websocket.receive_json()
+        websocket.send_json([{"id": i, "national_id": VALID_ID} for i in range(5)])
+        with pytest.raises(WebSocketDisconnect) as disconnect:
+            websocket.receive_json()
+
+    assert disconnect.value.code == 1009
+    assert database.credited == [1]
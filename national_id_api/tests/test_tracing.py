@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+
+import httpx
+import pytest
+import sqlalchemy as sa
+from fastapi import FastAPI
+
+from app import tracing
+from app.admin import router as admin_router
+from app.settings import settings
+
+ADMIN_KEY: str = "admin-secret"
+PARENT_TRACE_ID: str = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_SPAN_ID: str = "00f067aa0ba902b7"
+
+
+def build_app() -> FastAPI:
+    """app with one traced endpoint running a SQL statement.
+
+    Returns:
+        FastAPI: app wrapped with the tracing middleware.
+    """
+    app = FastAPI()
+    engine = sa.create_engine("sqlite://")
+    tracing.instrument_engine(engine)
+
+    @app.get("/work")
+    async def work():
+        with tracing.span("work.query"):
+            with engine.connect() as connection:
+                connection.execute(sa.text("SELECT 1"))
+        with tracing.span("work.wait"):
+            await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    app.include_router(admin_router)
+    app.state.settings = settings.model_copy(update={"ADMIN_API_KEY": ADMIN_KEY})
+    app.add_middleware(tracing.TracingMiddleware, exempt_paths=("/admin/traces",))
+    return app
+
+
+@pytest.mark.asyncio
+async def test_traceparent_request_is_traced(monkeypatch: pytest.MonkeyPatch) -> None:
+    """ a sampled traceparent continues the caller's trace, spans nest and the
+    admin endpoint returns them as OTLP/JSON.
+    """
+    monkeypatch.setattr(tracing, "STORE", tracing.SpanStore(capacity=100))
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get("/work")
+        await client.get("/work", headers={"traceparent": f"00-{PARENT_TRACE_ID}-{PARENT_SPAN_ID}-00"})
+        await client.get("/work", headers={"traceparent": f"00-{PARENT_TRACE_ID}-{PARENT_SPAN_ID}-01"})
+        unauthorized = await client.get("/admin/traces")
+        traces = await client.get("/admin/traces", headers={"X-Admin-Key": ADMIN_KEY},
+                                  params={"min_duration_ms": 5})
+
+    assert unauthorized.status_code == 401
+    spans = {span["name"]: span
+             for span in traces.json()["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert set(spans) == {"GET /work", "work.query", "db.statement", "work.wait"}
+    assert {span["traceId"] for span in spans.values()} == {PARENT_TRACE_ID}
+    root = spans["GET /work"]
+    assert root["parentSpanId"] == PARENT_SPAN_ID
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root["attributes"]
+    assert spans["work.query"]["parentSpanId"] == root["spanId"]
+    assert spans["db.statement"]["parentSpanId"] == spans["work.query"]["spanId"]
+    assert spans["work.wait"]["parentSpanId"] == root["spanId"]
+
+
+@pytest.mark.asyncio
+async def test_span_is_noop_without_trace() -> None:
+    """ outside a traced request nothing is recorded.
+    """
+    store = tracing.STORE
+    recorded = len(store.spans)
+    with tracing.span("untraced") as current:
+        assert current is None
+    assert len(store.spans) == recorded
+
+
+def test_failed_span_has_error_status(monkeypatch: pytest.MonkeyPatch) -> None:
+    """ exceptions mark the span as failed and are not swallowed.
+    """
+    monkeypatch.setattr(tracing, "STORE", tracing.SpanStore(capacity=10))
+    token = tracing._current_trace.set(tracing._Trace(trace_id=PARENT_TRACE_ID))
+    try:
+        with pytest.raises(ValueError):
+            with tracing.span("failing"):
+                raise ValueError("boom")
+    finally:
+        tracing._current_trace.reset(token)
+
+    [span] = tracing.STORE.spans
+    assert span.status_code == tracing.STATUS_ERROR
+    assert span.status_message == "ValueError: boom"
+
+
+def test_export_stopped_on_reconfigure(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """ configuring again writes the queued traces and stops the previous
+    exporter, spans not ended yet are not exported.
+    """
+    monkeypatch.setattr(tracing, "STORE", tracing.SpanStore(capacity=10))
+    export_path = tmp_path / "traces.jsonl"
+
+    def exporters() -> int:
+        return sum(thread.name == "span-exporter" for thread in threading.enumerate())
+
+    running = exporters()
+    for _ in range(3):
+        store = tracing.configure(capacity=10, export_path=str(export_path))
+        finished = tracing.Span(trace_id=PARENT_TRACE_ID, span_id="1" * 16, parent_span_id=None,
+                                name="finished", start_time_unix_nano=1, end_time_unix_nano=2)
+        unfinished = tracing.Span(trace_id=PARENT_TRACE_ID, span_id="2" * 16, parent_span_id=None,
+                                  name="unfinished", start_time_unix_nano=1)
+        store.export_trace([finished, unfinished])
+    assert exporters() == running + 1
+    tracing.stop_tracing()
+
+    assert exporters() == running
+    lines = [json.loads(line) for line in export_path.read_text().splitlines()]
+    assert len(lines) == 3
+    assert all([span["name"] for span in line["resourceSpans"][0]["scopeSpans"][0]["spans"]] == ["finished"]
+               for line in lines)
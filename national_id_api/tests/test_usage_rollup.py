@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator, Any
+
+import pytest
+import pytest_asyncio
+import sqlalchemy as sa
+
+from app import usage_rollup
+from app.database_operations import validate_api_key
+from app.key_store import KeyStore
+from app.models import APIKeyUsage
+from app.usage_rollup import HOURLY_TABLE, hour_of, usage_report
+from tests.db_helper import API_KEY
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def empty_rollup(key_store: KeyStore, temp_api_key: APIKeyUsage) -> AsyncGenerator[None, Any]:
+    """remove the test company's rollup rows and cached reports around each test.
+    """
+    async def clear() -> None:
+        usage_rollup._REPORT_CACHE.clear()
+        async with key_store.db_manager.session() as session:
+            await session.execute(
+                sa.delete(HOURLY_TABLE).where(HOURLY_TABLE.c.company_name == temp_api_key.company_name))
+            await session.commit()
+
+    await clear()
+    yield
+    await clear()
+
+
+@pytest.mark.asyncio
+async def test_uses_are_rolled_up_per_hour(key_store: KeyStore, temp_api_key: APIKeyUsage) -> None:
+    """ counted uses reach the hourly rollup once the key store flushes.
+
+    Args:
+        key_store (KeyStore): key store.
+        temp_api_key (APIKeyUsage): DI object for test case.
+    """
+    await validate_api_key(key_store, API_KEY)
+    await validate_api_key(key_store, API_KEY, count=2)
+    await key_store.credit(API_KEY, 3)
+    await key_store.flush()
+
+    now = datetime.now(timezone.utc)
+    report = await usage_report(key_store.db_manager, temp_api_key.company_name,
+                                now, now + timedelta(hours=1))
+
+    assert report["total"] == 6
+    assert report["hours"] == [{"hour": hour_of(now).isoformat(), "usage_count": 6}]
+
+
+@pytest.mark.asyncio
+async def test_closed_periods_are_cached(key_store: KeyStore, temp_api_key: APIKeyUsage) -> None:
+    """ reports of closed periods are cached, the open hour is always read.
+
+    Args:
+        key_store (KeyStore): key store.
+        temp_api_key (APIKeyUsage): DI object for test case.
+    """
+    company_name = temp_api_key.company_name
+    last_week = hour_of(datetime.now(timezone.utc) - timedelta(days=7))
+    key_store.rollup.add(company_name, 4, at=last_week)
+    key_store.rollup.add(company_name, 1, at=last_week + timedelta(hours=2))
+    await key_store.flush()
+
+    first = await usage_report(key_store.db_manager, company_name, last_week, last_week + timedelta(days=1))
+    key_store.rollup.add(company_name, 10, at=last_week)
+    await key_store.flush()
+    cached = await usage_report(key_store.db_manager, company_name, last_week, last_week + timedelta(days=1))
+
+    assert [row["usage_count"] for row in first["hours"]] == [4, 1]
+    assert cached is first
@@ -0,0 +1,85 @@
+from typing import AsyncGenerator
+
+import httpx
+import msgpack
+import pytest
+import pytest_asyncio
+from fastapi import status
+
+from app import main, wire
+
+VALID_ID: int = 29001011234567
+INVALID_ID: str = "29002301234567"
+MSGPACK_HEADERS: dict[str, str] = {
+    "content-type": "application/msgpack",
+    "accept": "application/msgpack",
+    "x-api-key": "test",
+}
+
+
+@pytest_asyncio.fixture
+async def client(monkeypatch: pytest.MonkeyPatch) -> AsyncGenerator[tuple[httpx.AsyncClient, list[int]], None]:
+    """client of the app with the key check replaced by a counter.
+
+    Yields:
+        tuple[httpx.AsyncClient, list[int]]: the client and the uses credited per request.
+    """
+    credited: list[int] = []
+
+    async def count_use(key_store, api_key: str, count: int = 1) -> bool:
+        credited.append(count)
+        return True
+
+    monkeypatch.setattr(main, "validate_api_key", count_use)
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    monkeypatch.setattr(main.app.state, "key_store", None)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http_client:
+        yield http_client, credited
+
+
+@pytest.mark.asyncio
+async def test_msgpack_single(client: tuple[httpx.AsyncClient, list[int]]) -> None:
+    """ MessagePack in and out gives the positional result, JSON stays the default.
+    """
+    http_client, credited = client
+    packed = await http_client.post("/validate-id", content=msgpack.packb(VALID_ID),
+                                    headers=MSGPACK_HEADERS)
+    plain = await http_client.post("/validate-id", json={"national_id": VALID_ID},
+                                   headers={"x-api-key": "test"})
+
+    assert packed.headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(packed.content) == [0, 1990, 1, 1, 12, 2, 2]
+    assert plain.json()["code"] == "VALID_ID"
+    assert plain.json()["data"]["governorate_name"] == "Dakahlia"
+    assert credited == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_msgpack_batch(client: tuple[httpx.AsyncClient, list[int]]) -> None:
+    """ every ID of a batch gets its own result and counts as one use.
+    """
+    http_client, credited = client
+    response = await http_client.post("/validate-ids", content=msgpack.packb([VALID_ID, INVALID_ID, "12"]),
+                                      headers=MSGPACK_HEADERS)
+    as_json = await http_client.post("/validate-ids", json={"national_ids": [INVALID_ID]},
+                                     headers={"x-api-key": "test"})
+
+    rows = msgpack.unpackb(response.content)
+    assert [row[0] for row in rows] == [0, 1, 2]
+    assert [wire.CODES[row[0]] for row in rows] == ["VALID_ID", "INVALID_ID", "PARSING_ERROR"]
+    assert rows[2] == [2, None, None, None, None, None, None]
+    assert as_json.json()["code"] == "INVALID_ID"
+    assert [result["code"] for result in as_json.json()["data"]] == ["INVALID_ID"]
+    assert credited == [3, 1]
+
+
+@pytest.mark.asyncio
+async def test_msgpack_malformed_body(client: tuple[httpx.AsyncClient, list[int]]) -> None:
+    """ undecodable bodies get a positional PARSING_ERROR.
+    """
+    http_client, _ = client
+    response = await http_client.post("/validate-id", content=b"\xc1", headers=MSGPACK_HEADERS)
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert msgpack.unpackb(response.content)[0] == wire.CODE_INDEX["PARSING_ERROR"]